@@ -0,0 +1,176 @@
+"""
+响应压缩 - 按 Accept-Encoding 协商 brotli / gzip
+
+JSON 分析结果和嵌在 JSON 中的 HTML 报告压缩率很高（通常 5~10 倍）。
+CompressionMiddleware 是纯 ASGI 中间件：
+- 客户端接受 br 且安装了 brotli 时优先使用 brotli，否则使用 gzip
+- 小于 minimum_size 的响应、已编码的响应与 SSE（text/event-stream）不压缩
+- 一次性发送的大响应在线程中压缩，不阻塞事件循环；分块发送的响应逐块流式压缩
+"""
+import asyncio
+import gzip
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时只提供 gzip
+    brotli = None
+
+# 超过该大小的一次性响应在线程中压缩
+THREAD_COMPRESS_BYTES = 256 * 1024
+
+# 不压缩的内容类型（SSE 需要逐条立即送达）
+SKIP_CONTENT_TYPES = ('text/event-stream',)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """根据 Accept-Encoding 选择编码（br 优先），都不接受时返回 None"""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    wildcard = accepted.get('*', 0.0)
+    if brotli is not None and accepted.get('br', wildcard) > 0:
+        return 'br'
+    if accepted.get('gzip', wildcard) > 0:
+        return 'gzip'
+    return None
+
+
+class _StreamCompressor:
+    """分块响应的流式压缩器"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+            self._compress = self._compressor.process
+            self._finish = self._compressor.finish
+        else:
+            # wbits=31：带 gzip 头和尾
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self._compress = self._compressor.compress
+            self._finish = self._compressor.flush
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data)
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+class CompressionMiddleware:
+    """
+    ASGI 中间件：压缩响应体
+
+    用法:
+        app.add_middleware(CompressionMiddleware, minimum_size=1024, gzip_level=5, brotli_quality=4)
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 5, brotli_quality: int = 4):
+        """
+        Args:
+            minimum_size: 小于该字节数的响应不压缩
+            gzip_level: gzip 压缩级别（1~9，越高越慢）
+            brotli_quality: brotli 压缩质量（0~11，越高越慢；4 左右速度与 gzip 相当、体积更小）
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSender(self, encoding, send).send)
+
+    def compress(self, encoding: str, body: bytes) -> bytes:
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+
+class _CompressingSender:
+    """包装单个响应的 send：缓存响应头，收到第一块响应体后决定是否压缩"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self.start_message = None
+        self.passthrough = False
+        self.stream: Optional[_StreamCompressor] = None
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.start_message = message
+            headers = Headers(raw=message['headers'])
+            content_type = headers.get('content-type', '')
+            self.passthrough = (
+                'content-encoding' in headers
+                or content_type.startswith(SKIP_CONTENT_TYPES)
+                or message['status'] < 200
+                or message['status'] in (204, 304)
+            )
+            if self.passthrough:
+                await self._send(message)
+            return
+        if message['type'] != 'http.response.body' or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.stream is not None:
+            # 已开始流式压缩
+            chunk = self.stream.compress(body)
+            if not more_body:
+                chunk += self.stream.finish()
+            if chunk or not more_body:
+                await self._send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
+            return
+
+        headers = MutableHeaders(raw=self.start_message['headers'])
+        if not more_body:
+            # 一次性响应
+            if len(body) < self.middleware.minimum_size:
+                self.passthrough = True
+                await self._send(self.start_message)
+                await self._send(message)
+                return
+            if len(body) >= THREAD_COMPRESS_BYTES:
+                body = await asyncio.to_thread(self.middleware.compress, self.encoding, body)
+            else:
+                body = self.middleware.compress(self.encoding, body)
+            headers['Content-Encoding'] = self.encoding
+            headers['Content-Length'] = str(len(body))
+            headers.add_vary_header('Accept-Encoding')
+            await self._send(self.start_message)
+            await self._send({'type': 'http.response.body', 'body': body})
+            return
+
+        # 分块响应：流式压缩，长度未知
+        self.stream = _StreamCompressor(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+        headers['Content-Encoding'] = self.encoding
+        headers.add_vary_header('Accept-Encoding')
+        if 'content-length' in headers:
+            del headers['Content-Length']
+        await self._send(self.start_message)
+        chunk = self.stream.compress(body)
+        if chunk:
+            await self._send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
@@ -0,0 +1,213 @@
+"""
+内容寻址的数据集存储 - 同一份 conversations.json 只上传、只解析一次
+
+前端会把同一个文件分别上传给质量评估、流程分析、布鲁姆分析等端点，每次都重新解析
+几百 MB 的 JSON。DatasetStore：
+- 以文件内容的 SHA-256 作为数据集 ID，保存在 <root>/<id>/conversations.json，
+  内容相同的上传只保存一份
+- 解析后的对话列表保存在内存 LRU 中，各端点/任务共用同一份解析结果；
+  同一数据集并发请求时只解析一次
+- 超过保留时间未使用的数据集从磁盘删除
+"""
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List
+
+from core.data_loader import ChatDataLoader, Conversation
+from api.uploads import UploadWorkspace
+from utils.tracing import span
+
+DATASET_FILE = "conversations.json"
+
+_DATASET_ID = re.compile(r'^[0-9a-f]{64}$')
+
+
+class DatasetNotFound(Exception):
+    """数据集不存在（ID 无效、已删除或已过期）"""
+
+
+class DatasetStore:
+    """
+    数据集存储
+
+    用法:
+        store = DatasetStore('datasets', cache_size=4, ttl_seconds=86400)
+        dataset_id = store.add(workspace)          # 上传文件已写入 workspace
+        loader = store.loader(dataset_id)          # 带已解析对话的 ChatDataLoader
+        conversations = loader.load_conversations()
+    """
+
+    def __init__(self, root: str = "datasets", cache_size: int = 4, ttl_seconds: float = 86400):
+        """
+        Args:
+            root: 数据集保存目录
+            cache_size: 内存中保留解析结果的数据集数（超出后淘汰最久未使用的）
+            ttl_seconds: 数据集超过该时间未使用则从磁盘删除
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.cache_size = max(1, cache_size)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._parsed: "OrderedDict[str, List[Conversation]]" = OrderedDict()
+        self._parse_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, dataset_id: str) -> Path:
+        if not _DATASET_ID.match(dataset_id or ''):
+            raise DatasetNotFound(f"无效的数据集 ID: {dataset_id}")
+        return self.root / dataset_id
+
+    def exists(self, dataset_id: str) -> bool:
+        """数据集是否存在"""
+        try:
+            return (self._path(dataset_id) / DATASET_FILE).exists()
+        except DatasetNotFound:
+            return False
+
+    def add(self, workspace: UploadWorkspace) -> str:
+        """
+        把已写入工作目录的上传文件移入存储
+
+        已有相同内容的数据集时直接复用（工作目录中的文件随工作目录一起删除）。
+
+        Returns:
+            数据集 ID（文件内容的 SHA-256）
+        """
+        self.cleanup_expired()
+        dataset_id = workspace.sha256
+        target = self._path(dataset_id)
+        if not (target / DATASET_FILE).exists():
+            # 先移动到临时目录再整体重命名，其他请求不会看到写了一半的数据集
+            staging = self.root / f".{dataset_id}.{uuid.uuid4().hex}"
+            staging.mkdir()
+            shutil.move(str(workspace.path / DATASET_FILE), str(staging / DATASET_FILE))
+            try:
+                os.rename(staging, target)
+            except OSError:
+                # 并发上传了相同内容，对方已完成
+                shutil.rmtree(staging, ignore_errors=True)
+        self._touch(dataset_id)
+        return dataset_id
+
+    def loader(self, dataset_id: str) -> ChatDataLoader:
+        """
+        返回数据集的加载器，其 load_conversations() 直接返回缓存的解析结果
+
+        首次访问（或已被淘汰）时解析文件；同一数据集的并发调用只解析一次。
+
+        Raises:
+            DatasetNotFound: 数据集不存在
+        """
+        folder = self._path(dataset_id)
+        with span('dataset.load', dataset_id=dataset_id):
+            conversations = self._conversations(dataset_id)
+        self._touch(dataset_id)
+        return ChatDataLoader(str(folder), conversations=conversations)
+
+    def _conversations(self, dataset_id: str) -> List[Conversation]:
+        with self._lock:
+            conversations = self._parsed.get(dataset_id)
+            if conversations is not None:
+                self._parsed.move_to_end(dataset_id)
+                self.hits += 1
+                return conversations
+            parse_lock = self._parse_locks.setdefault(dataset_id, threading.Lock())
+
+        with parse_lock:
+            with self._lock:
+                conversations = self._parsed.get(dataset_id)
+                if conversations is not None:
+                    # 等锁期间其他线程已完成解析
+                    self._parsed.move_to_end(dataset_id)
+                    self.hits += 1
+                    return conversations
+            if not self.exists(dataset_id):
+                raise DatasetNotFound(f"数据集不存在: {dataset_id}")
+            conversations = ChatDataLoader(str(self._path(dataset_id))).load_conversations()
+            with self._lock:
+                self.misses += 1
+                self._parsed[dataset_id] = conversations
+                while len(self._parsed) > self.cache_size:
+                    self._parsed.popitem(last=False)
+                self._parse_locks.pop(dataset_id, None)
+        return conversations
+
+    def _touch(self, dataset_id: str):
+        """记录最近使用时间（用于过期清理）"""
+        try:
+            os.utime(self._path(dataset_id) / DATASET_FILE)
+        except OSError:
+            pass
+
+    def info(self, dataset_id: str) -> Dict[str, Any]:
+        """
+        数据集信息
+
+        Raises:
+            DatasetNotFound: 数据集不存在
+        """
+        if not self.exists(dataset_id):
+            raise DatasetNotFound(f"数据集不存在: {dataset_id}")
+        stat = (self._path(dataset_id) / DATASET_FILE).stat()
+        with self._lock:
+            conversations = self._parsed.get(dataset_id)
+        return {
+            'dataset_id': dataset_id,
+            'size': stat.st_size,
+            'last_used_at': stat.st_mtime,
+            'expires_at': stat.st_mtime + self.ttl_seconds,
+            # 未解析（或已被淘汰出内存）时为 None
+            'conversations': len(conversations) if conversations is not None else None,
+            'cached': conversations is not None,
+        }
+
+    def list(self) -> List[Dict[str, Any]]:
+        """所有未过期的数据集（按最近使用时间倒序）"""
+        self.cleanup_expired()
+        datasets = []
+        for folder in self.root.iterdir():
+            try:
+                datasets.append(self.info(folder.name))
+            except (DatasetNotFound, OSError):
+                continue
+        return sorted(datasets, key=lambda d: d['last_used_at'], reverse=True)
+
+    def delete(self, dataset_id: str) -> bool:
+        """删除数据集（磁盘文件与内存中的解析结果），不存在时返回 False"""
+        existed = self.exists(dataset_id)
+        with self._lock:
+            existed = self._parsed.pop(dataset_id, None) is not None or existed
+        if existed:
+            shutil.rmtree(self._path(dataset_id), ignore_errors=True)
+        return existed
+
+    def cleanup_expired(self):
+        """删除超过保留时间未使用的数据集"""
+        deadline = time.time() - self.ttl_seconds
+        for folder in self.root.iterdir():
+            data_file = folder / DATASET_FILE
+            try:
+                expired = data_file.stat().st_mtime < deadline
+            except OSError:
+                continue
+            if expired:
+                self.delete(folder.name)
+
+    def stats(self) -> Dict[str, Any]:
+        """解析缓存统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'cached_datasets': len(self._parsed),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,443 @@
+"""
+后台任务管理 - 把长耗时的评估/分析从事件循环中移出
+
+质量评估和流程分析是同步代码，可能运行数分钟。直接在 async 处理函数中执行会阻塞
+uvicorn 事件循环，导致 /api/health 等所有请求卡住。JobManager 在独立线程池中执行任务：
+- 提交后立即返回任务 ID，客户端轮询状态或获取结果
+- 排队深度有上限，超出时拒绝新任务
+- 支持取消：排队中的任务直接取消，运行中的任务在下一个进度回调处中止
+- 已结束的任务超过保留时间后清理
+
+任务运行期间通过 emit 记录事件（逐个问答对/回合的结果），最后一个事件是
+summary（成功，附带最终结果）、error 或 cancelled，供 SSE 端点按顺序推送。
+
+准入控制：每个任务带有客户端标识和预计 LLM 调用数（cost）。
+- 提交时检查全局排队上限、单个客户端的任务数与预计调用数上限，超出时抛出
+  JobQueueFull（附带建议的重试等待时间）
+- 排队任务按优先级调度：预计调用数不超过 interactive_max_calls 的小任务优先于大批量任务，
+  同级按提交顺序；同时运行任务的预计调用总数与单个客户端同时运行的任务数也有上限
+
+任务函数在提交时的 contextvars 上下文中运行，提交时激活的 Trace（utils.tracing）
+会记录任务的排队等待与运行期间的各阶段耗时。
+"""
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.tracing import Trace, current_trace, span
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+# 任务结束时的最后一个事件类型
+TERMINAL_EVENTS = ('summary', 'error', 'cancelled')
+
+# 调度优先级：交互式小任务优先于批量任务
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+
+class JobCancelled(Exception):
+    """任务已被取消（由进度回调抛出以中止运行中的任务）"""
+
+
+class JobQueueFull(Exception):
+    """任务被拒绝：排队已满或客户端超出配额"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        # 建议客户端等待多少秒后重试
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    """单个后台任务"""
+    id: str
+    kind: str
+    client: str = 'anonymous'
+    cost: int = 1
+    priority: int = PRIORITY_INTERACTIVE
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: Dict[str, Any] = field(default_factory=lambda: {'completed': 0, 'total': None})
+    result: Any = None
+    error: Optional[str] = None
+    future: Optional[Future] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    cleanup: List[Callable[[], None]] = field(default_factory=list)
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    meta: Dict[str, Any] = field(default_factory=dict)  # 附加信息（如上传文件摘要），并入 to_dict()
+    trace: Optional[Trace] = None  # 提交时激活的阶段追踪（未启用时为 None）
+    _events_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    # 排队期间保存的 (fn, args, kwargs)，开始运行后清空
+    _call: Optional[Tuple[Callable[..., Any], tuple, dict]] = field(default=None, repr=False)
+    # 提交时的 contextvars 上下文，任务函数在其中运行
+    _context: Optional[contextvars.Context] = field(default=None, repr=False)
+
+    def emit(self, event: str, data: Any):
+        """记录一个事件（可在任意线程调用），事件 id 为其在列表中的下标"""
+        with self._events_lock:
+            self.events.append({'id': len(self.events), 'event': event, 'data': data})
+
+    def events_since(self, cursor: int) -> List[Dict[str, Any]]:
+        """返回下标不小于 cursor 的事件"""
+        with self._events_lock:
+            return self.events[cursor:]
+
+    def check_cancelled(self):
+        """在任务的进度回调中调用：已请求取消时抛出 JobCancelled"""
+        if self.cancel_event.is_set():
+            raise JobCancelled(f"任务 {self.id} 已取消")
+
+    def update_progress(self, completed: int, total: Optional[int] = None):
+        """更新进度并检查是否已取消"""
+        self.progress = {'completed': completed, 'total': total if total is not None else self.progress['total']}
+        self.check_cancelled()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """任务状态（不含结果）"""
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'client': self.client,
+            'projected_llm_calls': self.cost,
+            'priority': 'interactive' if self.priority == PRIORITY_INTERACTIVE else 'batch',
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'progress': dict(self.progress),
+            'error': self.error,
+            **self.meta,
+        }
+
+
+class JobManager:
+    """
+    后台任务管理器
+
+    用法:
+        jobs = JobManager(max_workers=2, max_queued=16, ttl_seconds=3600)
+        job = jobs.submit('evaluate-quality', run_evaluation, folder,       # run_evaluation(job, folder)
+                          client='10.0.0.1', cost=18)
+        jobs.get(job.id).status
+        jobs.cancel(job.id)
+    """
+
+    # 还没有已完成的任务时，估算 Retry-After 使用的平均任务耗时（秒）
+    DEFAULT_JOB_SECONDS = 10.0
+    MAX_RETRY_AFTER = 300.0
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_queued: int = 16,
+        ttl_seconds: float = 3600,
+        max_llm_calls: int = 0,
+        max_jobs_per_client: int = 0,
+        max_running_per_client: int = 0,
+        max_llm_calls_per_client: int = 0,
+        interactive_max_calls: int = 50
+    ):
+        """
+        Args:
+            max_workers: 同时运行的任务数
+            max_queued: 排队等待（未开始运行）的任务数上限
+            ttl_seconds: 已结束任务的保留时间，过期后删除状态和结果
+            max_llm_calls: 同时运行任务的预计 LLM 调用总数上限（0 表示不限制；
+                单个超出上限的任务在没有其他任务运行时仍可运行）
+            max_jobs_per_client: 单个客户端运行中 + 排队的任务数上限（0 表示不限制）
+            max_running_per_client: 单个客户端同时运行的任务数上限（0 表示不限制）
+            max_llm_calls_per_client: 单个客户端运行中 + 排队任务的预计 LLM 调用总数上限
+                （0 表示不限制；客户端没有未结束任务时总是接受一个任务）
+            interactive_max_calls: 预计调用数不超过该值的任务视为交互式任务，优先调度
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_queued = max(0, max_queued)
+        self.ttl_seconds = ttl_seconds
+        self.max_llm_calls = max(0, max_llm_calls)
+        self.max_jobs_per_client = max(0, max_jobs_per_client)
+        self.max_running_per_client = max(0, max_running_per_client)
+        self.max_llm_calls_per_client = max(0, max_llm_calls_per_client)
+        self.interactive_max_calls = interactive_max_calls
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='analysis-job')
+        self._jobs: Dict[str, Job] = {}
+        # 排队任务：(优先级, 提交序号, 任务 ID)
+        self._queue: List[Tuple[int, int, str]] = []
+        self._sequence = itertools.count()
+        self._running: Dict[str, Job] = {}
+        self._avg_job_seconds: Optional[float] = None
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        kind: str,
+        fn: Callable[..., Any],
+        *args,
+        cleanup: Optional[Callable[[], None]] = None,
+        client: str = 'anonymous',
+        cost: int = 1,
+        **kwargs
+    ) -> Job:
+        """
+        提交任务
+
+        Args:
+            kind: 任务类型（用于展示）
+            fn: 任务函数，调用方式为 fn(job, *args, **kwargs)，返回值作为任务结果
+            cleanup: 任务结束（成功、失败或取消）后调用，用于删除临时文件等
+            client: 客户端标识（用于单客户端配额）
+            cost: 预计的 LLM 调用数（用于调用数上限和优先级）
+
+        Raises:
+            JobQueueFull: 排队已满或客户端超出配额（retry_after 为建议的重试等待秒数）
+        """
+        self.cleanup_expired()
+        cost = max(1, int(cost))
+        with self._lock:
+            self._admit(client, cost)
+            job = Job(
+                id=uuid.uuid4().hex,
+                kind=kind,
+                client=client,
+                cost=cost,
+                priority=PRIORITY_INTERACTIVE if cost <= self.interactive_max_calls else PRIORITY_BATCH,
+                trace=current_trace()
+            )
+            job.future = Future()
+            if cleanup is not None:
+                job.cleanup.append(cleanup)
+            self._jobs[job.id] = job
+            job._call = (fn, args, kwargs)
+            job._context = contextvars.copy_context()
+            heapq.heappush(self._queue, (job.priority, next(self._sequence), job.id))
+        self._dispatch()
+        return job
+
+    def check_admission(self, client: str, cost: int = 1):
+        """
+        提前检查是否会被拒绝（不占用名额），用于在读取大文件前快速拒绝
+
+        Raises:
+            JobQueueFull: 排队已满或客户端超出配额
+        """
+        with self._lock:
+            self._admit(client, max(1, int(cost)))
+
+    def _admit(self, client: str, cost: int):
+        """准入检查（调用方持有锁），不通过时抛出 JobQueueFull"""
+        queued = len(self._queue)
+        # 队列中的任务都在等待（工作线程已满或受调用数/单客户端上限限制），新任务同样需要排队；
+        # 队列为空时只有工作线程已满才需要排队（max_queued=0 时仍可接受能立即运行的任务）
+        if queued >= self.max_queued and (queued or len(self._running) >= self.max_workers):
+            self._reject(f"任务队列已满（{len(self._running)} 个任务运行中，{queued} 个排队）", queued)
+        active = [job for job in self._jobs.values() if job.client == client and job.status in ACTIVE_STATUSES]
+        if self.max_jobs_per_client and len(active) >= self.max_jobs_per_client:
+            self._reject(f"客户端 {client} 已有 {len(active)} 个任务运行或排队", queued)
+        if self.max_llm_calls_per_client and active:
+            projected = sum(job.cost for job in active)
+            if projected + cost > self.max_llm_calls_per_client:
+                self._reject(
+                    f"客户端 {client} 预计 LLM 调用数超出配额（已占用 {projected}，"
+                    f"本任务 {cost}，上限 {self.max_llm_calls_per_client}）",
+                    queued
+                )
+
+    def _reject(self, message: str, queued: int):
+        self.rejected += 1
+        raise JobQueueFull(message, retry_after=self._retry_after(queued))
+
+    def _retry_after(self, queued: int) -> float:
+        """按平均任务耗时估算排队任务需要多久才能让出位置"""
+        avg = self._avg_job_seconds or self.DEFAULT_JOB_SECONDS
+        waves = queued // self.max_workers + 1
+        return min(self.MAX_RETRY_AFTER, max(1.0, avg * waves))
+
+    def _can_start(self, job: Job, running_calls: int, running_by_client: Dict[str, int]) -> bool:
+        if self.max_llm_calls and self._running and running_calls + job.cost > self.max_llm_calls:
+            return False
+        if self.max_running_per_client and running_by_client.get(job.client, 0) >= self.max_running_per_client:
+            return False
+        return True
+
+    def _dispatch(self):
+        """按优先级启动可运行的排队任务"""
+        with self._lock:
+            if not self._queue or len(self._running) >= self.max_workers:
+                return
+            running_calls = sum(job.cost for job in self._running.values())
+            running_by_client: Dict[str, int] = {}
+            for job in self._running.values():
+                running_by_client[job.client] = running_by_client.get(job.client, 0) + 1
+
+            waiting = []
+            started = []
+            while self._queue and len(self._running) < self.max_workers:
+                entry = heapq.heappop(self._queue)
+                job = self._jobs.get(entry[2])
+                if job is None or job.status != QUEUED:
+                    continue
+                if not self._can_start(job, running_calls, running_by_client):
+                    waiting.append(entry)
+                    continue
+                self._running[job.id] = job
+                running_calls += job.cost
+                running_by_client[job.client] = running_by_client.get(job.client, 0) + 1
+                started.append(job)
+            for entry in waiting:
+                heapq.heappush(self._queue, entry)
+            for job in started:
+                job.future.set_running_or_notify_cancel()
+                self._executor.submit(self._run, job)
+
+    def _run(self, job: Job):
+        """在线程池中执行任务并记录状态（不向 Future 抛出异常）"""
+        fn, args, kwargs = job._call
+        try:
+            if job.cancel_event.is_set():
+                job.status = CANCELLED
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+            job.emit('status', {'status': RUNNING})
+            if job.trace is not None:
+                now = time.perf_counter()
+                job.trace.add('job.queue_wait', now - (job.started_at - job.created_at), now, {'kind': job.kind})
+            job.result = job._context.run(self._call_traced, job, fn, args, kwargs)
+            job.status = SUCCEEDED
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            print(f"任务 {job.id} ({job.kind}) 失败: {e}")
+        finally:
+            job.finished_at = time.time()
+            job._call = None
+            job._context = None
+            if job.trace is not None:
+                job.trace.finish()
+            self._run_cleanup(job)
+            self._emit_terminal(job)
+            with self._lock:
+                self._running.pop(job.id, None)
+                if job.started_at is not None:
+                    duration = job.finished_at - job.started_at
+                    self._avg_job_seconds = (
+                        duration if self._avg_job_seconds is None
+                        else 0.8 * self._avg_job_seconds + 0.2 * duration
+                    )
+            job.future.set_result(None)
+            self._dispatch()
+
+    @staticmethod
+    def _call_traced(job: Job, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        with span('job.run', kind=job.kind):
+            return fn(job, *args, **kwargs)
+
+    @staticmethod
+    def _emit_terminal(job: Job):
+        """记录任务的最后一个事件"""
+        if job.status == SUCCEEDED:
+            job.emit('summary', job.result)
+        elif job.status == FAILED:
+            job.emit('error', {'error': job.error})
+        else:
+            job.emit('cancelled', {'status': CANCELLED})
+
+    @staticmethod
+    def _run_cleanup(job: Job):
+        while job.cleanup:
+            callback = job.cleanup.pop()
+            try:
+                callback()
+            except Exception as e:
+                print(f"任务 {job.id} 清理失败: {e}")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """查询任务，不存在或已过期返回 None"""
+        self.cleanup_expired()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        """所有未过期的任务（按创建时间排序）"""
+        self.cleanup_expired()
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created_at)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        取消任务：排队中的任务立即取消；运行中的任务在下一次进度回调时中止
+
+        Returns:
+            任务，不存在时返回 None
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        with self._lock:
+            # 尚未开始运行：从队列中移除，_run 不会再被调用
+            dequeued = job.status == QUEUED and job.id not in self._running
+            if dequeued:
+                self._queue = [entry for entry in self._queue if entry[2] != job.id]
+                heapq.heapify(self._queue)
+                job.status = CANCELLED
+        if dequeued:
+            job.finished_at = time.time()
+            job._call = None
+            job._context = None
+            if job.trace is not None:
+                job.trace.finish()
+            # 与 _run 一致：Future 总是正常结束，等待方通过 job.status 判断结果
+            job.future.set_result(None)
+            self._run_cleanup(job)
+            self._emit_terminal(job)
+        return job
+
+    def cleanup_expired(self):
+        """删除结束时间超过保留时间的任务"""
+        deadline = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished_at is not None and job.finished_at < deadline
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """各状态的任务数、排队深度与运行中任务的预计 LLM 调用数"""
+        with self._lock:
+            counts = {status: 0 for status in (QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED)}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            counts['queue_depth'] = len(self._queue)
+            counts['running_llm_calls'] = sum(job.cost for job in self._running.values())
+            counts['rejected'] = self.rejected
+        return counts
+
+    def shutdown(self):
+        """取消所有未结束的任务并关闭线程池（不等待运行中的任务）"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if job.status in ACTIVE_STATUSES:
+                self.cancel(job.id)
+        self._executor.shutdown(wait=False, cancel_futures=True)
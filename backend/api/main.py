@@ -4,32 +4,67 @@ ConveVisAna FastAPI Backend
 """
 import os
 import json
+import asyncio
+import contextvars
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, Any, List, Optional
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
+from typing import Dict, Any, List, Optional, Union
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Depends, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
 # 导入核心模块
 import sys
 sys.path.append(str(Path(__file__).parent.parent))
-from core.data_loader import ChatDataLoader
 from core.custom_llm import ChatAIAPIModel, create_default_model
-from core.evaluate_chats import ChatQualityEvaluator
+from core.evaluate_chats import ADAPTIVE_MIN_SAMPLES, ChatQualityEvaluator
 from core.conversation_flow_analyzer import ConversationFlowAnalyzer
+from core.corpus_flow import TIME_BUCKETS, CorpusFlowAnalyzer, FlowAggregate
+from core.data_loader import ChatDataLoader
+from core.rate_limiter import RateLimiter
+from core.summary_stats import MetricAggregator
+from core.turn_cache import TurnResultCache
+from core.local_classifier import LocalQuestionClassifier
+from core.bloom_analyzer import BloomAnalyzer, METHODS as BLOOM_METHODS
+from api.jobs import (
+    ACTIVE_STATUSES, CANCELLED, FAILED, QUEUED, RUNNING, SUCCEEDED, TERMINAL_EVENTS, Job, JobCancelled, JobManager,
+    JobQueueFull
+)
+from api.uploads import UploadTooLarge, UploadWorkspace
+from api.datasets import DatasetNotFound, DatasetStore
+from api.pools import KeyedPool
+from api.compression import CompressionMiddleware
+from api.responses import FastJSONResponse, ResponseShape, json_response, response_shape
 
 # 导入配置中心
 from config.llm_config import LLMConfig, get_api_key, get_model_for_task
+from utils.metrics import REGISTRY, RequestMetricsMiddleware
+from utils.tracing import Trace, activate, span
 
 # 加载环境变量（强制使用 .env 覆盖进程环境，避免旧值残留）
 load_dotenv(override=True)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：关闭时取消未结束的任务并关闭池中的 LLM 连接"""
+    yield
+    job_manager.shutdown()
+    batch_executor.shutdown(wait=False, cancel_futures=True)
+    llm_pool.shutdown()
+    evaluator_pool.shutdown()
+
+
 app = FastAPI(
     title="ConveVisAna API",
     description="ChatGPT 对话分析 API - 提供 AI 驱动的质量评估和流程分析",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # 配置 CORS - 允许前端跨域访问
@@ -47,6 +82,129 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 按 Accept-Encoding 压缩响应（brotli / gzip）
+app.add_middleware(CompressionMiddleware, **LLMConfig.get_compression_config())
+
+# 按路由记录请求耗时（/metrics，包含压缩耗时）
+app.add_middleware(RequestMetricsMiddleware)
+
+# 流程分析回合缓存（跨请求共享，重新上传的对话只分析新增回合）
+turn_cache = TurnResultCache(cache_dir=LLMConfig.get_turn_cache_dir())
+
+# 布鲁姆层级 LLM 复核结果缓存（与流程分析缓存共用目录），后台复核完成后重新请求即可命中
+bloom_cache = TurnResultCache(cache_dir=LLMConfig.get_turn_cache_dir(), file_name="bloom_results.jsonl")
+
+# SSE 进度推送：检查新事件的间隔与心跳间隔（秒）
+SSE_POLL_INTERVAL = 0.2
+SSE_HEARTBEAT_INTERVAL = 15.0
+
+# 数据集存储：上传一次（内容哈希为 ID），各分析端点共用同一份解析结果
+dataset_store = DatasetStore(**LLMConfig.get_dataset_config())
+
+# 质量评估每个问答对的预计 LLM 调用数（6 个 deepeval 指标，每个指标 2~3 次调用），用于准入控制
+QUALITY_CALLS_PER_PAIR = 15
+
+# 各类结果中可用 offset/limit 分页的主列表（按顺序取结果中第一个存在的）
+PAGE_KEYS = {
+    "evaluate-quality": ("raw.results",),
+    "analyze-flow": ("turns", "conversations"),
+    "analyze-bloom": ("turns",),
+    "analyze-batch": ("exports",),
+}
+
+# 批量分析支持的分析类型
+BATCH_ANALYSES = ("quality", "flow", "bloom")
+
+# 阶段追踪请求头：1/true 时在响应中附带各阶段耗时（timings），
+# export 时另外把追踪导出到 TRACE_DIR（Chrome Trace Event 格式，可用 Perfetto 等以火焰图查看）
+DEBUG_TIMINGS_HEADER = "x-debug-timings"
+
+# 后台任务管理器：长耗时的评估/分析在独立线程池中运行，不阻塞事件循环
+job_manager = JobManager(**LLMConfig.get_job_config())
+
+# LLM 调用限速器（CHATAI_RATE_LIMIT_RPM）：池中所有 LLM 客户端和评估器共用同一调用预算
+_rate_limit = LLMConfig.get_rate_limit()
+llm_rate_limiter = RateLimiter(_rate_limit) if _rate_limit else None
+
+# 批量分析的共享工作线程池：所有批量任务的导出评估与流程分析回合都在这里执行，
+# 多个批量请求同时运行时总并发仍为 BATCH_MAX_WORKERS
+batch_config = LLMConfig.get_batch_config()
+batch_executor = ThreadPoolExecutor(max_workers=batch_config["max_workers"], thread_name_prefix="batch")
+
+
+def close_evaluator(evaluator: ChatQualityEvaluator):
+    if evaluator.custom_llm is not None:
+        evaluator.custom_llm.session.close()
+
+
+# LLM 客户端池与评估器池（按模型区分）：跨请求复用 HTTP 连接和已构建的 deepeval 指标，
+# 使用期间由单个请求/任务独占，评估器归还时清空单次评估的状态
+llm_pool = KeyedPool(
+    "llm_clients",
+    lambda model: ChatAIAPIModel(api_key=get_api_key(), model=model, rate_limiter=llm_rate_limiter),
+    max_idle=LLMConfig.get_pool_max_idle(),
+    close=lambda llm: llm.session.close()
+)
+evaluator_pool = KeyedPool(
+    "evaluators",
+    lambda model: ChatQualityEvaluator(".", model=model, use_custom_api=True, rate_limiter=llm_rate_limiter),
+    max_idle=LLMConfig.get_pool_max_idle(),
+    reset=lambda evaluator: evaluator.reset(),
+    close=close_evaluator
+)
+
+
+# 本地问题分类器（可选），置信度达标的回合不调用 LLM
+_classifier_config = LLMConfig.get_local_classifier_config()
+local_classifier = (
+    LocalQuestionClassifier.load(_classifier_config["path"], threshold=_classifier_config["threshold"])
+    if _classifier_config["path"] and Path(_classifier_config["path"]).exists()
+    else None
+)
+
+
+# ============ 运行指标（抓取 /metrics 时读取） ============
+
+_metric_caches = {"flow_turns": turn_cache, "bloom": bloom_cache, "datasets": dataset_store}
+REGISTRY.callback(
+    "cache_hits_total", "缓存命中次数", "counter",
+    lambda: {(name,): cache.hits for name, cache in _metric_caches.items()}, ("cache",)
+)
+REGISTRY.callback(
+    "cache_misses_total", "缓存未命中次数", "counter",
+    lambda: {(name,): cache.misses for name, cache in _metric_caches.items()}, ("cache",)
+)
+REGISTRY.callback(
+    "cache_hit_ratio", "缓存命中率（进程启动以来）", "gauge",
+    lambda: {
+        (name,): cache.hits / (cache.hits + cache.misses)
+        for name, cache in _metric_caches.items() if cache.hits + cache.misses
+    },
+    ("cache",)
+)
+REGISTRY.callback(
+    "jobs", "各状态的后台任务数", "gauge",
+    lambda: {
+        (status,): count for status, count in job_manager.stats().items()
+        if status in (QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED)
+    },
+    ("status",)
+)
+REGISTRY.callback("job_queue_depth", "排队等待的后台任务数", "gauge", lambda: {(): job_manager.stats()["queue_depth"]})
+REGISTRY.callback(
+    "job_running_llm_calls", "运行中任务的预计 LLM 调用数", "gauge",
+    lambda: {(): job_manager.stats()["running_llm_calls"]}
+)
+REGISTRY.callback("jobs_rejected_total", "被准入控制拒绝的任务数", "counter", lambda: {(): job_manager.rejected})
+REGISTRY.callback(
+    "pool_objects", "对象池中的对象数", "gauge",
+    lambda: {
+        (pool.name, state): pool.stats()[state]
+        for pool in (llm_pool, evaluator_pool) for state in ("idle", "in_use")
+    },
+    ("pool", "state")
+)
+
 
 # ============ 数据模型 ============
 
@@ -73,21 +231,778 @@ class HealthResponse(BaseModel):
 
 # ============ 辅助函数 ============
 
-def save_temp_file(content: bytes, filename: str) -> Path:
-    """保存临时文件"""
-    temp_dir = Path("temp")
-    temp_dir.mkdir(exist_ok=True)
+def open_upload_workspace() -> UploadWorkspace:
+    """为当前请求创建独立的上传工作目录（并发请求互不覆盖）"""
+    return UploadWorkspace(max_bytes=LLMConfig.get_max_upload_bytes())
+
+
+async def save_upload(workspace: UploadWorkspace, file: UploadFile) -> Path:
+    """把上传文件流式写入工作目录，超过大小上限时返回 413"""
+    try:
+        return await workspace.save(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+async def resolve_dataset(file: Optional[UploadFile], dataset_id: Optional[str]) -> str:
+    """
+    确定本次分析使用的数据集：上传了文件则先存入数据集存储（内容相同的文件只保存一份），
+    否则使用已上传的 dataset_id
+    """
+    if file is not None:
+        with span('api.upload'):
+            async with open_upload_workspace() as workspace:
+                await save_upload(workspace, file)
+                return await asyncio.to_thread(dataset_store.add, workspace)
+    if not dataset_id:
+        raise HTTPException(status_code=400, detail="请上传 file 或提供 dataset_id")
+    if not dataset_store.exists(dataset_id):
+        raise HTTPException(status_code=404, detail=f"数据集不存在或已过期: {dataset_id}")
+    return dataset_id
+
+
+def request_trace(request: Request, name: str) -> Optional[Trace]:
+    """请求携带阶段追踪请求头时创建 Trace，否则返回 None（不记录任何数据）"""
+    value = (request.headers.get(DEBUG_TIMINGS_HEADER) or "").strip().lower()
+    if value in ("", "0", "false", "no", "off"):
+        return None
+    return Trace(name, export_dir=LLMConfig.get_trace_dir() if value == "export" else None)
+
+
+def with_timings(content: Dict[str, Any], trace: Optional[Trace]) -> Dict[str, Any]:
+    """启用追踪时在响应中附带各阶段耗时（请求导出时另附追踪文件路径）"""
+    if trace is None:
+        return content
+    trace.finish()
+    timings = trace.summary()
+    if trace.export_dir:
+        timings["trace_file"] = trace.export(trace.export_dir)
+    return {**content, "timings": timings}
+
+
+# ============ 后台任务 ============
+
+def metric_thresholds(evaluator: ChatQualityEvaluator) -> Dict[str, float]:
+    """评估器各指标的通过阈值"""
+    return {name: getattr(metric, 'threshold', 0) for name, metric in evaluator.metrics.items()}
+
+
+def quality_payload(results: Dict[str, Any], thresholds: Dict[str, float]) -> Dict[str, Any]:
+    """把评估结果适配为前端预期的数据结构（QualityEvaluationResult）"""
+    summary_metrics = results.get('summary', {}).get('metrics', {})
+
+    def metric_entry(name: str):
+        m = summary_metrics.get(name)
+        if not m:
+            return None
+        score = m.get('average_score', 0)
+        threshold = thresholds.get(name, 0)
+        # 对毒性/偏见类指标采用“越低越好”的通过逻辑
+        if name in ['toxicity', 'bias']:
+            passed = score <= threshold if threshold else True
+        else:
+            passed = score >= threshold if threshold else True
+        return {
+            'score': score,
+            'threshold': threshold,
+            'passed': passed,
+            'ci_lower': m.get('ci_lower'),
+            'ci_upper': m.get('ci_upper'),
+        }
+
+    metrics_payload = {
+        'relevancy': metric_entry('relevancy'),
+        'helpfulness': metric_entry('helpfulness'),
+        'coherence': metric_entry('coherence'),
+        'toxicity': metric_entry('toxicity'),
+        'bias': metric_entry('bias'),
+    }
+
+    # 前端用于可视化的整体得分（保持与前端计算方式一致）
+    def safe_score(entry, inverse=False):
+        if not entry or entry.get('score') is None:
+            return 0
+        return (1 - entry['score']) if inverse else entry['score']
+
+    average_score = (
+        safe_score(metrics_payload['relevancy']) +
+        safe_score(metrics_payload['helpfulness']) +
+        safe_score(metrics_payload['coherence']) +
+        safe_score(metrics_payload['toxicity'], inverse=True) +
+        safe_score(metrics_payload['bias'], inverse=True)
+    ) / 5
+
+    return {
+        'pairs_evaluated': results.get('total_qa_pairs', 0),
+        'metrics': metrics_payload,
+        'average_score': average_score,
+        # 兼容字段：保留原始结果以便调试或下载
+        'raw': results,
+    }
+
+
+def run_quality_evaluation(
+    job: Job,
+    dataset_id: str,
+    max_qa_pairs: int,
+    model: str,
+    prescreen: bool,
+    target_ci_width: Optional[float],
+    dedup_threshold: Optional[float]
+) -> Dict[str, Any]:
+    """质量评估任务（在后台线程中运行）"""
+    loader = dataset_store.loader(dataset_id)
+    
+    # 从评估器池取出评估器（任务结束后归还），绑定本次任务的数据
+    evaluator = evaluator_pool.acquire(model)
+    job.cleanup.append(lambda: evaluator_pool.release(model, evaluator))
+    evaluator.reset(loader, prescreen=prescreen)
+    
+    def on_result(index: int, total: int, qa_result: Dict):
+        job.emit('pair', {'index': index, 'total': total, 'result': qa_result})
+        job.update_progress(index, total)
+    
+    # 执行评估
+    if target_ci_width:
+        results = evaluator.evaluate_adaptive(
+            target_ci_width=target_ci_width,
+            max_qa_pairs=max_qa_pairs,
+            on_result=on_result
+        )
+    else:
+        results = evaluator.evaluate_conversation(
+            max_qa_pairs=max_qa_pairs,
+            dedup_threshold=dedup_threshold,
+            on_result=on_result
+        )
+
+    return {
+        "data": quality_payload(results, metric_thresholds(evaluator)),
+        "message": f"成功评估 {results.get('total_qa_pairs', 0)} 个问答对"
+    }
+
+
+def run_flow_analysis(
+    job: Job,
+    dataset_id: str,
+    model_name: str,
+    concurrency: Optional[int],
+    batch_size: Optional[int],
+    topic_shift_mode: Optional[str],
+    scope: str,
+    max_conversations: Optional[int],
+    granularity: str
+) -> Dict[str, Any]:
+    """流程分析任务（在后台线程中运行）"""
+    # 从客户端池取出 LLM 模型（任务结束后归还）
+    llm_model = llm_pool.acquire(model_name)
+    job.cleanup.append(lambda: llm_pool.release(model_name, llm_model))
+    
+    # 创建分析器
+    analyzer = ConversationFlowAnalyzer(
+        llm_model,
+        cache=turn_cache,
+        local_classifier=local_classifier,
+        topic_shift_mode=topic_shift_mode
+    )
+    
+    # 提取对话回合（使用数据集存储中缓存的解析结果）
+    loader = dataset_store.loader(dataset_id)
+    conversations = loader.load_conversations()
+    
+    if not conversations:
+        raise ValueError("未找到有效对话")
+    
+    if scope == "corpus":
+        corpus = CorpusFlowAnalyzer(
+            analyzer,
+            max_workers=concurrency or LLMConfig.get_max_concurrency(),
+            granularity=granularity
+        )
+        conversation_summaries = []
+        for item in corpus.analyze({"upload": loader}, max_conversations):
+            conversation_summaries.append({
+                "conversation_id": item['conversation_id'],
+                "title": item['conversation_title'],
+                "time_bucket": item['time_bucket'],
+                "total_turns": item['total_turns'],
+                "flow_summary": item['flow_summary'],
+            })
+            job.emit('conversation', conversation_summaries[-1])
+            job.update_progress(len(conversation_summaries), max_conversations)
+        return {
+            "data": {
+                "scope": "corpus",
+                "conversations": conversation_summaries,
+                "aggregate": corpus.summary(),
+            },
+            "message": f"成功分析 {len(conversation_summaries)} 个对话的流程"
+        }
+    
+    # 选择最长的对话
+    conv = max(conversations, key=lambda c: len(c.messages))
+    
+    # 转换为分析格式
+    turns = []
+    for i in range(0, len(conv.messages) - 1, 2):
+        if i + 1 < len(conv.messages):
+            user_msg = conv.messages[i]
+            assistant_msg = conv.messages[i + 1]
+            
+            if user_msg.role == 'user' and assistant_msg.role == 'assistant':
+                turns.append({
+                    "question": user_msg.content,
+                    "answer": assistant_msg.content
+                })
     
-    temp_file = temp_dir / filename
-    temp_file.write_bytes(content)
-    return temp_file
+    completed = 0
+    
+    def on_turn(turn_result: Dict[str, Any]):
+        nonlocal completed
+        completed += 1
+        job.emit('turn', {'completed': completed, 'total': len(turns), 'turn': turn_result})
+        job.update_progress(completed, len(turns))
+    
+    # 执行分析（原始结果）
+    result = analyzer.analyze_conversation_flow(
+        turns,
+        conversation_title=conv.title,
+        concurrency=concurrency or LLMConfig.get_max_concurrency(),
+        batch_size=batch_size,
+        on_turn=on_turn
+    )
+
+    # ========== 适配前端所需结构 ==========
+    # 构造带 question_type 的前端 turns
+    turn_analysis = result.get('turn_analysis', [])
+    frontend_turns = []
+    for i, t in enumerate(turns):
+        qtype = 'other'
+        if i < len(turn_analysis):
+            qtype = turn_analysis[i].get('question_type', 'other') or 'other'
+        frontend_turns.append({
+            "question": t.get('question', ''),
+            "answer": t.get('answer', ''),
+            "question_type": qtype,
+            "turn_number": i + 1
+        })
+
+    # 统计与均值
+    total_turns = len(frontend_turns)
+    avg_question_length = (
+        sum(len(t.get('question', '') or '') for t in frontend_turns) / total_turns
+        if total_turns > 0 else 0
+    )
+    avg_response_length = (
+        sum(len(t.get('answer', '') or '') for t in frontend_turns) / total_turns
+        if total_turns > 0 else 0
+    )
+    question_type_counts: Dict[str, int] = {}
+    for t in frontend_turns:
+        qt = t.get('question_type') or 'other'
+        question_type_counts[qt] = question_type_counts.get(qt, 0) + 1
+
+    frontend_data = {
+        "conversation_id": None,
+        "total_turns": total_turns,
+        "turns": frontend_turns,
+        "summary": {
+            "question_type_counts": question_type_counts,
+            "avg_question_length": avg_question_length,
+            "avg_response_length": avg_response_length,
+            "total_turns": total_turns,
+        },
+        # 所有回合都来自回合缓存时为 True
+        "cached": bool(turns) and result.get('cache', {}).get('misses') == 0,
+        # 附带原始结果，便于调试（前端无需依赖）
+        "_raw": {
+            "flow_summary": result.get('flow_summary', {}),
+            "turn_analysis": turn_analysis,
+            "cache": result.get('cache'),
+            "local_classifier": result.get('local_classifier'),
+            "topic_shift_check": result.get('topic_shift_check'),
+            "context_budget": result.get('context_budget'),
+        }
+    }
+    
+    return {
+        "data": frontend_data,
+        "message": f"成功分析对话流程，包含 {len(turns)} 个回合"
+    }
+
+
+def evaluate_export(job: Job, loader: ChatDataLoader, max_qa_pairs: int, model: str, prescreen: bool):
+    """
+    批量分析中一个导出的质量评估（在共享线程池中运行）
+
+    Returns:
+        (前端结构, 本次评估的在线聚合器, 各指标阈值)；评估器归还时会换用新的聚合器，
+        返回的聚合器仍可用于跨导出合并
+    """
+    with evaluator_pool.checkout(model) as evaluator:
+        evaluator.reset(loader, prescreen=prescreen)
+        results = evaluator.evaluate_conversation(
+            max_qa_pairs=max_qa_pairs,
+            on_result=lambda *_: job.check_cancelled()
+        )
+        thresholds = metric_thresholds(evaluator)
+        return quality_payload(results, thresholds), evaluator.aggregator, thresholds
+
+
+def bloom_export(conversation_turns: List[List[Dict[str, str]]], method: str, model_name: str) -> Dict[str, Any]:
+    """批量分析中一个导出的布鲁姆层级分析（在共享线程池中运行，LLM 复核在当前线程中逐批进行）"""
+    use_llm = method != "heuristic" and bool(get_api_key())
+    llm_model = llm_pool.acquire(model_name) if use_llm else None
+    try:
+        analyzer = BloomAnalyzer(llm_model, cache=bloom_cache, concurrency=1)
+        result = analyzer.analyze(
+            conversation_turns,
+            method=method if llm_model is not None else "heuristic",
+            wait=True
+        )
+    finally:
+        if llm_model is not None:
+            llm_pool.release(model_name, llm_model)
+    result['refinement'].pop('pending_turns')
+    return result
+
+
+def run_batch_flow(
+    job: Job,
+    conversations: Dict[str, List],
+    loaders: Dict[str, ChatDataLoader],
+    model_name: str,
+    granularity: str
+) -> Dict[str, Any]:
+    """
+    批量分析中所有导出的流程分析：每个导出作为语料中的一个用户，
+    所有回合调度到共享线程池
+
+    Returns:
+        {'conversations': {dataset_id: [对话摘要]}, 'summary': CorpusFlowAnalyzer.summary()}
+    """
+    with llm_pool.checkout(model_name) as llm_model:
+        analyzer = ConversationFlowAnalyzer(llm_model, cache=turn_cache, local_classifier=local_classifier)
+        corpus = CorpusFlowAnalyzer(analyzer, max_workers=batch_config["max_workers"], granularity=granularity)
+        sources = {
+            dataset_id: ChatDataLoader(loader.data_folder, conversations=conversations[dataset_id])
+            for dataset_id, loader in loaders.items()
+        }
+        summaries: Dict[str, List[Dict[str, Any]]] = {dataset_id: [] for dataset_id in loaders}
+        for item in corpus.analyze(sources, executor=batch_executor):
+            summaries[item['user_id']].append({
+                "conversation_id": item['conversation_id'],
+                "title": item['conversation_title'],
+                "time_bucket": item['time_bucket'],
+                "total_turns": item['total_turns'],
+                "flow_summary": item['flow_summary'],
+            })
+            job.check_cancelled()
+    return {"conversations": summaries, "summary": corpus.summary()}
+
+
+def run_batch_analysis(
+    job: Job,
+    exports: List[Dict[str, str]],
+    analyses: List[str],
+    max_qa_pairs: int,
+    models: Dict[str, str],
+    prescreen: bool,
+    max_conversations: Optional[int],
+    granularity: str,
+    bloom_method: str
+) -> Dict[str, Any]:
+    """
+    批量分析任务（在后台线程中运行）
+
+    每个导出的质量评估与布鲁姆分析是独立任务，所有导出的流程分析回合也逐个提交，
+    都在共享的 batch_executor 中执行；LLM 调用共用 llm_rate_limiter。
+    单个导出的某项分析失败只记录在该导出的 errors 中，不影响其他导出。
+    """
+    entries = {export["dataset_id"]: {**export, "results": {}, "errors": {}} for export in exports}
+    loaders: Dict[str, ChatDataLoader] = {}
+    conversations: Dict[str, List] = {}
+    for dataset_id, entry in entries.items():
+        try:
+            loaders[dataset_id] = dataset_store.loader(dataset_id)
+        except Exception as e:
+            entry["errors"] = {analysis: str(e) for analysis in analyses}
+            continue
+        selected = loaders[dataset_id].load_conversations()
+        conversations[dataset_id] = selected[:max_conversations] if max_conversations else selected
+    
+    completed = 0
+    total = len(loaders) * len(analyses)
+    
+    def record(dataset_id: str, analysis: str, result: Any = None, error: Optional[str] = None):
+        nonlocal completed
+        entry = entries[dataset_id]
+        if error is None:
+            entry["results"][analysis] = result
+        else:
+            entry["errors"][analysis] = error
+        completed += 1
+        job.emit('export', {
+            'dataset_id': dataset_id,
+            'label': entry['label'],
+            'analysis': analysis,
+            'completed': completed,
+            'total': total,
+            'error': error,
+        })
+        job.update_progress(completed, total)
+    
+    def submit(fn, *args):
+        # 在当前上下文的副本中运行，保留激活的阶段追踪
+        return batch_executor.submit(contextvars.copy_context().run, fn, *args)
+    
+    futures = {}
+    for dataset_id, loader in loaders.items():
+        if "quality" in analyses:
+            future = submit(evaluate_export, job, loader, max_qa_pairs, models["quality"], prescreen)
+            futures[future] = (dataset_id, "quality")
+        if "bloom" in analyses:
+            turns = [loader.get_conversation_turns(conv) for conv in conversations[dataset_id]]
+            futures[submit(bloom_export, turns, bloom_method, models["bloom"])] = (dataset_id, "bloom")
+    
+    aggregate: Dict[str, Any] = {}
+    quality_aggregator = MetricAggregator()
+    quality_thresholds: Dict[str, float] = {}
+    try:
+        # 流程分析在本线程中调度回合，与已提交的评估任务共用工作线程
+        if "flow" in analyses and loaders:
+            try:
+                flow = run_batch_flow(job, conversations, loaders, models["flow"], granularity)
+            except JobCancelled:
+                raise
+            except Exception as e:
+                for dataset_id in loaders:
+                    record(dataset_id, "flow", error=str(e))
+            else:
+                summary = flow["summary"]
+                for dataset_id in loaders:
+                    record(dataset_id, "flow", {
+                        "conversations": flow["conversations"][dataset_id],
+                        "summary": summary["by_user"].get(dataset_id, FlowAggregate().to_dict()),
+                    })
+                aggregate["flow"] = {
+                    "granularity": summary["granularity"],
+                    "overall": summary["overall"],
+                    "by_time_bucket": summary["by_time_bucket"],
+                }
+        
+        for future in as_completed(futures):
+            dataset_id, analysis = futures[future]
+            try:
+                result = future.result()
+            except JobCancelled:
+                raise
+            except Exception as e:
+                record(dataset_id, analysis, error=str(e))
+                continue
+            if analysis == "quality":
+                result, aggregator, thresholds = result
+                quality_aggregator.merge(aggregator)
+                quality_thresholds.update(thresholds)
+            record(dataset_id, analysis, result)
+    finally:
+        # 取消（或异常）时不再启动尚未开始的导出
+        for future in futures:
+            future.cancel()
+    
+    if "quality" in analyses:
+        # 合并各导出的在线聚合器：均值、分位数与置信区间按所有问答对计算，而非各导出均值的平均
+        aggregate["quality"] = quality_payload(
+            {"total_qa_pairs": quality_aggregator.total, "summary": quality_aggregator.summary()},
+            quality_thresholds
+        )
+    if "bloom" in analyses:
+        level_counts: Dict[str, int] = {}
+        for entry in entries.values():
+            for level, count in entry["results"].get("bloom", {}).get("level_counts", {}).items():
+                level_counts[level] = level_counts.get(level, 0) + count
+        bloom_total = sum(level_counts.values())
+        aggregate["bloom"] = {
+            "bloom_distribution": {
+                level: round(count / bloom_total * 100, 2) if bloom_total else 0.0
+                for level, count in level_counts.items()
+            },
+            "level_counts": level_counts,
+            "total_turns": bloom_total,
+        }
+    
+    failed = sum(1 for entry in entries.values() if entry["errors"])
+    aggregate["exports"] = len(entries)
+    aggregate["failed_exports"] = failed
+    return {
+        "data": {
+            "analyses": analyses,
+            "exports": list(entries.values()),
+            "aggregate": aggregate,
+        },
+        "message": f"成功分析 {len(entries) - failed}/{len(entries)} 个导出"
+    }
+
+
+async def submit_quality_job(
+    file: Optional[UploadFile],
+    dataset_id: Optional[str],
+    max_qa_pairs: int,
+    model: Optional[str],
+    prescreen: bool,
+    target_ci_width: Optional[float],
+    dedup_threshold: Optional[float],
+    client: str
+) -> Job:
+    """确定数据集（保存上传文件或使用已有 dataset_id）并提交质量评估任务"""
+    # 使用配置中心检查 API Key
+    if not get_api_key():
+        raise HTTPException(
+            status_code=500,
+            detail="未配置 API Key。请在 .env 文件中设置 CHATAIAPI_KEY 或 CHATAI_API_KEY"
+        )
+    if target_ci_width and dedup_threshold:
+        raise HTTPException(status_code=400, detail="target_ci_width（自适应抽样）不能与 dedup_threshold 同时使用")
+    if target_ci_width and max_qa_pairs < ADAPTIVE_MIN_SAMPLES:
+        # 预算小于最少样本数时永远不会检查是否收敛，自适应抽样没有意义
+        raise HTTPException(
+            status_code=400,
+            detail=f"自适应抽样至少评估 {ADAPTIVE_MIN_SAMPLES} 个问答对后才检查置信区间，"
+                   f"请将 max_qa_pairs 设为不小于 {ADAPTIVE_MIN_SAMPLES}"
+        )
+    
+    check_admission(client)
+    dataset_id = await resolve_dataset(file, dataset_id)
+    job = submit_job(
+        "evaluate-quality",
+        run_quality_evaluation,
+        dataset_id,
+        max_qa_pairs,
+        # 使用配置的默认模型（如果未指定）
+        model or get_model_for_task("evaluation"),
+        prescreen,
+        target_ci_width,
+        dedup_threshold,
+        client=client,
+        # max_qa_pairs 同时是自适应抽样的预算上限
+        cost=max_qa_pairs * QUALITY_CALLS_PER_PAIR
+    )
+    job.meta['dataset_id'] = dataset_id
+    return job
+
+
+async def submit_flow_job(
+    file: Optional[UploadFile],
+    dataset_id: Optional[str],
+    model: Optional[str],
+    concurrency: Optional[int],
+    batch_size: Optional[int],
+    topic_shift_mode: Optional[str],
+    scope: str,
+    max_conversations: Optional[int],
+    granularity: str,
+    client: str
+) -> Job:
+    """确定数据集（保存上传文件或使用已有 dataset_id）并提交流程分析任务"""
+    # 使用配置中心检查 API Key
+    if not get_api_key():
+        raise HTTPException(
+            status_code=500,
+            detail="未配置 API Key。请在 .env 文件中设置 CHATAIAPI_KEY 或 CHATAI_API_KEY"
+        )
+    
+    check_admission(client)
+    dataset_id = await resolve_dataset(file, dataset_id)
+    cost = await asyncio.to_thread(projected_flow_calls, dataset_id, scope, max_conversations, batch_size)
+    job = submit_job(
+        "analyze-flow",
+        run_flow_analysis,
+        dataset_id,
+        # 使用配置的默认模型（如果未指定）
+        model or get_model_for_task("flow_analysis"),
+        concurrency,
+        batch_size,
+        topic_shift_mode,
+        scope,
+        max_conversations,
+        granularity,
+        client=client,
+        cost=cost
+    )
+    job.meta['dataset_id'] = dataset_id
+    return job
+
+
+async def submit_batch_job(
+    files: Optional[List[UploadFile]],
+    dataset_ids: Optional[str],
+    analyses: str,
+    max_qa_pairs: int,
+    model: Optional[str],
+    prescreen: bool,
+    max_conversations: Optional[int],
+    granularity: str,
+    bloom_method: str,
+    client: str
+) -> Job:
+    """确定所有导出的数据集（保存上传文件、校验 dataset_id）并提交批量分析任务"""
+    requested = [name.strip() for name in analyses.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in BATCH_ANALYSES]
+    if not requested or unknown:
+        raise HTTPException(status_code=400, detail=f"analyses 必须是 {', '.join(BATCH_ANALYSES)} 中的一个或多个")
+    if bloom_method not in BLOOM_METHODS:
+        raise HTTPException(status_code=400, detail=f"bloom_method 必须是 {', '.join(BLOOM_METHODS)} 之一")
+    if granularity not in TIME_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"granularity 必须是 {', '.join(TIME_BUCKETS)} 之一")
+    
+    files = files or []
+    ids = [part.strip() for part in (dataset_ids or "").split(",") if part.strip()]
+    if not files and not ids:
+        raise HTTPException(status_code=400, detail="请上传 files 或提供 dataset_ids")
+    if len(files) + len(ids) > batch_config["max_exports"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次批量分析最多 {batch_config['max_exports']} 个导出（本次 {len(files) + len(ids)} 个）"
+        )
+    # 布鲁姆分析未配置 API Key 时降级为启发式，质量评估与流程分析必须调用 LLM
+    if ("quality" in requested or "flow" in requested) and not get_api_key():
+        raise HTTPException(
+            status_code=500,
+            detail="未配置 API Key。请在 .env 文件中设置 CHATAIAPI_KEY 或 CHATAI_API_KEY"
+        )
+    
+    check_admission(client)
+    exports: Dict[str, Dict[str, str]] = {}
+    for file in files:
+        dataset_id = await resolve_dataset(file, None)
+        exports.setdefault(dataset_id, {"dataset_id": dataset_id, "label": file.filename or dataset_id})
+    for dataset_id in ids:
+        dataset_id = await resolve_dataset(None, dataset_id)
+        exports.setdefault(dataset_id, {"dataset_id": dataset_id, "label": dataset_id})
+    
+    models = {
+        # 使用配置的默认模型（如果未指定）
+        "quality": model or get_model_for_task("evaluation"),
+        "flow": model or get_model_for_task("flow_analysis"),
+        "bloom": model or get_model_for_task("bloom"),
+    }
+    cost = await asyncio.to_thread(
+        projected_batch_calls, list(exports), requested, max_qa_pairs, max_conversations, bloom_method
+    )
+    job = submit_job(
+        "analyze-batch",
+        run_batch_analysis,
+        list(exports.values()),
+        requested,
+        max_qa_pairs,
+        models,
+        prescreen,
+        max_conversations,
+        granularity,
+        bloom_method,
+        client=client,
+        cost=cost
+    )
+    job.meta['dataset_ids'] = list(exports)
+    return job
+
+
+def projected_flow_calls(
+    dataset_id: str,
+    scope: str,
+    max_conversations: Optional[int],
+    batch_size: Optional[int]
+) -> int:
+    """估算流程分析的 LLM 调用数：每个回合一次（批量模式每批一次），不扣除缓存命中"""
+    conversations = dataset_store.loader(dataset_id).load_conversations()
+    if not conversations:
+        return 1
+    if scope == "corpus":
+        selected = conversations[:max_conversations] if max_conversations else conversations
+    else:
+        selected = [max(conversations, key=lambda c: len(c.messages))]
+    turns = [max(1, len(conv.messages) // 2) for conv in selected]
+    if batch_size:
+        return sum(math.ceil(n / batch_size) for n in turns)
+    return sum(turns)
+
+
+def projected_batch_calls(
+    dataset_ids: List[str],
+    analyses: List[str],
+    max_qa_pairs: int,
+    max_conversations: Optional[int],
+    bloom_method: str
+) -> int:
+    """估算批量分析的 LLM 调用数（各导出之和，布鲁姆复核按全部问题打包计算）"""
+    bloom_batch_size = LLMConfig.get_bloom_config()["batch_size"]
+    calls = 0
+    for dataset_id in dataset_ids:
+        if "quality" in analyses:
+            calls += max_qa_pairs * QUALITY_CALLS_PER_PAIR
+        if "flow" not in analyses and ("bloom" not in analyses or bloom_method == "heuristic"):
+            continue
+        turns = projected_flow_calls(dataset_id, "corpus", max_conversations, None)
+        if "flow" in analyses:
+            calls += turns
+        if "bloom" in analyses and bloom_method != "heuristic":
+            calls += math.ceil(turns / bloom_batch_size)
+    return calls
+
+
+def client_id(request: Request) -> str:
+    """准入控制使用的客户端标识：X-Client-ID 请求头，未提供时使用来源 IP"""
+    return request.headers.get("x-client-id") or (request.client.host if request.client else "anonymous")
+
+
+def too_many_requests(e: JobQueueFull) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(math.ceil(e.retry_after))}
+    )
+
+
+def check_admission(client: str):
+    """读取上传文件前快速检查准入，已饱和时直接返回 429"""
+    try:
+        job_manager.check_admission(client)
+    except JobQueueFull as e:
+        raise too_many_requests(e)
+
+
+def submit_job(kind: str, fn, *args, cleanup=None, client: str = "anonymous", cost: int = 1) -> Job:
+    """提交任务；被准入控制拒绝时先执行清理再返回 429（附带 Retry-After）"""
+    try:
+        return job_manager.submit(kind, fn, *args, cleanup=cleanup, client=client, cost=cost)
+    except JobQueueFull as e:
+        if cleanup is not None:
+            cleanup()
+        raise too_many_requests(e)
+
+
+async def wait_for_job(job: Job) -> Dict[str, Any]:
+    """
+    在不阻塞事件循环的情况下等待任务结束，返回任务结果
+
+    Raises:
+        JobCancelled: 等待期间任务被取消（DELETE /api/jobs/{job_id}），调用方返回 job_error_response
+    """
+    await asyncio.wrap_future(job.future)
+    if job.status == CANCELLED:
+        raise JobCancelled(f"任务 {job.id} 已取消")
+    if job.status != SUCCEEDED:
+        raise RuntimeError(job.error or f"任务已{job.status}")
+    return job.result
 
 
-def parse_conversations_data(file_path: Path) -> List[Dict]:
-    """解析对话数据文件"""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    return data
+def job_error_response(job: Job) -> JSONResponse:
+    """任务失败或已取消时的响应：500 / 410，附带任务状态与错误信息"""
+    return JSONResponse(status_code=500 if job.status == FAILED else 410, content={
+        "success": False,
+        "data": job.to_dict(),
+        "message": job.error or "任务已取消"
+    })
 
 
 # ============ API 端点 ============
@@ -102,6 +1017,12 @@ async def root():
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus 指标（文本格式）"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/api/health", response_model=HealthResponse)
 async def health_check():
     """健康检查"""
@@ -113,265 +1034,616 @@ async def health_check():
     }
 
 
+@app.get("/api/pools")
+async def pool_stats():
+    """LLM 客户端池与评估器池的大小与 checkout 延迟统计"""
+    return {
+        "success": True,
+        "data": {
+            "llm_clients": llm_pool.stats(),
+            "evaluators": evaluator_pool.stats(),
+        }
+    }
+
+
+@app.post("/api/datasets", status_code=201)
+async def upload_dataset(file: UploadFile = File(...)):
+    """
+    上传数据集
+    
+    上传一次 conversations.json，之后的质量评估、流程分析、布鲁姆分析等请求通过
+    dataset_id 引用，不必重复上传和解析。数据集 ID 为文件内容的 SHA-256，
+    重复上传相同内容返回同一个 ID。
+    
+    返回:
+    - dataset_id、文件大小与有效对话数
+    """
+    dataset_id = await resolve_dataset(file, None)
+    try:
+        # 立即解析：既校验文件格式，也让后续分析直接命中解析缓存
+        await asyncio.to_thread(dataset_store.loader, dataset_id)
+    except Exception as e:
+        dataset_store.delete(dataset_id)
+        raise HTTPException(status_code=400, detail=f"无法解析 conversations.json: {str(e)}")
+    return JSONResponse(status_code=201, content={
+        "success": True,
+        "data": dataset_store.info(dataset_id),
+        "message": "数据集已上传"
+    })
+
+
+@app.get("/api/datasets")
+async def list_datasets():
+    """列出所有未过期的数据集及解析缓存统计"""
+    return {
+        "success": True,
+        "data": {
+            "datasets": dataset_store.list(),
+            "cache": dataset_store.stats(),
+        }
+    }
+
+
+@app.get("/api/datasets/{dataset_id}")
+async def get_dataset(dataset_id: str):
+    """查询数据集信息"""
+    try:
+        return {"success": True, "data": dataset_store.info(dataset_id)}
+    except DatasetNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.delete("/api/datasets/{dataset_id}")
+async def delete_dataset(dataset_id: str):
+    """删除数据集"""
+    if not dataset_store.delete(dataset_id):
+        raise HTTPException(status_code=404, detail=f"数据集不存在: {dataset_id}")
+    return {"success": True, "message": "数据集已删除"}
+
+
 @app.post("/api/evaluate-quality")
 async def evaluate_quality(
-    file: UploadFile = File(...),
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = None,
     max_qa_pairs: int = 3,
-    model: str = None  # 默认使用配置中心的评估模型
+    model: str = None,  # 默认使用配置中心的评估模型
+    prescreen: bool = False,
+    target_ci_width: Optional[float] = None,
+    dedup_threshold: Optional[float] = None,
+    shape: ResponseShape = Depends(response_shape)
 ):
     """
     评估对话质量
     
-    使用 deepeval 和 LLM 对对话进行多维度质量评估
+    使用 deepeval 和 LLM 对对话进行多维度质量评估。评估在后台任务线程中执行，
+    不阻塞其他请求；需要立即返回任务 ID 时使用 POST /api/jobs/evaluate-quality。
     
     参数:
     - file: conversations.json 文件
+    - dataset_id: 已通过 /api/datasets 上传的数据集 ID（代替 file，不必重复上传）
     - max_qa_pairs: 评估的问答对数量（默认3，防止成本过高）
     - model: 使用的 LLM 模型（默认使用硅基流动免费模型）
+    - prescreen: 是否对毒性/偏见启用本地预筛（确定干净/确定有问题的回答不再调用 LLM）
+    - target_ci_width: 设置后启用自适应抽样，随机评估问答对直到各指标置信区间宽度达标，
+      此时 max_qa_pairs 作为预算上限（不得小于 5）
+    - dedup_threshold: 设置后启用近重复去重（Jaccard 相似度阈值，例如 0.9），
+      近重复问答对只评估一次并复用分数（不能与 target_ci_width 同时使用）
+    - fields / exclude / include_text / offset / limit: 裁剪响应（如 exclude=raw 或 include_text=false），
+      offset/limit 对 raw.results 分页
     
     返回:
     - 评估结果包括相关性、有用性、连贯性、同理心、毒性、偏见等指标
     """
+    trace = request_trace(request, "evaluate-quality")
     try:
-        # 使用配置中心检查 API Key
-        api_key = get_api_key()
-        if not api_key:
-            raise HTTPException(
-                status_code=500,
-                detail="未配置 API Key。请在 .env 文件中设置 CHATAIAPI_KEY 或 CHATAI_API_KEY"
+        with activate(trace):
+            job = await submit_quality_job(
+                file, dataset_id, max_qa_pairs, model, prescreen, target_ci_width, dedup_threshold,
+                client_id(request)
             )
-        
-        # 保存上传的文件（固定文件名为 conversations.json）
-        content = await file.read()
-        temp_file = save_temp_file(content, "conversations.json")
-        
-        # 获取文件所在目录
-        data_folder = temp_file.parent
-        
-        # 使用配置的默认模型（如果未指定）
-        model = model or get_model_for_task("evaluation")
-        
-        # 创建评估器
-        evaluator = ChatQualityEvaluator(
-            str(data_folder),
-            model=model,
-            use_custom_api=True
+        result = await wait_for_job(job)
+        return await json_response(
+            with_timings({"success": True, "dataset_id": job.meta['dataset_id'], **result}, trace),
+            shape, PAGE_KEYS["evaluate-quality"]
         )
         
-        # 执行评估
-        results = evaluator.evaluate_conversation(
-            max_qa_pairs=max_qa_pairs
-        )
-
-        # === 适配前端预期的数据结构 (QualityEvaluationResult) ===
-        summary_metrics = results.get('summary', {}).get('metrics', {})
-
-        def metric_entry(name: str):
-            m = summary_metrics.get(name)
-            if not m:
-                return None
-            score = m.get('average_score', 0)
-            threshold = getattr(evaluator.metrics.get(name), 'threshold', 0)
-            # 对毒性/偏见类指标采用“越低越好”的通过逻辑
-            if name in ['toxicity', 'bias']:
-                passed = score <= threshold if threshold else True
-            else:
-                passed = score >= threshold if threshold else True
-            return {
-                'score': score,
-                'threshold': threshold,
-                'passed': passed,
-            }
-
-        metrics_payload = {
-            'relevancy': metric_entry('relevancy'),
-            'helpfulness': metric_entry('helpfulness'),
-            'coherence': metric_entry('coherence'),
-            'toxicity': metric_entry('toxicity'),
-            'bias': metric_entry('bias'),
-        }
-
-        # 前端用于可视化的整体得分（保持与前端计算方式一致）
-        def safe_score(entry, inverse=False):
-            if not entry or entry.get('score') is None:
-                return 0
-            return (1 - entry['score']) if inverse else entry['score']
-
-        average_score = (
-            safe_score(metrics_payload['relevancy']) +
-            safe_score(metrics_payload['helpfulness']) +
-            safe_score(metrics_payload['coherence']) +
-            safe_score(metrics_payload['toxicity'], inverse=True) +
-            safe_score(metrics_payload['bias'], inverse=True)
-        ) / 5
-
-        response_payload = {
-            'pairs_evaluated': results.get('total_qa_pairs', 0),
-            'metrics': metrics_payload,
-            'average_score': average_score,
-            # 兼容字段：保留原始结果以便调试或下载
-            'raw': results,
-        }
-
-        # 清理临时文件
-        temp_file.unlink()
-
-        return JSONResponse(content={
-            "success": True,
-            "data": response_payload,
-            "message": f"成功评估 {max_qa_pairs} 个问答对"
-        })
-        
+    except HTTPException:
+        raise
+    except JobCancelled:
+        return job_error_response(job)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"评估失败: {str(e)}")
 
 
 @app.post("/api/analyze-flow")
 async def analyze_flow(
-    file: UploadFile = File(...),
-    model: str = None  # 支持指定模型，默认使用配置中心的流程分析模型
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = None,
+    model: str = None,  # 支持指定模型，默认使用配置中心的流程分析模型
+    concurrency: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    topic_shift_mode: Optional[str] = None,
+    scope: str = "longest",
+    max_conversations: Optional[int] = None,
+    granularity: str = "month",
+    shape: ResponseShape = Depends(response_shape)
 ):
     """
     分析对话流程
     
-    识别对话模式、问题类型分布、对话长度趋势等
+    识别对话模式、问题类型分布、对话长度趋势等。分析在后台任务线程中执行，
+    不阻塞其他请求；需要立即返回任务 ID 时使用 POST /api/jobs/analyze-flow。
     
     参数:
     - file: conversations.json 文件
+    - dataset_id: 已通过 /api/datasets 上传的数据集 ID（代替 file，不必重复上传）
     - model: 使用的 LLM 模型（默认使用硅基流动免费模型）
+    - concurrency: 并发分析的回合数上限（默认读取 CHATAI_MAX_CONCURRENCY）
+    - batch_size: 设置后每次 LLM 请求批量分析最多 batch_size 个连续回合
+    - topic_shift_mode: 词汇话题转移检测（fill: 直接填充话题转移/承接判断，cross_check: 与 LLM 判断对照）
+    - scope: longest 只分析最长的对话；corpus 分析文件中的所有对话并返回整体/按时间段的分布
+    - max_conversations: corpus 模式下最多分析的对话数
+    - granularity: corpus 模式的时间段粒度（day / week / month）
+    - fields / exclude / include_text / offset / limit: 裁剪响应（如 exclude=_raw 或 include_text=false），
+      offset/limit 对 turns（corpus 模式为 conversations）分页
     
     返回:
     - 流程分析结果包括问题类型分布、对话长度统计等
     """
+    trace = request_trace(request, "analyze-flow")
     try:
-        # 使用配置中心检查 API Key
-        api_key = get_api_key()
-        if not api_key:
-            raise HTTPException(
-                status_code=500,
-                detail="未配置 API Key。请在 .env 文件中设置 CHATAIAPI_KEY 或 CHATAI_API_KEY"
+        with activate(trace):
+            job = await submit_flow_job(
+                file, dataset_id, model, concurrency, batch_size, topic_shift_mode, scope, max_conversations,
+                granularity, client_id(request)
             )
-        
-        # 保存上传的文件（固定文件名为 conversations.json）
-        content = await file.read()
-        temp_file = save_temp_file(content, "conversations.json")
-        
-        # 解析数据
-        conversations_data = parse_conversations_data(temp_file)
-        
-        # 找到最长的对话
-        longest_conv = max(
-            conversations_data,
-            key=lambda c: len([n for n in c.get('mapping', {}).values() 
-                              if n.get('message')])
+        result = await wait_for_job(job)
+        return await json_response(
+            with_timings({"success": True, "dataset_id": job.meta['dataset_id'], **result}, trace),
+            shape, PAGE_KEYS["analyze-flow"]
         )
         
-        # 使用配置的默认模型（如果未指定）
-        model_name = model or get_model_for_task("flow_analysis")
-        
-        # 创建 LLM 模型
-        llm_model = ChatAIAPIModel(api_key=api_key, model=model_name)
-        
-        # 创建分析器
-        analyzer = ConversationFlowAnalyzer(llm_model)
-        
-        # 提取对话回合
-        # 这里需要实现提取逻辑，简化版：
-        from core.data_loader import ChatDataLoader
-        
-        loader = ChatDataLoader(str(temp_file.parent))
-        conversations = loader.load_conversations()
-        
-        if not conversations:
-            raise HTTPException(status_code=400, detail="未找到有效对话")
-        
-        # 选择最长的对话
-        conv = max(conversations, key=lambda c: len(c.messages))
-        
-        # 转换为分析格式
-        turns = []
-        for i in range(0, len(conv.messages) - 1, 2):
-            if i + 1 < len(conv.messages):
-                user_msg = conv.messages[i]
-                assistant_msg = conv.messages[i + 1]
-                
-                if user_msg.role == 'user' and assistant_msg.role == 'assistant':
-                    turns.append({
-                        "question": user_msg.content,
-                        "answer": assistant_msg.content
-                    })
+    except HTTPException:
+        raise
+    except JobCancelled:
+        return job_error_response(job)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"流程分析失败: {str(e)}")
+
+
+@app.post("/api/analyze-batch")
+async def analyze_batch(
+    request: Request,
+    files: Optional[List[UploadFile]] = File(None),
+    dataset_ids: Optional[str] = None,
+    analyses: str = "quality,flow",
+    max_qa_pairs: int = 3,
+    model: str = None,
+    prescreen: bool = False,
+    max_conversations: Optional[int] = None,
+    granularity: str = "month",
+    bloom_method: str = "heuristic",
+    shape: ResponseShape = Depends(response_shape)
+):
+    """
+    批量分析多个导出
+    
+    一次请求分析多个 conversations.json（如一个班级所有学生的导出），返回每个导出的结果和跨导出的汇总。
+    所有批量任务共用 BATCH_MAX_WORKERS 个工作线程，LLM 调用共用 CHATAI_RATE_LIMIT_RPM 限速；
+    需要立即返回任务 ID 时使用 POST /api/jobs/analyze-batch。
+    
+    参数:
+    - files: 多个 conversations.json 文件（每个文件为一个导出）
+    - dataset_ids: 已通过 /api/datasets 上传的数据集 ID（逗号分隔，可与 files 同时使用，重复的导出只分析一次）
+    - analyses: 要进行的分析（逗号分隔）：quality / flow / bloom
+    - max_qa_pairs: 每个导出评估的问答对数量（默认3）
+    - model: 使用的 LLM 模型（默认按分析类型使用配置中心的模型）
+    - prescreen: 质量评估是否对毒性/偏见启用本地预筛
+    - max_conversations: 每个导出最多分析的对话数（流程分析与布鲁姆分析）
+    - granularity: 流程分析汇总的时间段粒度（day / week / month）
+    - bloom_method: 布鲁姆分析方法（heuristic / llm / hybrid，默认 heuristic）
+    - fields / exclude / include_text / offset / limit: 裁剪响应（如 exclude=exports.results.quality.raw），
+      offset/limit 对 exports 分页
+    
+    返回:
+    - exports: 每个导出的 dataset_id、label、results（各项分析结果）与 errors（失败的分析及原因）
+    - aggregate: 跨导出汇总（质量指标按所有问答对合并计算、整体与按时间段的流程分布、布鲁姆层级分布）
+    """
+    trace = request_trace(request, "analyze-batch")
+    try:
+        with activate(trace):
+            job = await submit_batch_job(
+                files, dataset_ids, analyses, max_qa_pairs, model, prescreen, max_conversations, granularity,
+                bloom_method, client_id(request)
+            )
+        result = await wait_for_job(job)
+        return await json_response(
+            with_timings({"success": True, **result}, trace), shape, PAGE_KEYS["analyze-batch"]
+        )
         
-        # 执行分析（原始结果）
-        result = analyzer.analyze_conversation_flow(
-            turns,
-            conversation_title=conv.title
+    except HTTPException:
+        raise
+    except JobCancelled:
+        return job_error_response(job)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"批量分析失败: {str(e)}")
+
+
+@app.post("/api/jobs/evaluate-quality", status_code=202)
+async def create_quality_job(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = None,
+    max_qa_pairs: int = 3,
+    model: str = None,
+    prescreen: bool = False,
+    target_ci_width: Optional[float] = None,
+    dedup_threshold: Optional[float] = None
+):
+    """提交质量评估后台任务，立即返回任务 ID（参数同 /api/evaluate-quality）"""
+    with activate(request_trace(request, "evaluate-quality")):
+        job = await submit_quality_job(
+            file, dataset_id, max_qa_pairs, model, prescreen, target_ci_width, dedup_threshold,
+            client_id(request)
         )
+    return JSONResponse(status_code=202, content={
+        "success": True,
+        "data": job.to_dict(),
+        "message": "质量评估任务已提交"
+    })
 
-        # ========== 适配前端所需结构 ==========
-        # 构造带 question_type 的前端 turns
-        turn_analysis = result.get('turn_analysis', [])
-        frontend_turns = []
-        for i, t in enumerate(turns):
-            qtype = 'other'
-            if i < len(turn_analysis):
-                qtype = turn_analysis[i].get('question_type', 'other') or 'other'
-            frontend_turns.append({
-                "question": t.get('question', ''),
-                "answer": t.get('answer', ''),
-                "question_type": qtype,
-                "turn_number": i + 1
-            })
 
-        # 统计与均值
-        total_turns = len(frontend_turns)
-        avg_question_length = (
-            sum(len(t.get('question', '') or '') for t in frontend_turns) / total_turns
-            if total_turns > 0 else 0
+@app.post("/api/jobs/analyze-flow", status_code=202)
+async def create_flow_job(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = None,
+    model: str = None,
+    concurrency: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    topic_shift_mode: Optional[str] = None,
+    scope: str = "longest",
+    max_conversations: Optional[int] = None,
+    granularity: str = "month"
+):
+    """提交流程分析后台任务，立即返回任务 ID（参数同 /api/analyze-flow）"""
+    with activate(request_trace(request, "analyze-flow")):
+        job = await submit_flow_job(
+            file, dataset_id, model, concurrency, batch_size, topic_shift_mode, scope, max_conversations,
+            granularity, client_id(request)
         )
-        avg_response_length = (
-            sum(len(t.get('answer', '') or '') for t in frontend_turns) / total_turns
-            if total_turns > 0 else 0
+    return JSONResponse(status_code=202, content={
+        "success": True,
+        "data": job.to_dict(),
+        "message": "流程分析任务已提交"
+    })
+
+
+@app.post("/api/jobs/analyze-batch", status_code=202)
+async def create_batch_job(
+    request: Request,
+    files: Optional[List[UploadFile]] = File(None),
+    dataset_ids: Optional[str] = None,
+    analyses: str = "quality,flow",
+    max_qa_pairs: int = 3,
+    model: str = None,
+    prescreen: bool = False,
+    max_conversations: Optional[int] = None,
+    granularity: str = "month",
+    bloom_method: str = "heuristic"
+):
+    """提交批量分析后台任务，立即返回任务 ID（参数同 /api/analyze-batch）"""
+    with activate(request_trace(request, "analyze-batch")):
+        job = await submit_batch_job(
+            files, dataset_ids, analyses, max_qa_pairs, model, prescreen, max_conversations, granularity,
+            bloom_method, client_id(request)
         )
-        question_type_counts: Dict[str, int] = {}
-        for t in frontend_turns:
-            qt = t.get('question_type') or 'other'
-            question_type_counts[qt] = question_type_counts.get(qt, 0) + 1
+    return JSONResponse(status_code=202, content={
+        "success": True,
+        "data": job.to_dict(),
+        "message": "批量分析任务已提交"
+    })
 
-        frontend_data = {
-            "conversation_id": None,
-            "total_turns": total_turns,
-            "turns": frontend_turns,
-            "summary": {
-                "question_type_counts": question_type_counts,
-                "avg_question_length": avg_question_length,
-                "avg_response_length": avg_response_length,
-                "total_turns": total_turns,
-            },
-            "cached": False,
-            # 附带原始结果，便于调试（前端无需依赖）
-            "_raw": {
-                "flow_summary": result.get('flow_summary', {}),
-                "turn_analysis": turn_analysis,
-            }
+
+@app.get("/api/jobs")
+async def list_jobs():
+    """列出所有未过期的任务及各状态计数"""
+    return {
+        "success": True,
+        "data": {
+            "jobs": [job.to_dict() for job in job_manager.list()],
+            "stats": job_manager.stats(),
         }
-        
-        # 清理临时文件
-        temp_file.unlink()
-        
-        return JSONResponse(content={
-            "success": True,
-            "data": frontend_data,
-            "message": f"成功分析对话流程，包含 {len(turns)} 个回合"
-        })
-        
+    }
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询任务状态与进度"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return {"success": True, "data": job.to_dict()}
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    以 Server-Sent Events 推送任务进度
+    
+    事件类型:
+    - status: 任务开始运行
+    - pair: 质量评估每完成一个问答对 {index, total, result}
+    - turn: 流程分析每得到一个回合分类 {completed, total, turn}
+    - conversation: corpus 模式每完成一个对话的流程摘要
+    - export: 批量分析每完成一个导出的一项分析 {dataset_id, label, analysis, completed, total, error}
+    - summary / error / cancelled: 最后一个事件，summary 附带与同步端点相同的 {data, message}
+    
+    断线重连时浏览器会携带 Last-Event-ID，从下一个事件继续推送。
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    try:
+        cursor = int(last_event_id) + 1 if last_event_id is not None else 0
+    except ValueError:
+        cursor = 0
+    
+    async def event_stream():
+        nonlocal cursor
+        idle = 0.0
+        while True:
+            events = job.events_since(cursor)
+            for event in events:
+                payload = json.dumps(event['data'], ensure_ascii=False, default=str)
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {payload}\n\n"
+                cursor = event['id'] + 1
+                if event['event'] in TERMINAL_EVENTS:
+                    return
+            if events:
+                idle = 0.0
+                continue
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(SSE_POLL_INTERVAL)
+            idle += SSE_POLL_INTERVAL
+            if idle >= SSE_HEARTBEAT_INTERVAL:
+                # 注释行作为心跳，防止代理因空闲断开连接
+                yield ": heartbeat\n\n"
+                idle = 0.0
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str, shape: ResponseShape = Depends(response_shape)):
+    """
+    获取任务结果
+    
+    - 任务成功：返回与同步端点相同的结构（提交时带有 X-Debug-Timings 请求头则附带 timings），
+      支持与同步端点相同的 fields / exclude / include_text / offset / limit 参数
+    - 任务仍在排队/运行：409
+    - 任务失败或已取消：返回任务状态与错误信息
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    if job.status in ACTIVE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"任务尚未完成（{job.status}）")
+    if job.status != SUCCEEDED:
+        return job_error_response(job)
+    return await json_response(
+        with_timings({"success": True, **job.result}, job.trace), shape, PAGE_KEYS.get(job.kind, ())
+    )
+
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """取消任务（运行中的任务在完成当前问答对/回合后中止）"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return {"success": True, "data": job.to_dict(), "message": "已请求取消任务"}
+
+
+def run_bloom_job(job: Job, analyzer: BloomAnalyzer, conversation_turns, result: Dict[str, Any]) -> Dict[str, Any]:
+    """布鲁姆分析任务（wait=True，在后台线程中运行）：复核请求中得到的待复核问题，返回完整结果"""
+    result = analyzer.refine_result(conversation_turns, result)
+    result['refinement'].pop('pending_turns')
+    return {
+        "data": result,
+        "message": f"成功分析 {result['total_turns']} 个问题的布鲁姆层级"
+    }
+
+
+def run_bloom_refinement(job: Job, analyzer: BloomAnalyzer, conversation_turns, pending_turns) -> Dict[str, Any]:
+    """布鲁姆复核任务（wait=False，在后台线程中运行）：复核低置信度问题并写入缓存"""
+    refined = analyzer.refine(conversation_turns, pending_turns)
+    return {
+        "data": {"pending": len(pending_turns), "refined": refined},
+        "message": f"复核了 {refined}/{len(pending_turns)} 个问题"
+    }
+
+
+@app.post("/api/bloom")
+@app.post("/api/analyze-bloom")
+async def analyze_bloom(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = None,
+    model: str = None,
+    method: str = "hybrid",
+    scope: str = "longest",
+    max_conversations: Optional[int] = None,
+    wait: bool = False,
+    confidence_threshold: Optional[float] = None,
+    batch_size: Optional[int] = None,
+    shape: ResponseShape = Depends(response_shape)
+):
+    """
+    布鲁姆认知层级分析
+    
+    先用启发式关键词引擎分类所有问题，再把低置信度问题按批打包交给 LLM 复核。
+    
+    参数:
+    - file: conversations.json 文件
+    - dataset_id: 已通过 /api/datasets 上传的数据集 ID（代替 file，不必重复上传）
+    - model: 复核使用的 LLM 模型（默认使用配置中心的通用模型）
+    - method: heuristic 只用启发式；llm 全部交给 LLM；hybrid 只复核低置信度问题（默认）
+    - scope: longest 只分析最长的对话；corpus 分析文件中的所有对话
+    - max_conversations: corpus 模式下最多分析的对话数
+    - wait: False（默认）立即返回启发式/缓存结果，复核作为后台任务提交（refinement.job_id），
+      完成后重新请求即得到修正结果；True 等待复核任务完成后返回
+      （两种方式的复核都经过任务管理器的准入控制，饱和时返回 429）
+    - confidence_threshold: hybrid 模式的置信度阈值（默认读取 BLOOM_LLM_CONFIDENCE）
+    - batch_size: 每次 LLM 请求最多打包的问题数（默认读取 BLOOM_BATCH_SIZE）
+    - fields / exclude / include_text / offset / limit: 裁剪响应，offset/limit 对 turns 分页
+    
+    返回:
+    - 层级分布、示例、逐问题结果以及复核状态（refinement.status 为 pending 时表示后台仍在复核）
+    """
+    trace = request_trace(request, "analyze-bloom")
+    try:
+        with activate(trace):
+            content = await run_bloom_analysis(
+                file, dataset_id, model, method, scope, max_conversations, wait,
+                confidence_threshold, batch_size, client_id(request)
+            )
+        if isinstance(content, JSONResponse):
+            return content
+        return await json_response(with_timings(content, trace), shape, PAGE_KEYS["analyze-bloom"])
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"流程分析失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"布鲁姆层级分析失败: {str(e)}")
+
+
+async def run_bloom_analysis(
+    file: Optional[UploadFile],
+    dataset_id: Optional[str],
+    model: Optional[str],
+    method: str,
+    scope: str,
+    max_conversations: Optional[int],
+    wait: bool,
+    confidence_threshold: Optional[float],
+    batch_size: Optional[int],
+    client: str
+) -> Union[Dict[str, Any], JSONResponse]:
+    """
+    布鲁姆层级分析（/api/analyze-bloom 的实现），返回响应内容
+
+    启发式/缓存结果在请求中直接计算，需要 LLM 复核的问题作为任务提交给 job_manager，
+    预计调用数为 ceil(待复核问题数 / batch_size)；等待的任务被取消时返回 job_error_response。
+    """
+    if method not in BLOOM_METHODS:
+        raise HTTPException(status_code=400, detail=f"method 必须是 {', '.join(BLOOM_METHODS)} 之一")
+    use_llm = method != "heuristic" and bool(get_api_key())
+    if use_llm:
+        check_admission(client)
+    
+    # 使用数据集存储中缓存的解析结果（首次访问时在线程中解析）
+    dataset_id = await resolve_dataset(file, dataset_id)
+    loader = await asyncio.to_thread(dataset_store.loader, dataset_id)
+    conversations = loader.load_conversations()
+    if not conversations:
+        raise HTTPException(status_code=400, detail="未找到有效对话")
+    
+    if scope == "corpus":
+        selected = conversations[:max_conversations] if max_conversations else conversations
+    else:
+        selected = [max(conversations, key=lambda c: len(c.messages))]
+    conversation_turns = [loader.get_conversation_turns(conv) for conv in selected]
+    
+    # 未配置 API Key 时降级为纯启发式分类；LLM 模型从客户端池取出，复核结束后归还
+    model_name = model or get_model_for_task("bloom")
+    llm_model = llm_pool.acquire(model_name) if use_llm else None
+    
+    def release_model():
+        if llm_model is not None:
+            llm_pool.release(model_name, llm_model)
+    
+    try:
+        analyzer = BloomAnalyzer(
+            llm_model,
+            cache=bloom_cache,
+            confidence_threshold=confidence_threshold,
+            batch_size=batch_size
+        )
+        # 先只做启发式分类和缓存查询（不调用 LLM），得到需要复核的问题
+        effective_method = method if llm_model is not None else "heuristic"
+        result = await asyncio.to_thread(analyzer.analyze, conversation_turns, method=effective_method, wait=False)
+    except BaseException:
+        release_model()
+        raise
+    
+    pending_turns = result['refinement']['pending_turns']
+    if pending_turns:
+        # LLM 客户端交给任务，任务结束（或被拒绝）时归还
+        cost = math.ceil(len(pending_turns) / analyzer.batch_size)
+        if wait:
+            job = submit_job(
+                "analyze-bloom", run_bloom_job, analyzer, conversation_turns, result,
+                cleanup=release_model, client=client, cost=cost
+            )
+            job.meta['dataset_id'] = dataset_id
+            try:
+                result = (await wait_for_job(job))["data"]
+            except JobCancelled:
+                return job_error_response(job)
+        else:
+            job = submit_job(
+                "refine-bloom", run_bloom_refinement, analyzer, conversation_turns, pending_turns,
+                cleanup=release_model, client=client, cost=cost
+            )
+            job.meta['dataset_id'] = dataset_id
+            result['refinement']['job_id'] = job.id
+    else:
+        release_model()
+    result['refinement'].pop('pending_turns', None)
+    result['conversations'] = [
+        {"conversation_id": conv.conversation_id, "title": conv.title, "total_turns": len(turns)}
+        for conv, turns in zip(selected, conversation_turns)
+    ]
+    
+    return {
+        "success": True,
+        "dataset_id": dataset_id,
+        "data": result,
+        "message": f"成功分析 {result['total_turns']} 个问题的布鲁姆层级"
+    }
+
+
+def render_html_report(directory: Path, analysis_data: Dict[str, Any]) -> str:
+    """在 directory 中保存分析数据并生成 HTML 报告，返回报告内容"""
+    from utils.generate_flow_report import generate_html_report
+    
+    analysis_file = directory / "analysis.json"
+    with open(analysis_file, 'w', encoding='utf-8') as f:
+        json.dump(analysis_data, f, ensure_ascii=False, indent=2)
+    
+    output_file = directory / "report.html"
+    generate_html_report(str(analysis_file), str(output_file))
+    with open(output_file, 'r', encoding='utf-8') as f:
+        return f.read()
 
 
 @app.post("/api/generate-report")
 async def generate_report(
+    request: Request,
     analysis_data: Dict = Body(...),
-    report_type: str = "html"
+    report_type: str = "html",
+    embed: bool = True
 ):
     """
     生成分析报告
@@ -381,43 +1653,30 @@ async def generate_report(
     参数:
     - analysis_data: 分析数据（来自 analyze-flow 的结果）
     - report_type: 报告类型（html/json）
+    - embed: html 报告默认嵌在 JSON 中返回；False 时直接返回 text/html，省去整份文档的 JSON 转义
     
     返回:
     - 生成的报告内容
     """
+    trace = request_trace(request, "generate-report")
     try:
         if report_type == "html":
-            from utils.generate_flow_report import generate_html_report
-            
-            # 保存临时分析数据
-            temp_dir = Path("temp")
-            temp_dir.mkdir(exist_ok=True)
+            # 每个请求使用独立的工作目录（并发请求互不覆盖，异常退出时同样删除），在线程中生成报告
+            async with UploadWorkspace() as workspace:
+                with activate(trace):
+                    html_content = await asyncio.to_thread(render_html_report, workspace.path, analysis_data)
             
-            temp_json = temp_dir / "analysis.json"
-            with open(temp_json, 'w', encoding='utf-8') as f:
-                json.dump(analysis_data, f, ensure_ascii=False, indent=2)
-            
-            # 生成 HTML 报告
-            output_file = temp_dir / "report.html"
-            generate_html_report(str(temp_json), str(output_file))
-            
-            # 读取报告内容
-            with open(output_file, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-            
-            # 清理临时文件
-            temp_json.unlink()
-            output_file.unlink()
-            
-            return JSONResponse(content={
+            if not embed:
+                return HTMLResponse(html_content)
+            return await json_response(with_timings({
                 "success": True,
                 "data": {
                     "html": html_content
                 },
                 "message": "报告生成成功"
-            })
+            }, trace))
         else:
-            return JSONResponse(content={
+            return await json_response({
                 "success": True,
                 "data": analysis_data,
                 "message": "JSON 格式报告"
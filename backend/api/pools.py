@@ -0,0 +1,173 @@
+"""
+LLM 客户端 / 评估器对象池 - 跨请求复用，按模型区分
+
+每个请求都新建 ChatAIAPIModel（新的 requests.Session，没有可复用的连接）和
+ChatQualityEvaluator（重建全部 deepeval 指标）。KeyedPool 按模型缓存空闲对象：
+- checkout 期间对象由当前请求独占，归还时执行 reset 清空单次请求的状态
+- 归还后保留在池中，下一个请求直接复用（HTTP 连接保持 keep-alive）
+- 每个模型最多保留 max_idle 个空闲对象，多余的关闭丢弃
+- 统计每个模型的空闲/使用中/已创建数量以及 checkout 延迟（含新建对象的耗时）
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from utils.metrics import POOL_CHECKOUT_SECONDS
+
+
+class KeyedPool:
+    """
+    按键（模型名）划分的对象池
+
+    用法:
+        pool = KeyedPool('llm_clients', lambda model: ChatAIAPIModel(model=model), max_idle=4)
+        with pool.checkout('deepseek-ai/DeepSeek-V3') as llm:
+            llm.generate(prompt)
+
+        # 对象需要在请求结束后继续使用（如后台任务）时手动归还
+        llm = pool.acquire(model)
+        ...
+        pool.release(model, llm)
+    """
+
+    # 计算延迟分位数时保留的最近 checkout 次数
+    LATENCY_WINDOW = 1000
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[str], Any],
+        max_idle: int = 4,
+        reset: Optional[Callable[[Any], None]] = None,
+        close: Optional[Callable[[Any], None]] = None
+    ):
+        """
+        Args:
+            name: 池名称（用于统计）
+            factory: 为指定键创建新对象
+            max_idle: 每个键最多保留的空闲对象数
+            reset: 归还时调用，清空单次请求的状态
+            close: 丢弃对象（超出 max_idle 或关闭池）时调用，释放连接等资源
+        """
+        self.name = name
+        self.factory = factory
+        self.max_idle = max(0, max_idle)
+        self.reset = reset
+        self.close = close
+        self._idle: Dict[str, List[Any]] = {}
+        self._in_use: Dict[str, int] = {}
+        self._created: Dict[str, int] = {}
+        self._checkouts = 0
+        self._reused = 0
+        self._latencies: Deque[float] = deque(maxlen=self.LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self, key: str) -> Any:
+        """取出一个对象（没有空闲对象时新建），使用完后必须调用 release"""
+        start = time.perf_counter()
+        with self._lock:
+            idle = self._idle.get(key)
+            obj = idle.pop() if idle else None
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+        if obj is None:
+            try:
+                obj = self.factory(key)
+            except Exception:
+                with self._lock:
+                    self._in_use[key] -= 1
+                raise
+            reused = False
+        else:
+            reused = True
+        elapsed = time.perf_counter() - start
+        POOL_CHECKOUT_SECONDS.observe(elapsed, self.name)
+        with self._lock:
+            self._checkouts += 1
+            self._latencies.append(elapsed)
+            if reused:
+                self._reused += 1
+            else:
+                self._created[key] = self._created.get(key, 0) + 1
+        return obj
+
+    def release(self, key: str, obj: Any):
+        """归还对象：重置状态后放回池中，池已满或已关闭时关闭丢弃"""
+        keep = True
+        if self.reset is not None:
+            try:
+                self.reset(obj)
+            except Exception as e:
+                print(f"对象池 {self.name} 重置对象失败，丢弃: {e}")
+                keep = False
+        with self._lock:
+            self._in_use[key] -= 1
+            idle = self._idle.setdefault(key, [])
+            if keep and not self._closed and len(idle) < self.max_idle:
+                idle.append(obj)
+                return
+        self._close(obj)
+
+    @contextmanager
+    def checkout(self, key: str) -> Iterator[Any]:
+        """独占使用一个对象，退出时自动归还"""
+        obj = self.acquire(key)
+        try:
+            yield obj
+        finally:
+            self.release(key, obj)
+
+    def _close(self, obj: Any):
+        if self.close is None:
+            return
+        try:
+            self.close(obj)
+        except Exception as e:
+            print(f"对象池 {self.name} 关闭对象失败: {e}")
+
+    def shutdown(self):
+        """关闭所有空闲对象；使用中的对象归还时直接关闭"""
+        with self._lock:
+            self._closed = True
+            idle = [obj for objs in self._idle.values() for obj in objs]
+            self._idle.clear()
+        for obj in idle:
+            self._close(obj)
+
+    def stats(self) -> Dict[str, Any]:
+        """池大小与 checkout 延迟统计（毫秒）"""
+        with self._lock:
+            keys = sorted(set(self._idle) | set(self._in_use))
+            latencies = sorted(self._latencies)
+            per_key = {
+                key: {
+                    'idle': len(self._idle.get(key, [])),
+                    'in_use': self._in_use.get(key, 0),
+                    'created': self._created.get(key, 0),
+                }
+                for key in keys
+            }
+            checkouts, reused = self._checkouts, self._reused
+
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+        return {
+            'name': self.name,
+            'max_idle': self.max_idle,
+            'idle': sum(entry['idle'] for entry in per_key.values()),
+            'in_use': sum(entry['in_use'] for entry in per_key.values()),
+            'keys': per_key,
+            'checkouts': checkouts,
+            'reuse_rate': reused / checkouts if checkouts else 0.0,
+            'checkout_latency_ms': {
+                'mean': sum(latencies) / len(latencies) * 1000 if latencies else None,
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'max': latencies[-1] * 1000 if latencies else None,
+            },
+        }
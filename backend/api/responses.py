@@ -0,0 +1,165 @@
+"""
+大响应的输出路径 - 更快的 JSON 编码、字段选择与分页
+
+质量评估的 raw 结果包含每个问答对的完整输入/输出文本，流程分析的 turns 包含每轮的问题和回答，
+响应可达数十 MB。标准 JSONResponse 在事件循环中用 json.dumps 编码，编码期间阻塞其他请求。
+- dumps：安装了 orjson 时使用 orjson（比标准库快数倍），否则回退为标准库 json
+- json_response：在线程中完成字段裁剪与编码，不阻塞事件循环
+- ResponseShape：客户端通过查询参数只取需要的部分
+    fields=metrics,average_score   只保留 data 中的这些顶层字段
+    exclude=raw,turns.answer       删除 data 中的这些路径（路径经过列表时作用于每个元素）
+    include_text=false             删除所有问题/回答原文字段（question / answer / input / actual_output）
+    offset=0&limit=50              对主列表（如 turns、raw.results）分页，响应附带 page 信息
+"""
+import asyncio
+import json
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from fastapi import Query
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，未安装时使用标准库
+    orjson = None
+
+# include_text=false 时删除的原文字段
+TEXT_FIELDS = frozenset(('question', 'answer', 'input', 'actual_output'))
+
+_MISSING = object()
+
+
+def dumps(content: Any) -> bytes:
+    """编码为 UTF-8 JSON（与 JSONResponse 相同的紧凑格式）"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(JSONResponse):
+    """使用 dumps 编码的 JSONResponse（作为应用的默认响应类）"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+@dataclass
+class ResponseShape:
+    """客户端请求的响应裁剪方式（见模块说明）"""
+    fields: Optional[List[str]] = None
+    exclude: List[str] = field(default_factory=list)
+    include_text: bool = True
+    offset: int = 0
+    limit: Optional[int] = None
+
+    def apply(self, content: Dict[str, Any], page_keys: Sequence[str] = ()) -> Dict[str, Any]:
+        """
+        裁剪响应中的 data（返回新字典，不修改传入的结果，任务结果可被重复获取）
+
+        Args:
+            content: {"success": ..., "data": {...}, ...}
+            page_keys: 可分页的列表路径，按顺序取 data 中第一个存在的
+        """
+        data = content.get('data')
+        if not isinstance(data, dict):
+            return content
+        shaped = dict(content)
+
+        if self.offset or self.limit is not None:
+            for key in page_keys:
+                values = _get(data, key.split('.'))
+                if not isinstance(values, list):
+                    continue
+                end = None if self.limit is None else self.offset + self.limit
+                data = _update(data, key.split('.'), lambda items: items[self.offset:end])
+                shaped['page'] = {
+                    'key': key,
+                    'offset': self.offset,
+                    'limit': self.limit,
+                    'total': len(values),
+                    'next_offset': end if end is not None and end < len(values) else None,
+                }
+                break
+        for path in self.exclude:
+            data = _update(data, path.split('.'), lambda _: _MISSING)
+        if self.fields is not None:
+            data = {key: value for key, value in data.items() if key in self.fields}
+        if not self.include_text:
+            data = _strip_text(data)
+
+        shaped['data'] = data
+        return shaped
+
+
+def response_shape(
+    fields: Optional[str] = Query(None, description="只返回 data 中的这些顶层字段（逗号分隔）"),
+    exclude: Optional[str] = Query(None, description="删除 data 中的这些路径（逗号分隔，如 raw,turns.answer）"),
+    include_text: bool = Query(True, description="false 时删除问题/回答原文字段"),
+    offset: int = Query(0, ge=0, description="主列表分页的起始位置"),
+    limit: Optional[int] = Query(None, ge=1, description="主列表分页的条数（默认全部）")
+) -> ResponseShape:
+    """FastAPI 依赖：从查询参数读取响应裁剪方式"""
+    def split(value: Optional[str]) -> List[str]:
+        return [part.strip() for part in (value or '').split(',') if part.strip()]
+
+    return ResponseShape(
+        fields=split(fields) if fields is not None else None,
+        exclude=split(exclude),
+        include_text=include_text,
+        offset=offset,
+        limit=limit
+    )
+
+
+async def json_response(
+    content: Dict[str, Any],
+    shape: Optional[ResponseShape] = None,
+    page_keys: Sequence[str] = (),
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """在线程中裁剪并编码响应（大结果编码耗时较长，不阻塞事件循环）"""
+    def render() -> bytes:
+        return dumps(shape.apply(content, page_keys) if shape is not None else content)
+
+    body = await asyncio.to_thread(render)
+    return Response(body, status_code=status_code, media_type='application/json', headers=headers)
+
+
+def _get(obj: Any, parts: List[str]) -> Any:
+    for part in parts:
+        if not isinstance(obj, dict) or part not in obj:
+            return _MISSING
+        obj = obj[part]
+    return obj
+
+
+def _update(obj: Any, parts: List[str], fn: Callable[[Any], Any]) -> Any:
+    """
+    返回副本：把路径上的值替换为 fn(值)，fn 返回 _MISSING 时删除该键
+
+    路径经过列表时作用于每个元素；只复制路径上的容器，其余部分与原对象共享。
+    """
+    if isinstance(obj, list):
+        return [_update(item, parts, fn) for item in obj]
+    if not isinstance(obj, dict) or parts[0] not in obj:
+        return obj
+    updated = dict(obj)
+    if len(parts) == 1:
+        value = fn(updated[parts[0]])
+        if value is _MISSING:
+            del updated[parts[0]]
+        else:
+            updated[parts[0]] = value
+    else:
+        updated[parts[0]] = _update(updated[parts[0]], parts[1:], fn)
+    return updated
+
+
+def _strip_text(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {key: _strip_text(value) for key, value in obj.items() if key not in TEXT_FIELDS}
+    if isinstance(obj, list):
+        return [_strip_text(item) for item in obj]
+    return obj
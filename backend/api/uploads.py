@@ -0,0 +1,107 @@
+"""
+上传文件处理 - 每个请求独立的工作目录，分块流式写入
+
+以前所有上传都写到固定路径 temp/conversations.json，并发请求会互相覆盖；
+await file.read() 还会把整个文件读入内存。UploadWorkspace：
+- 每个请求在 temp/<uuid>/ 下创建独立目录，并发请求互不干扰
+- 按块读取上传内容并写入磁盘，同时计算 SHA-256，内存占用与文件大小无关
+- 作为上下文管理器使用时，无论成功还是异常都会删除目录；
+  交给后台任务时调用 detach() 转移清理责任
+"""
+import hashlib
+import shutil
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from fastapi import UploadFile
+
+# 每次从上传流读取的字节数
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 工作目录的根目录
+UPLOAD_ROOT = Path("temp")
+
+
+class UploadTooLarge(Exception):
+    """上传文件超过大小上限"""
+
+
+class UploadWorkspace:
+    """
+    单个请求的上传工作目录
+
+    用法:
+        async with UploadWorkspace() as workspace:
+            path = await workspace.save(file)
+            loader = ChatDataLoader(str(workspace.path))
+            ...
+        # 退出时目录已删除（包括异常退出）
+
+        # 交给后台任务：任务结束后再清理
+        async with UploadWorkspace() as workspace:
+            await workspace.save(file)
+            jobs.submit(..., cleanup=workspace.cleanup)
+            workspace.detach()   # 提交成功后由任务负责清理
+    """
+
+    def __init__(self, root: Optional[Path] = None, max_bytes: Optional[int] = None):
+        """
+        Args:
+            root: 工作目录的根目录（默认 UPLOAD_ROOT）
+            max_bytes: 单个上传文件的大小上限，None 或 0 表示不限制
+        """
+        self.path = Path(root or UPLOAD_ROOT) / uuid.uuid4().hex
+        self.path.mkdir(parents=True)
+        self.max_bytes = max_bytes or None
+        self.sha256: Optional[str] = None
+        self.size = 0
+        self._detached = False
+
+    async def save(self, upload: UploadFile, filename: str = "conversations.json") -> Path:
+        """
+        分块读取上传内容写入工作目录，同时计算 SHA-256
+
+        Returns:
+            写入的文件路径
+
+        Raises:
+            UploadTooLarge: 超过 max_bytes（已写入的部分文件会随工作目录一起删除）
+        """
+        target = self.path / filename
+        digest = hashlib.sha256()
+        size = 0
+        with open(target, 'wb') as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if self.max_bytes is not None and size > self.max_bytes:
+                    raise UploadTooLarge(
+                        f"上传文件超过大小上限 {self.max_bytes / (1024 * 1024):g} MB"
+                    )
+                digest.update(chunk)
+                f.write(chunk)
+        self.sha256 = digest.hexdigest()
+        self.size = size
+        return target
+
+    def info(self) -> dict:
+        """上传文件的摘要信息（用于响应）"""
+        return {'sha256': self.sha256, 'size': self.size}
+
+    def detach(self):
+        """把清理责任转交给调用方（如后台任务），退出上下文时不再删除目录"""
+        self._detached = True
+
+    def cleanup(self):
+        """删除工作目录（可重复调用）"""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    async def __aenter__(self) -> "UploadWorkspace":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if not self._detached:
+            self.cleanup()
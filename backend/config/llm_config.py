@@ -10,6 +10,15 @@ from dotenv import load_dotenv
 load_dotenv(override=True)
 
 
+def _read_int(name: str, default: int, minimum: int, maximum: Optional[int] = None) -> int:
+    """读取整数环境变量并限制在 [minimum, maximum] 内，未设置或格式错误时返回默认值"""
+    try:
+        value = max(minimum, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+    return min(maximum, value) if maximum is not None else value
+
+
 class LLMConfig:
     """LLM 配置管理类 - 单一数据源 (Single Source of Truth)"""
     
@@ -88,6 +97,36 @@ class LLMConfig:
         env_key = f"DEFAULT_MODEL_{task.upper()}"
         return os.getenv(env_key, cls.DEFAULT_MODELS.get(task, cls.DEFAULT_MODELS["general"]))
     
+    # 单次请求提示词的 token 预算（含模板），超出时裁剪/摘要上下文
+    DEFAULT_PROMPT_BUDGETS = {
+        "evaluation": 4000,
+        "flow_analysis": 1500,
+        "bloom": 3000,
+        "general": 2000
+    }
+    
+    @classmethod
+    def get_prompt_budget(cls, task: str = "general") -> int:
+        """
+        获取指定任务的提示词 token 预算
+        
+        支持通过环境变量覆盖，例如:
+        - PROMPT_BUDGET_FLOW_ANALYSIS
+        - PROMPT_BUDGET_EVALUATION
+        - PROMPT_BUDGET_BLOOM
+        
+        Args:
+            task: 任务类型 (evaluation, flow_analysis, bloom, general)
+        
+        Returns:
+            token 数
+        """
+        default = cls.DEFAULT_PROMPT_BUDGETS.get(task, cls.DEFAULT_PROMPT_BUDGETS["general"])
+        try:
+            return int(os.getenv(f"PROMPT_BUDGET_{task.upper()}", default))
+        except ValueError:
+            return default
+    
     # ============ 超时和重试配置 ============
     
     @staticmethod
@@ -132,6 +171,219 @@ class LLMConfig:
             "backoff": float(os.getenv("CHATAI_RETRY_BACKOFF", "1.5"))
         }
     
+    @staticmethod
+    def get_rate_limit() -> Optional[float]:
+        """
+        获取 LLM 调用限速配置
+        
+        支持环境变量 CHATAI_RATE_LIMIT_RPM: 每分钟最多调用次数（所有工作进程共享）
+        
+        Returns:
+            每分钟调用次数，未配置或 <= 0 时返回 None（不限速）
+        """
+        try:
+            rpm = float(os.getenv("CHATAI_RATE_LIMIT_RPM", "0"))
+        except ValueError:
+            return None
+        return rpm if rpm > 0 else None
+    
+    @staticmethod
+    def get_max_concurrency() -> int:
+        """
+        获取单个分析任务的最大并发 LLM 调用数
+        
+        支持环境变量 CHATAI_MAX_CONCURRENCY（默认 4）
+        
+        Returns:
+            最大并发数（至少为 1）
+        """
+        try:
+            return max(1, int(os.getenv("CHATAI_MAX_CONCURRENCY", "4")))
+        except ValueError:
+            return 4
+    
+    @staticmethod
+    def get_job_config() -> Dict:
+        """
+        获取后台任务（API 长耗时分析）配置
+        
+        支持环境变量:
+        - JOB_MAX_WORKERS: 同时运行的任务数（默认 2）
+        - JOB_MAX_QUEUED: 排队等待的任务数上限，超出后拒绝新任务（默认 16）
+        - JOB_TTL_SECONDS: 已结束任务的结果保留时间（默认 3600 秒）
+        - JOB_MAX_LLM_CALLS: 同时运行任务的预计 LLM 调用总数上限（默认 500，0 表示不限制）
+        - JOB_MAX_PER_CLIENT: 单个客户端运行中 + 排队的任务数上限（默认 4，0 表示不限制）
+        - JOB_MAX_RUNNING_PER_CLIENT: 单个客户端同时运行的任务数上限（默认 1，0 表示不限制）
+        - JOB_MAX_LLM_CALLS_PER_CLIENT: 单个客户端未结束任务的预计 LLM 调用总数上限（默认 1000，0 表示不限制）
+        - JOB_INTERACTIVE_MAX_CALLS: 预计调用数不超过该值的任务优先调度（默认 50）
+        
+        Returns:
+            JobManager 的构造参数
+        """
+        return {
+            "max_workers": _read_int("JOB_MAX_WORKERS", 2, 1),
+            "max_queued": _read_int("JOB_MAX_QUEUED", 16, 0),
+            "ttl_seconds": _read_int("JOB_TTL_SECONDS", 3600, 1),
+            "max_llm_calls": _read_int("JOB_MAX_LLM_CALLS", 500, 0),
+            "max_jobs_per_client": _read_int("JOB_MAX_PER_CLIENT", 4, 0),
+            "max_running_per_client": _read_int("JOB_MAX_RUNNING_PER_CLIENT", 1, 0),
+            "max_llm_calls_per_client": _read_int("JOB_MAX_LLM_CALLS_PER_CLIENT", 1000, 0),
+            "interactive_max_calls": _read_int("JOB_INTERACTIVE_MAX_CALLS", 50, 0)
+        }
+    
+    @staticmethod
+    def get_batch_config() -> Dict:
+        """
+        获取批量分析（/api/analyze-batch）配置
+        
+        支持环境变量:
+        - BATCH_MAX_WORKERS: 所有批量任务共用的工作线程数，即同时进行的导出评估与流程分析回合数
+          （默认同 CHATAI_MAX_CONCURRENCY）
+        - BATCH_MAX_EXPORTS: 单个批量请求最多包含的导出数（默认 500）
+        
+        Returns:
+            {'max_workers': ..., 'max_exports': ...}
+        """
+        return {
+            "max_workers": _read_int("BATCH_MAX_WORKERS", LLMConfig.get_max_concurrency(), 1),
+            "max_exports": _read_int("BATCH_MAX_EXPORTS", 500, 1)
+        }
+    
+    @staticmethod
+    def get_pool_max_idle() -> int:
+        """
+        获取 API 层 LLM 客户端/评估器池中每个模型保留的空闲对象数
+        
+        支持环境变量:
+        - POOL_MAX_IDLE_PER_MODEL: 默认 4（0 表示不复用）
+        """
+        try:
+            return max(0, int(os.getenv("POOL_MAX_IDLE_PER_MODEL", "4")))
+        except ValueError:
+            return 4
+    
+    @staticmethod
+    def get_dataset_config() -> Dict:
+        """
+        获取数据集存储（/api/datasets）配置
+        
+        支持环境变量:
+        - DATASET_DIR: 数据集保存目录（默认 datasets）
+        - DATASET_CACHE_SIZE: 内存中保留解析结果的数据集数（默认 4）
+        - DATASET_TTL_SECONDS: 数据集超过该时间未使用则删除（默认 86400 秒）
+        
+        Returns:
+            {'root': ..., 'cache_size': ..., 'ttl_seconds': ...}
+        """
+        return {
+            "root": os.getenv("DATASET_DIR") or "datasets",
+            "cache_size": _read_int("DATASET_CACHE_SIZE", 4, 1),
+            "ttl_seconds": _read_int("DATASET_TTL_SECONDS", 86400, 1)
+        }
+    
+    @staticmethod
+    def get_max_upload_bytes() -> Optional[int]:
+        """
+        获取单个上传文件的大小上限
+        
+        支持环境变量:
+        - UPLOAD_MAX_MB: 上限（MB），0 或未设置表示不限制
+        
+        Returns:
+            字节数，不限制时返回 None
+        """
+        try:
+            max_mb = float(os.getenv("UPLOAD_MAX_MB", "0"))
+        except ValueError:
+            return None
+        return int(max_mb * 1024 * 1024) if max_mb > 0 else None
+    
+    @staticmethod
+    def get_compression_config() -> Dict:
+        """
+        获取响应压缩配置（按 Accept-Encoding 协商 brotli / gzip）
+        
+        支持环境变量:
+        - RESPONSE_COMPRESSION_MIN_BYTES: 小于该字节数的响应不压缩（默认 1024）
+        - RESPONSE_GZIP_LEVEL: gzip 压缩级别 1~9（默认 5）
+        - RESPONSE_BROTLI_QUALITY: brotli 压缩质量 0~11（默认 4，需要安装 brotli）
+        
+        Returns:
+            {'minimum_size': ..., 'gzip_level': ..., 'brotli_quality': ...}
+        """
+        return {
+            "minimum_size": _read_int("RESPONSE_COMPRESSION_MIN_BYTES", 1024, 0, 1 << 30),
+            "gzip_level": _read_int("RESPONSE_GZIP_LEVEL", 5, 1, 9),
+            "brotli_quality": _read_int("RESPONSE_BROTLI_QUALITY", 4, 0, 11),
+        }
+    
+    @staticmethod
+    def get_trace_dir() -> str:
+        """
+        获取阶段追踪文件的导出目录（请求头 X-Debug-Timings: export 时写入）
+        
+        支持环境变量 TRACE_DIR，默认 traces
+        """
+        return os.getenv("TRACE_DIR", "").strip() or "traces"
+    
+    @staticmethod
+    def get_turn_cache_dir() -> Optional[str]:
+        """
+        获取流程分析回合缓存的持久化目录
+        
+        支持环境变量 FLOW_TURN_CACHE_DIR，未配置时只在进程内存中缓存
+        
+        Returns:
+            缓存目录，None 表示不持久化
+        """
+        return os.getenv("FLOW_TURN_CACHE_DIR") or None
+    
+    @staticmethod
+    def get_bloom_config() -> Dict:
+        """
+        获取布鲁姆层级 LLM 复核配置
+        
+        支持环境变量:
+        - BLOOM_LLM_CONFIDENCE: 启发式置信度低于该值的回合交给 LLM 复核（默认 0.6）
+        - BLOOM_BATCH_SIZE: 每次 LLM 请求最多打包的问题数（默认 20）
+        
+        Returns:
+            {'confidence_threshold': ..., 'batch_size': ...}
+        """
+        try:
+            threshold = float(os.getenv("BLOOM_LLM_CONFIDENCE", "0.6"))
+        except ValueError:
+            threshold = 0.6
+        try:
+            batch_size = max(1, int(os.getenv("BLOOM_BATCH_SIZE", "20")))
+        except ValueError:
+            batch_size = 20
+        return {
+            "confidence_threshold": threshold,
+            "batch_size": batch_size
+        }
+    
+    @staticmethod
+    def get_local_classifier_config() -> Dict:
+        """
+        获取本地问题分类器配置
+        
+        支持环境变量:
+        - FLOW_LOCAL_CLASSIFIER: 导出的模型文件路径（.npz），未配置则不启用
+        - FLOW_LOCAL_CONFIDENCE: 置信度阈值，低于该值的回合交给 LLM（默认使用模型导出时的阈值）
+        
+        Returns:
+            {'path': ..., 'threshold': ...}
+        """
+        try:
+            threshold = float(os.getenv("FLOW_LOCAL_CONFIDENCE")) if os.getenv("FLOW_LOCAL_CONFIDENCE") else None
+        except ValueError:
+            threshold = None
+        return {
+            "path": os.getenv("FLOW_LOCAL_CLASSIFIER") or None,
+            "threshold": threshold
+        }
+    
     # ============ 模型预设和元数据 ============
     
     SUPPORTED_MODELS = {
@@ -145,6 +397,7 @@ class LLMConfig:
             "recommended_for": ["evaluation", "flow_analysis", "general", "json_output", "structured_output"],
             "description": "✅ 推荐首选：最新版本，100%测试通过，JSON格式完美，无思维链干扰",
             "notes": "综合能力最强，适合所有任务场景",
+            "context_window": 32768,
             "test_results": {
                 "success_rate": "100%",
                 "avg_response_time": 1.88,
@@ -162,6 +415,7 @@ class LLMConfig:
             "recommended_for": ["reasoning", "deep_analysis"],
             "description": "推理模型，思维能力强但输出包含思维链",
             "notes": "⚠️ 输出格式不稳定，JSON兼容性差，不推荐用于结构化输出任务",
+            "context_window": 32768,
             "test_results": {
                 "success_rate": "50%",
                 "avg_response_time": 2.10,
@@ -177,6 +431,7 @@ class LLMConfig:
             "recommended_for": ["general", "json_output"],
             "description": "旧版本，速度更快但能力略弱",
             "notes": "备选方案，如需更快响应速度可考虑",
+            "context_window": 32768,
             "test_results": {
                 "success_rate": "100%",
                 "avg_response_time": 1.01,
@@ -204,6 +459,28 @@ class LLMConfig:
         """
         return cls.SUPPORTED_MODELS.get(model_name)
     
+    @classmethod
+    def get_context_window(cls, model_name: Optional[str] = None) -> int:
+        """
+        获取模型的上下文窗口大小（token 数）
+        
+        优先级: 环境变量 CHATAI_CONTEXT_WINDOW > 模型元数据 > 默认 8192
+        
+        Args:
+            model_name: 模型名称
+        
+        Returns:
+            上下文窗口 token 数
+        """
+        env_window = os.getenv("CHATAI_CONTEXT_WINDOW")
+        if env_window:
+            try:
+                return int(env_window)
+            except ValueError:
+                pass
+        info = cls.get_model_info(model_name) if model_name else None
+        return (info or {}).get("context_window", 8192)
+    
     @classmethod
     def list_models(cls, provider: Optional[str] = None, 
                     cost: Optional[str] = None,
@@ -0,0 +1,457 @@
+"""
+布鲁姆认知层级分析 - 启发式分类 + LLM 批量复核（docs/BLOOM_INFOGAIN_DESIGN.md 方案2/方案3）
+
+流程:
+1. BloomEngine 一次扫描完成所有问题的启发式分类（毫秒级）
+2. 回合结果缓存中已有 LLM 结论的问题直接使用缓存
+3. 其余问题中启发式置信度低于阈值的（method='llm' 时为全部），按 token 预算打包，
+   每次请求复核多个问题，结果写入缓存
+4. LLM 失败或返回无效时保留启发式结果（智能降级）
+
+复核可以同步完成，也可以交给后台执行：先返回启发式结果，
+复核完成后结果进入缓存，重新请求时即得到 LLM 修正后的结果。
+"""
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Dict, List, Literal, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+
+from core.bloom_engine import BLOOM_LEVELS, BloomEngine
+from core.conversation_flow_analyzer import _run_coroutine, _strip_code_fence, _question_preview
+from core.token_budget import ContextBudget, estimate_tokens
+from core.turn_cache import TurnResultCache
+
+# 导入配置中心
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config.llm_config import LLMConfig
+from utils.metrics import LLM_JSON_PARSE_FAILURES
+from utils.tracing import traced
+
+# 提示词版本：修改提示词后需要递增，使旧的缓存失效
+BLOOM_PROMPT_VERSION = "bloom-v1"
+
+METHODS = ('heuristic', 'llm', 'hybrid')
+
+# 每个问题预留的输出 token 数
+BLOOM_OUTPUT_TOKENS_PER_ITEM = 60
+
+# 每个示例层级最多返回的示例数
+MAX_EXAMPLES_PER_LEVEL = 3
+
+BLOOM_LEVEL_CRITERIA = """布鲁姆认知层级（从低到高）：
+1. remember（记忆）：回忆事实、定义
+2. understand（理解）：解释概念、总结
+3. apply（应用）：使用方法、执行步骤
+4. analyze（分析）：分解结构、对比关系
+5. evaluate（评价）：判断质量、提供反馈
+6. create（创造）：设计方案、创新思路"""
+
+# 逐问题结果中的字段（启发式、缓存与 LLM 结果相同）
+TURN_RESULT_FIELDS = ('level', 'confidence', 'reason', 'source')
+
+# 正在复核的缓存键 -> 复核结束事件：同一问题只调用一次 LLM，其他请求等待其结果写入缓存
+_inflight: Dict[str, threading.Event] = {}
+_inflight_lock = threading.Lock()
+
+
+class BloomClassification(BaseModel):
+    """单个问题的布鲁姆分类（用于校验 LLM 返回的数组元素）"""
+    index: int
+    level: Literal['remember', 'understand', 'apply', 'analyze', 'evaluate', 'create']
+    confidence: float = Field(ge=0, le=1)
+    reason: str = ''
+
+
+class BloomAnalyzer:
+    """
+    布鲁姆层级分析器
+
+    用法:
+        analyzer = BloomAnalyzer(model, cache=bloom_cache)
+        result = analyzer.analyze([turns], method='hybrid')
+    """
+
+    def __init__(
+        self,
+        model=None,
+        engine: Optional[BloomEngine] = None,
+        cache: Optional[TurnResultCache] = None,
+        confidence_threshold: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        context_budget: Optional[ContextBudget] = None
+    ):
+        """
+        Args:
+            model: LLM 模型（ChatAIAPIModel），None 时只做启发式分类
+            engine: 启发式分类引擎，默认新建 BloomEngine
+            cache: LLM 结果缓存（按问题及上一轮原文的哈希），None 则不缓存
+            confidence_threshold: hybrid 模式下启发式置信度低于该值的问题交给 LLM（默认读取 BLOOM_LLM_CONFIDENCE）
+            batch_size: 每次 LLM 请求最多打包的问题数（默认读取 BLOOM_BATCH_SIZE）
+            concurrency: 同时进行的 LLM 请求数（默认读取 CHATAI_MAX_CONCURRENCY）
+            context_budget: 单次请求的提示词 token 预算（默认 PROMPT_BUDGET_BLOOM）
+        """
+        config = LLMConfig.get_bloom_config()
+        self.model = model
+        self.engine = engine or BloomEngine()
+        self.cache = cache
+        self.confidence_threshold = (
+            confidence_threshold if confidence_threshold is not None else config["confidence_threshold"]
+        )
+        self.batch_size = max(1, batch_size or config["batch_size"])
+        self.concurrency = max(1, concurrency or LLMConfig.get_max_concurrency())
+        self.context_budget = context_budget or ContextBudget(LLMConfig.get_prompt_budget("bloom"))
+        self.llm_calls = 0
+
+    def analyze(
+        self,
+        conversations: Sequence[List[Dict[str, str]]],
+        method: str = 'hybrid',
+        wait: bool = True
+    ) -> Dict[str, Any]:
+        """
+        分析所有对话中用户问题的布鲁姆层级
+
+        Args:
+            conversations: 对话列表，每个对话为 get_conversation_turns 返回的回合列表
+            method: heuristic 只用启发式；llm 所有问题都交给 LLM；hybrid 只复核低置信度问题
+            wait: 是否等待 LLM 复核完成；False 时待复核的问题在 refinement.pending_turns 中返回，
+                由调用方交给 refine 在后台执行，或交给 refine_result 得到复核后的完整结果
+
+        Returns:
+            {'bloom_distribution', 'examples', 'turns', 'method_used', 'processing_time', 'refinement'}
+        """
+        if method not in METHODS:
+            raise ValueError(f"未知的布鲁姆分析方法: {method}")
+        start_time = time.time()
+        items = self._flatten(conversations)
+        turn_results, pending, keys = self._prepare(items, method)
+        return self._complete(items, turn_results, pending if wait else [], pending, keys, method, start_time)
+
+    def refine_result(self, conversations: Sequence[List[Dict[str, str]]], result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        复核 analyze(wait=False) 结果中的待复核问题，返回合并复核结果后的完整结果
+        （直接使用该结果中的启发式/缓存结论，不重复分类和查询缓存）
+
+        Args:
+            conversations: 与 analyze 相同的对话列表
+            result: analyze(wait=False) 的返回值（需保留 refinement.pending_turns）
+        """
+        start_time = time.time() - result['processing_time']
+        items = self._flatten(conversations)
+        turn_results = [{field: turn[field] for field in TURN_RESULT_FIELDS} for turn in result['turns']]
+        pending = self._pending_indices(items, result['refinement']['pending_turns'])
+        keys = [self._cache_key(item) for item in items]
+        return self._complete(items, turn_results, pending, pending, keys, result['method_used'], start_time)
+
+    def _complete(
+        self,
+        items: List[Dict[str, Any]],
+        turn_results: List[Dict[str, Any]],
+        to_refine: List[int],
+        pending: List[int],
+        keys: List[Optional[str]],
+        method: str,
+        start_time: float
+    ) -> Dict[str, Any]:
+        """复核 to_refine 中的问题（可为空）并汇总，未能复核的问题仍标记为待复核"""
+        refined = 0
+        if to_refine:
+            refined_results = self._refine_items(items, to_refine, keys)
+            for idx, result in refined_results.items():
+                turn_results[idx] = result
+            refined = len(refined_results)
+            pending = [idx for idx in pending if idx not in refined_results]
+
+        result = self._summarize(items, turn_results)
+        result['method_used'] = method
+        result['processing_time'] = round(time.time() - start_time, 3)
+        result['refinement'] = {
+            'cache_hits': sum(1 for r in turn_results if r['source'] == 'cache'),
+            'refined': refined,
+            'llm_calls': self.llm_calls,
+            'pending': len(pending),
+            # (对话下标, 回合下标) 均从 0 开始，交给 refine 使用
+            'pending_turns': [[items[idx]['conversation_index'], items[idx]['turn_position']] for idx in pending],
+            'status': 'pending' if pending else 'complete',
+        }
+        return result
+
+    def refine(
+        self,
+        conversations: Sequence[List[Dict[str, str]]],
+        pending_turns: List[List[int]]
+    ) -> int:
+        """
+        复核 analyze(wait=False) 返回的待复核问题并写入缓存（供后台任务调用）
+
+        Returns:
+            成功复核的问题数
+        """
+        items = self._flatten(conversations)
+        keys = [self._cache_key(item) for item in items]
+        return len(self._refine_items(items, self._pending_indices(items, pending_turns), keys))
+
+    @staticmethod
+    def _pending_indices(items: List[Dict[str, Any]], pending_turns: List[List[int]]) -> List[int]:
+        """把 (对话下标, 回合下标) 转换为展开后的问题下标"""
+        position = {(item['conversation_index'], item['turn_position']): idx for idx, item in enumerate(items)}
+        return [position[tuple(p)] for p in pending_turns if tuple(p) in position]
+
+    def _flatten(self, conversations: Sequence[List[Dict[str, str]]]) -> List[Dict[str, Any]]:
+        """展开为问题列表，每个问题附带所在对话与上一轮原文（作为上下文和缓存键的一部分）"""
+        items = []
+        for conv_idx, turns in enumerate(conversations):
+            for pos, turn in enumerate(turns):
+                items.append({
+                    'conversation_index': conv_idx,
+                    'turn_position': pos,
+                    'question': turn.get('question', ''),
+                    'answer': turn.get('answer', ''),
+                    'question_type': turn.get('question_type'),
+                    'previous': turns[pos - 1] if pos > 0 else None,
+                })
+        return items
+
+    def _model_name(self) -> Optional[str]:
+        return self.model.get_model_name() if self.model is not None else None
+
+    def _cache_key(self, item: Dict[str, Any]) -> Optional[str]:
+        if self.cache is None or self.model is None:
+            return None
+        previous = [item['previous']] if item['previous'] else []
+        return TurnResultCache.make_key(
+            item['question'], previous, BLOOM_PROMPT_VERSION, self._model_name(),
+            prompt_budget=self.context_budget.max_tokens
+        )
+
+    @traced('bloom.prepare')
+    def _prepare(
+        self,
+        items: List[Dict[str, Any]],
+        method: str
+    ) -> Tuple[List[Dict[str, Any]], List[int], List[Optional[str]]]:
+        """
+        启发式分类 + 查缓存，确定需要 LLM 复核的问题
+
+        Returns:
+            (逐问题结果, 待复核下标, 缓存键)
+        """
+        heuristics = self.engine.classify_batch(
+            [item['question'] for item in items],
+            [item['question_type'] for item in items]
+        )
+        turn_results = [
+            {
+                'level': h.level,
+                'confidence': round(h.confidence, 4),
+                'reason': f"关键词: {'、'.join(dict.fromkeys(h.matched))}" if h.matched else '无明显关键词，默认归为理解层级',
+                'source': 'heuristic',
+            }
+            for h in heuristics
+        ]
+        keys = [self._cache_key(item) for item in items]
+        if method == 'heuristic' or self.model is None:
+            return turn_results, [], keys
+
+        pending = []
+        for idx, key in enumerate(keys):
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                turn_results[idx] = {**cached, 'source': 'cache'}
+            elif method == 'llm' or heuristics[idx].confidence < self.confidence_threshold:
+                pending.append(idx)
+        return turn_results, pending, keys
+
+    @traced('bloom.refine')
+    def _refine_items(
+        self,
+        items: List[Dict[str, Any]],
+        indices: List[int],
+        keys: List[Optional[str]]
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        按批调用 LLM 复核指定问题，返回 {下标: 结果}，成功的结果写入缓存
+
+        其他请求正在复核的问题不重复调用 LLM，等待其结束后从缓存读取；
+        对方复核失败时该问题不在返回结果中（由调用方标记为待复核）。
+        """
+        if self.model is None or not indices:
+            return {}
+        claimed: List[int] = []
+        waiting: List[Tuple[int, threading.Event]] = []
+        owned: Dict[str, threading.Event] = {}
+        with _inflight_lock:
+            for idx in indices:
+                key = keys[idx]
+                if key is None or key in owned:
+                    claimed.append(idx)
+                elif key in _inflight:
+                    waiting.append((idx, _inflight[key]))
+                else:
+                    owned[key] = _inflight[key] = threading.Event()
+                    claimed.append(idx)
+        try:
+            results = _run_coroutine(self._refine_batches(items, claimed)) if claimed else {}
+            for idx, result in results.items():
+                if keys[idx] is not None:
+                    self.cache.set(keys[idx], {k: v for k, v in result.items() if k != 'source'})
+        finally:
+            # 先写入缓存再通知等待者
+            with _inflight_lock:
+                for key in owned:
+                    del _inflight[key]
+            for event in owned.values():
+                event.set()
+
+        for idx, event in waiting:
+            event.wait()
+            cached = self.cache.get(keys[idx])
+            if cached is not None:
+                results[idx] = {**cached, 'source': 'llm'}
+        return results
+
+    def _plan_batches(
+        self,
+        items: List[Dict[str, Any]],
+        indices: List[int]
+    ) -> Tuple[List[List[int]], Dict[int, str]]:
+        """
+        按数量上限和 token 预算把问题打包成批
+
+        Returns:
+            (批次列表, {下标: 问题文本})；问题文本在构建提示词时复用，每个问题只压缩一次
+        """
+        budget = self.context_budget.max_tokens
+        base_tokens = estimate_tokens(self._build_batch_prompt([]))
+        texts = {idx: self._item_text(items[idx]) for idx in indices}
+        batches, current, used = [], [], base_tokens
+        for idx in indices:
+            cost = estimate_tokens(texts[idx]) + BLOOM_OUTPUT_TOKENS_PER_ITEM
+            if current and (len(current) >= self.batch_size or used + cost > budget):
+                batches.append(current)
+                current, used = [], base_tokens
+            current.append(idx)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches, texts
+
+    async def _refine_batches(self, items: List[Dict[str, Any]], indices: List[int]) -> Dict[int, Dict[str, Any]]:
+        """并发发送所有批次（受信号量限制）"""
+        batches, texts = self._plan_batches(items, indices)
+        print(f"布鲁姆复核: {len(indices)} 个问题分为 {len(batches)} 批")
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results: Dict[int, Dict[str, Any]] = {}
+
+        async def run_batch(batch: List[int]):
+            prompt = self._build_batch_prompt([texts[idx] for idx in batch])
+            async with semaphore:
+                self.llm_calls += 1
+                try:
+                    response_text = await self.model.a_generate(prompt, schema=None)
+                    results.update(self._parse_batch_response(response_text, batch))
+                except Exception as e:
+                    print(f"  布鲁姆复核失败，保留启发式结果: {e}")
+
+        await asyncio.gather(*[run_batch(batch) for batch in batches])
+        return results
+
+    def _item_text(self, item: Dict[str, Any]) -> str:
+        """单个问题在批量提示词中的文本（问题与上一轮问题按预算压缩）"""
+        cap = max(1, self.context_budget.max_tokens // 8)
+        text = f"问题: {self.context_budget.cap(item['question'], cap)}"
+        if item['previous']:
+            text += f"\n上一轮问题: {self.context_budget.cap(item['previous'].get('question', ''), cap // 2)}"
+        return text
+
+    @traced('bloom.build_prompt')
+    def _build_batch_prompt(self, texts: List[str]) -> str:
+        """构建批量分类提示词（texts 为 _item_text 的结果），编号为批内序号"""
+        questions = "\n\n".join(f"[{number}]\n{text}" for number, text in enumerate(texts, start=1))
+        return f"""你是一个教育专家，擅长基于布鲁姆认知分类法分析问题。
+
+{BLOOM_LEVEL_CRITERIA}
+
+请分析以下 {len(texts)} 个问题分别属于哪个认知层级（上一轮问题仅作为上下文参考）：
+
+{questions}
+
+以 JSON 数组返回，每个问题一个对象，按编号顺序排列，格式如下:
+[{{"index": 编号, "level": "apply", "confidence": 0.85, "reason": "简短说明分类依据"}}]
+"""
+
+    @traced('bloom.parse_response')
+    def _parse_batch_response(self, response_text: str, batch: List[int]) -> Dict[int, Dict[str, Any]]:
+        """解析批量分类响应，只返回通过校验的问题"""
+        try:
+            data = json.loads(_strip_code_fence(response_text))
+        except json.JSONDecodeError:
+            LLM_JSON_PARSE_FAILURES.inc('bloom_batch')
+            raise
+        if isinstance(data, dict):
+            # 兼容 {"results": [...]} 之类的包裹
+            data = next((v for v in data.values() if isinstance(v, list)), [])
+
+        results = {}
+        for raw in data if isinstance(data, list) else []:
+            try:
+                item = BloomClassification(**raw)
+            except (ValidationError, TypeError):
+                continue
+            if not 1 <= item.index <= len(batch):
+                continue
+            results[batch[item.index - 1]] = {
+                'level': item.level,
+                'confidence': round(item.confidence, 4),
+                'reason': item.reason,
+                'source': 'llm',
+            }
+        return results
+
+    @traced('bloom.summarize')
+    def _summarize(self, items: List[Dict[str, Any]], turn_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """汇总分布、示例与逐问题结果"""
+        total = len(items)
+        counts = {level: 0 for level in BLOOM_LEVELS}
+        for result in turn_results:
+            counts[result['level']] += 1
+
+        turns = []
+        for item, result in zip(items, turn_results):
+            turns.append({
+                'conversation_index': item['conversation_index'],
+                'turn_index': item['turn_position'] + 1,
+                'question': _question_preview(item['question']),
+                **result,
+            })
+
+        examples = {}
+        for level in BLOOM_LEVELS:
+            ranked = sorted(
+                (i for i, r in enumerate(turn_results) if r['level'] == level),
+                key=lambda i: -turn_results[i]['confidence']
+            )[:MAX_EXAMPLES_PER_LEVEL]
+            examples[level] = [
+                {
+                    'question': _question_preview(items[i]['question']),
+                    'answer': _question_preview(items[i]['answer']),
+                    'confidence': turn_results[i]['confidence'],
+                }
+                for i in ranked
+            ]
+
+        return {
+            'bloom_distribution': {
+                level: round(count / total * 100, 2) if total else 0.0 for level, count in counts.items()
+            },
+            'level_counts': counts,
+            'total_turns': total,
+            'examples': examples,
+            'turns': turns,
+        }
@@ -0,0 +1,268 @@
+"""
+布鲁姆认知层级分类引擎（后端）
+
+前端 BloomTaxonomyCard 在浏览器中逐轮做关键词判断，无法用于语料级批处理。
+本模块把六个层级的中英文关键词编译为一个 Aho-Corasick 自动机，
+把所有用户问题用分隔符拼接后一次扫描完成匹配，再按层级累计权重给出分类与置信度。
+
+分类规则与前端保持一致：
+- 已有 question_type 时先按 QUESTION_TYPE_TO_BLOOM 映射（作为先验分数）
+- 关键词命中累加对应层级的分数，同分时取更高的认知层级
+- 没有任何依据时归为 understand（与前端默认值相同）
+"""
+from bisect import bisect_right
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+BLOOM_LEVELS = ('remember', 'understand', 'apply', 'analyze', 'evaluate', 'create')
+
+BLOOM_LABELS = {
+    'remember': '记忆 (Remember)',
+    'understand': '理解 (Understand)',
+    'apply': '应用 (Apply)',
+    'analyze': '分析 (Analyze)',
+    'evaluate': '评价 (Evaluate)',
+    'create': '创造 (Create)',
+}
+
+# 没有任何依据时的默认层级（与前端 classifyTurn 一致）
+DEFAULT_LEVEL = 'understand'
+
+# 六个层级的关键词及权重（强特征 2.0，一般特征 1.0）
+BLOOM_LEXICON: Dict[str, List[Tuple[str, float]]] = {
+    'remember': [
+        ('是什么', 1.0), ('什么是', 2.0), ('定义', 2.0), ('哪些', 1.0), ('列出', 2.0), ('列举', 2.0),
+        ('叫什么', 2.0), ('哪一年', 2.0), ('谁发明', 2.0), ('全称', 2.0), ('公式是', 1.0), ('记住', 1.0),
+        ('what is', 1.0), ('define', 2.0), ('definition', 2.0), ('list', 1.0), ('name the', 2.0),
+        ('who invented', 2.0), ('when was', 2.0), ('recall', 2.0), ('stands for', 2.0),
+    ],
+    'understand': [
+        ('解释', 2.0), ('什么意思', 2.0), ('为什么', 1.0), ('理解', 1.0), ('区别是', 1.0), ('举个例子', 2.0),
+        ('举例', 2.0), ('说明一下', 1.0), ('总结', 2.0), ('概括', 2.0), ('通俗', 2.0), ('原理', 1.0),
+        ('explain', 2.0), ('what does', 1.0), ('mean', 1.0), ('why', 1.0), ('summarize', 2.0),
+        ('example', 1.0), ('describe', 1.0), ('in other words', 2.0), ('understand', 1.0),
+    ],
+    'apply': [
+        ('如何', 1.0), ('怎么', 1.0), ('步骤', 2.0), ('使用', 1.0), ('安装', 2.0), ('配置', 2.0), ('运行', 1.0),
+        ('报错', 2.0), ('修复', 2.0), ('计算', 1.0), ('用哪种', 1.0), ('示例代码', 2.0), ('解决', 1.0),
+        ('how to', 1.0), ('how do i', 2.0), ('how can i', 2.0), ('install', 2.0), ('configure', 2.0),
+        ('use', 1.0), ('run', 1.0), ('fix', 2.0), ('error', 1.0), ('calculate', 2.0), ('step by step', 2.0),
+    ],
+    'analyze': [
+        ('分析', 2.0), ('结构', 1.0), ('组织', 1.0), ('对比', 2.0), ('比较', 2.0), ('区别', 1.0), ('关系', 1.0),
+        ('原因', 1.0), ('瓶颈', 2.0), ('拆解', 2.0), ('分解', 2.0), ('架构', 1.0), ('优缺点', 2.0),
+        ('analyze', 2.0), ('analyse', 2.0), ('compare', 2.0), ('difference between', 2.0), ('structure', 1.0),
+        ('relationship', 1.0), ('break down', 2.0), ('root cause', 2.0), ('trade-off', 2.0), ('tradeoff', 2.0),
+    ],
+    'evaluate': [
+        ('评价', 2.0), ('评估', 2.0), ('哪个更好', 2.0), ('是否合理', 2.0), ('有没有问题', 1.0), ('建议', 1.0),
+        ('改进', 1.0), ('审查', 2.0), ('判断', 1.0), ('值得', 1.0), ('推荐', 1.0), ('批评', 2.0), ('优化', 1.0),
+        ('evaluate', 2.0), ('assess', 2.0), ('which is better', 2.0), ('review', 2.0), ('critique', 2.0),
+        ('justify', 2.0), ('recommend', 1.0), ('is it worth', 2.0), ('should i', 1.0), ('improve', 1.0),
+    ],
+    'create': [
+        ('设计', 2.0), ('搭建', 2.0), ('实现', 1.0), ('构建', 2.0), ('创建', 1.0), ('开发', 1.0), ('编写', 1.0),
+        ('写一个', 2.0), ('生成', 1.0), ('方案', 1.0), ('创新', 2.0), ('规划', 1.0), ('从零', 2.0),
+        ('design', 2.0), ('build', 2.0), ('create', 1.0), ('develop', 1.0), ('implement', 1.0),
+        ('write a', 2.0), ('generate', 1.0), ('invent', 2.0), ('propose', 2.0), ('from scratch', 2.0),
+    ],
+}
+
+# 流程分析 / 前端问题类型到布鲁姆层级的映射（见 docs/BLOOM_HEURISTIC_EXAMPLE.md）
+QUESTION_TYPE_TO_BLOOM = {
+    'informational': 'remember', 'definition': 'remember', 'factual': 'remember', 'qa': 'remember',
+    'clarification': 'understand', 'clarifying': 'understand', 'explanation': 'understand',
+    'conceptual': 'understand', 'insight': 'understand',
+    'procedural': 'apply', 'tooling': 'apply', 'implementation': 'apply', 'how-to': 'apply',
+    'technical': 'apply', 'styling': 'apply',
+    'architecture': 'analyze', 'planning': 'analyze', 'comparison': 'analyze', 'cost': 'analyze',
+    'deepening': 'analyze',
+    'feedback': 'evaluate', 'report': 'evaluate', 'review': 'evaluate', 'suggestion': 'evaluate',
+    'feature': 'create', 'design': 'create', 'build': 'create', 'innovation': 'create',
+}
+
+# question_type 映射的先验分数
+QUESTION_TYPE_PRIOR = 1.5
+
+# 文本之间的分隔符（不会出现在关键词中，自动机在此处回到根状态）
+_SEPARATOR = '\x00'
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick 多模式匹配自动机
+
+    一次扫描文本即可找出所有模式的全部出现位置，耗时与文本长度和匹配数成正比，
+    与模式数量无关。
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = list(patterns)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = nxt
+            self._output[state].append(pattern_id)
+
+        # 广度优先计算失败指针，并把失败链上的输出合并到当前状态
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        扫描文本
+
+        Yields:
+            (匹配结束位置（不含）, 模式下标)
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                for pattern_id in output[state]:
+                    yield pos + 1, pattern_id
+
+
+@dataclass
+class BloomResult:
+    """单个问题的布鲁姆分类结果"""
+    level: str
+    confidence: float
+    scores: Dict[str, float] = field(default_factory=dict)
+    matched: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return {
+            'level': self.level,
+            'confidence': round(self.confidence, 4),
+            'scores': self.scores,
+            'matched': self.matched,
+        }
+
+
+class BloomEngine:
+    """
+    布鲁姆认知层级分类引擎
+
+    用法:
+        engine = BloomEngine()
+        results = engine.classify_batch(questions, question_types)
+        distribution = engine.distribution(results)
+    """
+
+    def __init__(self, lexicon: Optional[Dict[str, List[Tuple[str, float]]]] = None):
+        """
+        Args:
+            lexicon: 自定义关键词表 {层级: [(关键词, 权重), ...]}，默认使用 BLOOM_LEXICON
+        """
+        lexicon = lexicon or BLOOM_LEXICON
+        self._keywords: List[Tuple[str, str, float]] = [
+            (keyword.lower(), level, weight)
+            for level in BLOOM_LEVELS
+            for keyword, weight in lexicon.get(level, [])
+        ]
+        self._automaton = AhoCorasick([keyword for keyword, _, _ in self._keywords])
+        # 英文关键词需要单词边界，避免 "use" 命中 "because"
+        self._needs_boundary = [keyword[0].isascii() and keyword[0].isalnum() for keyword, _, _ in self._keywords]
+
+    @staticmethod
+    def _is_word_char(ch: str) -> bool:
+        return ch.isascii() and (ch.isalnum() or ch == '_')
+
+    def classify_batch(
+        self,
+        questions: Sequence[str],
+        question_types: Optional[Sequence[Optional[str]]] = None
+    ) -> List[BloomResult]:
+        """
+        批量分类：所有问题拼接后只扫描一次
+
+        Args:
+            questions: 问题文本列表
+            question_types: 对应的问题类型（可选，来自流程分析或前端）
+        """
+        texts = [(q or '').lower().replace(_SEPARATOR, ' ') for q in questions]
+        joined = _SEPARATOR.join(texts)
+        starts = []
+        offset = 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text) + 1
+
+        scores: List[Dict[str, float]] = [{} for _ in texts]
+        matched: List[List[str]] = [[] for _ in texts]
+        for end, pattern_id in self._automaton.iter_matches(joined):
+            keyword, level, weight = self._keywords[pattern_id]
+            begin = end - len(keyword)
+            if self._needs_boundary[pattern_id] and (
+                (begin > 0 and self._is_word_char(joined[begin - 1]))
+                or (end < len(joined) and self._is_word_char(joined[end]))
+            ):
+                continue
+            idx = bisect_right(starts, begin) - 1
+            scores[idx][level] = scores[idx].get(level, 0.0) + weight
+            matched[idx].append(keyword)
+
+        if question_types is not None:
+            for idx, question_type in enumerate(question_types):
+                level = QUESTION_TYPE_TO_BLOOM.get((question_type or '').lower())
+                if level:
+                    scores[idx][level] = scores[idx].get(level, 0.0) + QUESTION_TYPE_PRIOR
+
+        return [self._decide(s, m) for s, m in zip(scores, matched)]
+
+    def classify(self, question: str, question_type: Optional[str] = None) -> BloomResult:
+        """分类单个问题"""
+        return self.classify_batch([question], [question_type])[0]
+
+    def classify_turns(self, turns: List[Dict[str, str]]) -> List[BloomResult]:
+        """分类 ChatDataLoader.get_conversation_turns 返回的回合（或带 question_type 的流程分析回合）"""
+        return self.classify_batch(
+            [t.get('question', '') for t in turns],
+            [t.get('question_type') for t in turns]
+        )
+
+    @staticmethod
+    def _decide(scores: Dict[str, float], matched: List[str]) -> BloomResult:
+        """
+        取分数最高的层级（同分取更高的认知层级）
+
+        置信度 = 最高分 / (总分 + 1)，加 1 作为先验：单个一般特征 0.5，互相冲突的特征会拉低置信度
+        """
+        if not scores:
+            return BloomResult(level=DEFAULT_LEVEL, confidence=0.0, scores={}, matched=[])
+        level = max(BLOOM_LEVELS, key=lambda lv: (scores.get(lv, 0.0), BLOOM_LEVELS.index(lv)))
+        confidence = scores[level] / (sum(scores.values()) + 1.0)
+        return BloomResult(level=level, confidence=confidence, scores=scores, matched=matched)
+
+    @staticmethod
+    def distribution(results: List[BloomResult]) -> Dict[str, float]:
+        """各层级占比（百分比）"""
+        total = len(results)
+        counts = {level: 0 for level in BLOOM_LEVELS}
+        for result in results:
+            counts[result.level] += 1
+        return {level: (count / total * 100 if total else 0.0) for level, count in counts.items()}
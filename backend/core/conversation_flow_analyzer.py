@@ -2,12 +2,72 @@
 对话流程分析器 - 分析整个对话的发展过程
 针对完整对话链条,识别关键问题、无效问题、话题转折等
 """
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Literal, Optional, Tuple
 from deepeval.test_case import LLMTestCase
 from deepeval.metrics import BaseMetric
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
 import json
 
+from core.local_classifier import LocalQuestionClassifier
+from core.token_budget import ContextBudget, estimate_tokens
+from core.topic_shift import TopicShiftDetector
+from core.turn_cache import TurnResultCache
+
+# 导入配置中心
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config.llm_config import LLMConfig
+from utils.metrics import LLM_JSON_PARSE_FAILURES
+from utils.tracing import span, traced
+
+
+# 单轮与批量分析共用的判定标准
+ANALYSIS_CRITERIA = """1. 问题类型(question_type):
+   - clarifying: 澄清性问题(要求解释、举例)
+   - deepening: 深入性问题(深挖细节、探讨方案)
+   - emotional: 情感性问题(求助、倾诉)
+   - technical: 技术性问题(how-to、troubleshooting)
+   - off-topic: 偏题/闲聊
+
+2. 价值等级(value_level):
+   - high: 高价值(能引发有用回答)
+   - medium: 中等价值
+   - low: 低价值(无意义/重复)
+
+3. 是否基于前文(builds_on_previous): true/false
+4. 是否话题转移(topic_shift): true/false
+5. 原因(reason): 简短说明判断依据"""
+
+# 批量分析时每个回合预留的输出 token 数
+BATCH_OUTPUT_TOKENS_PER_TURN = 120
+
+# 提示词版本：修改 ANALYSIS_CRITERIA 或提示词模板后需要递增，使旧的回合缓存失效
+FLOW_PROMPT_VERSION = "flow-v2"
+
+# 缓存的回合分类字段（turn_index / question 由回合位置重新生成）
+CACHED_TURN_FIELDS = ('question_type', 'value_level', 'builds_on_previous', 'topic_shift', 'reason')
+
+
+def _run_coroutine(coro):
+    """在同步代码中运行协程；若当前线程已有运行中的事件循环（如 FastAPI 处理函数），则在新线程中运行"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # 在当前上下文的副本中运行，保留激活的阶段追踪
+        return executor.submit(contextvars.copy_context().run, asyncio.run, coro).result()
+
+
+def _notify_turn(on_turn: Optional[Callable[[Dict[str, Any]], None]], result: Dict[str, Any]):
+    """把 LLM 分析得到的回合结果交给回调（副本，标记来源）"""
+    if on_turn is not None:
+        on_turn({**result, 'source': 'llm'})
+
 
 class QuestionClassification(BaseModel):
     """问题分类结果"""
@@ -24,20 +84,77 @@ class TurnAnalysis(BaseModel):
     topic_shift: bool
 
 
+class BatchTurnItem(BaseModel):
+    """批量分析中单个回合的结果（用于校验 LLM 返回的数组元素）"""
+    turn_index: int
+    question_type: Literal['clarifying', 'deepening', 'emotional', 'technical', 'off-topic']
+    value_level: Literal['high', 'medium', 'low']
+    builds_on_previous: bool
+    topic_shift: bool
+    reason: str = ''
+
+
+# 结果中展示的问题最多保留的字符数（超出部分用 ... 代替）
+QUESTION_PREVIEW_CHARS = 100
+
+
+def _question_preview(question: str) -> str:
+    """截断过长的问题用于结果展示"""
+    return question[:QUESTION_PREVIEW_CHARS] + '...' if len(question) > QUESTION_PREVIEW_CHARS else question
+
+
+def _strip_code_fence(response_text: str) -> str:
+    """去掉 markdown 代码块包裹"""
+    response_text = response_text.strip()
+    if response_text.startswith('```json'):
+        response_text = response_text[7:]
+    if response_text.startswith('```'):
+        response_text = response_text[3:]
+    if response_text.endswith('```'):
+        response_text = response_text[:-3]
+    return response_text.strip()
+
+
 class ConversationFlowAnalyzer:
     """对话流程分析器"""
     
-    def __init__(self, model):
+    def __init__(
+        self,
+        model,
+        cache: Optional[TurnResultCache] = None,
+        local_classifier: Optional[LocalQuestionClassifier] = None,
+        topic_detector: Optional[TopicShiftDetector] = None,
+        topic_shift_mode: Optional[str] = None,
+        context_budget: Optional[ContextBudget] = None
+    ):
         """
         Args:
             model: LLM 模型实例(用于分析)
+            cache: 回合分类结果缓存；提供时已分析过的回合直接复用结果，只为新回合调用 LLM
+            local_classifier: 本地问题分类器；置信度达到阈值的回合不再调用 LLM
+            topic_detector: 词汇话题转移检测器；启用本地分类器或指定 topic_shift_mode 时默认创建
+            topic_shift_mode: 'fill' 用词汇检测结果填充所有回合的 topic_shift / builds_on_previous，
+                'cross_check' 保留 LLM 判断并与词汇检测结果对照；None 只填充本地分类器判定的回合
+            context_budget: 提示词 token 预算，超出时裁剪/摘要前文（默认按 LLMConfig 的流程分析预算）
         """
+        if topic_shift_mode is not None and topic_shift_mode not in TopicShiftDetector.MODES:
+            raise ValueError(f"未知的话题转移检测模式: {topic_shift_mode}")
         self.model = model
+        self.cache = cache
+        self.local_classifier = local_classifier
+        self.topic_shift_mode = topic_shift_mode
+        if topic_detector is None and (local_classifier is not None or topic_shift_mode is not None):
+            topic_detector = TopicShiftDetector()
+        self.topic_detector = topic_detector
+        self.context_budget = context_budget or ContextBudget(LLMConfig.get_prompt_budget("flow_analysis"))
     
     def analyze_conversation_flow(
         self, 
         conversation_turns: List[Dict[str, str]],
-        conversation_title: str = ""
+        conversation_title: str = "",
+        concurrency: int = 1,
+        batch_size: Optional[int] = None,
+        on_turn: Optional[Callable[[Dict[str, Any]], None]] = None
     ) -> Dict[str, Any]:
         """
         分析完整对话流程
@@ -45,6 +162,12 @@ class ConversationFlowAnalyzer:
         Args:
             conversation_turns: 对话回合列表 [{"question": "...", "answer": "..."}, ...]
             conversation_title: 对话标题
+            concurrency: 并发分析的回合数上限；每轮提示词只依赖前两轮原文，
+                不依赖之前的 LLM 结果，因此所有回合可以并发分析，1 表示逐轮顺序分析
+            batch_size: 设置后启用窗口批量模式，一次请求最多分析 batch_size 个连续回合
+                （实际窗口大小还受模型上下文预算限制），校验失败的回合回退为逐轮分析
+            on_turn: 每个回合得到分类结果时的回调（缓存/本地分类器的结果先回调，LLM 结果按完成顺序回调），
+                在分析线程中调用；回调抛出的异常会中止分析
             
         Returns:
             分析结果字典
@@ -52,6 +175,343 @@ class ConversationFlowAnalyzer:
         print(f"\n分析对话流程: {conversation_title}")
         print(f"总回合数: {len(conversation_turns)}")
         
+        budget_snapshot = self.context_budget.snapshot()
+        with span('flow.prepare', turns=len(conversation_turns)):
+            turn_results, pending, state = self._prepare_turns(conversation_turns, batch_size)
+        if on_turn is not None:
+            for result in turn_results:
+                if result is not None:
+                    on_turn(dict(result))
+        
+        with span('flow.analyze_turns', pending=len(pending)):
+            new_results = self._analyze_pending(
+                conversation_turns, pending, concurrency, batch_size, on_turn
+            )
+        
+        with span('flow.finalize'):
+            results = self._finalize_turns(
+                conversation_turns, conversation_title, turn_results, pending, new_results, state
+            )
+        results['context_budget'] = self.context_budget.stats(since=budget_snapshot)
+        return results
+    
+    def _analyze_pending(
+        self,
+        conversation_turns: List[Dict[str, str]],
+        pending: List[int],
+        concurrency: int,
+        batch_size: Optional[int],
+        on_turn: Optional[Callable[[Dict[str, Any]], None]]
+    ) -> List[Dict[str, Any]]:
+        """用 LLM 分析缓存/本地分类器未覆盖的回合（批量、并发或逐轮），按 pending 顺序返回结果"""
+        if not pending:
+            new_results = []
+        elif batch_size and batch_size > 1:
+            new_results = _run_coroutine(
+                self._analyze_turns_batched(conversation_turns, batch_size, max(1, concurrency), pending, on_turn)
+            )
+        elif concurrency > 1 and len(pending) > 1:
+            print(f"并发分析: 最多 {concurrency} 个回合同时进行")
+            new_results = _run_coroutine(
+                self._analyze_turns_concurrently(conversation_turns, concurrency, pending, on_turn)
+            )
+        else:
+            # 逐轮分析
+            new_results = []
+            for idx in pending:
+                print(f"\n分析第 {idx+1}/{len(conversation_turns)} 轮...")
+                result = self._analyze_single_turn(
+                    conversation_turns[idx],
+                    idx,
+                    conversation_turns[:idx] if idx > 0 else []
+                )
+                _notify_turn(on_turn, result)
+                new_results.append(result)
+        return new_results
+    
+    def _prepare_turns(
+        self,
+        conversation_turns: List[Dict[str, str]],
+        batch_size: Optional[int] = None
+    ) -> Tuple[List[Optional[Dict[str, Any]]], List[int], Dict[str, Any]]:
+        """
+        查询缓存并运行本地分类器，找出仍需 LLM 分析的回合
+        
+        Args:
+            batch_size: 同 analyze_conversation_flow，决定缓存键中的分析模式
+        
+        Returns:
+            (逐轮结果（待分析的位置为 None）, 待 LLM 分析的回合下标, 传给 _finalize_turns 的状态)
+        """
+        turn_results: List[Optional[Dict[str, Any]]] = [None] * len(conversation_turns)
+        cache_keys = self._lookup_cache(conversation_turns, turn_results, 'batch' if batch_size else 'single')
+        cache_hits = 0
+        for result in turn_results:
+            if result is not None:
+                result['source'] = 'cache'
+                cache_hits += 1
+        local_count = self._apply_local_classifier(conversation_turns, turn_results)
+        pending = [idx for idx, result in enumerate(turn_results) if result is None]
+        state = {'cache_keys': cache_keys, 'cache_hits': cache_hits, 'local_count': local_count}
+        return turn_results, pending, state
+    
+    def _finalize_turns(
+        self,
+        conversation_turns: List[Dict[str, str]],
+        conversation_title: str,
+        turn_results: List[Optional[Dict[str, Any]]],
+        pending: List[int],
+        new_results: List[Dict[str, Any]],
+        state: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """合并 LLM 结果、写入缓存、应用话题转移检测并汇总"""
+        cache_keys = state['cache_keys']
+        for idx, result in zip(pending, new_results):
+            result['source'] = 'llm'
+            turn_results[idx] = result
+            if cache_keys and result['question_type'] != 'unknown':
+                # 分析失败的回合不缓存，下次重新分析
+                self.cache.set(cache_keys[idx], {field: result[field] for field in CACHED_TURN_FIELDS})
+        
+        topic_check = None
+        if self.topic_detector is not None:
+            topic_check = self.topic_detector.apply(conversation_turns, turn_results, self.topic_shift_mode)
+        
+        results = self._assemble_results(conversation_turns, turn_results, conversation_title)
+        if topic_check is not None:
+            results['topic_shift_check'] = topic_check
+        if self.cache is not None:
+            results['cache'] = {
+                'hits': state['cache_hits'],
+                'misses': len(conversation_turns) - state['cache_hits']
+            }
+        if self.local_classifier is not None:
+            results['local_classifier'] = {
+                'threshold': self.local_classifier.threshold,
+                'local_decisions': state['local_count'],
+                'llm_escalations': len(pending)
+            }
+        return results
+    
+    def _model_name(self) -> Optional[str]:
+        return self.model.get_model_name() if hasattr(self.model, 'get_model_name') else None
+    
+    def _lookup_cache(
+        self,
+        conversation_turns: List[Dict[str, str]],
+        turn_results: List[Optional[Dict[str, Any]]],
+        mode: str = 'single'
+    ) -> Optional[List[str]]:
+        """
+        查询回合缓存，把命中的结果填入 turn_results
+        
+        缓存键包含提示词预算与分析模式（single / batch）：两者都会改变 LLM 看到的提示词
+        
+        Returns:
+            每个回合的缓存键；未启用缓存时返回 None
+        """
+        if self.cache is None:
+            return None
+        model_name = self._model_name() or ''
+        keys = [
+            TurnResultCache.make_key(
+                turn['question'], conversation_turns[:idx], FLOW_PROMPT_VERSION, model_name,
+                prompt_budget=self.context_budget.max_tokens, mode=mode
+            )
+            for idx, turn in enumerate(conversation_turns)
+        ]
+        for idx, (turn, key) in enumerate(zip(conversation_turns, keys)):
+            cached = self.cache.get(key)
+            if cached is not None:
+                turn_results[idx] = {
+                    'turn_index': idx + 1,
+                    'question': _question_preview(turn['question']),
+                    **cached
+                }
+        hits = sum(result is not None for result in turn_results)
+        print(f"回合缓存命中: {hits}/{len(conversation_turns)}")
+        return keys
+    
+    def _apply_local_classifier(
+        self,
+        conversation_turns: List[Dict[str, str]],
+        turn_results: List[Optional[Dict[str, Any]]]
+    ) -> int:
+        """
+        用本地分类器预测尚未有结果的回合，置信度达到阈值的结果填入 turn_results
+        
+        本地分类器只判断 question_type / value_level；topic_shift / builds_on_previous
+        先按首轮规则占位，随后由词汇话题转移检测器填充。
+        
+        Returns:
+            本地判定的回合数
+        """
+        if self.local_classifier is None:
+            return 0
+        indices = [idx for idx, result in enumerate(turn_results) if result is None]
+        predictions = self.local_classifier.predict_batch([conversation_turns[idx]['question'] for idx in indices])
+        
+        decided = 0
+        for idx, prediction in zip(indices, predictions):
+            if prediction.confidence < self.local_classifier.threshold:
+                continue
+            turn_results[idx] = {
+                'turn_index': idx + 1,
+                'question': _question_preview(conversation_turns[idx]['question']),
+                'question_type': prediction.question_type,
+                'value_level': prediction.value_level,
+                'builds_on_previous': idx > 0,
+                'topic_shift': False,
+                'reason': f'本地分类器判定（置信度 {prediction.confidence:.2f}）',
+                'confidence': round(prediction.confidence, 4),
+                'source': 'local'
+            }
+            decided += 1
+        print(f"本地分类器: {decided}/{len(indices)} 个回合置信度达标，其余交给 LLM")
+        return decided
+    
+    async def _analyze_turns_concurrently(
+        self,
+        conversation_turns: List[Dict[str, str]],
+        concurrency: int,
+        indices: List[int],
+        on_turn: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """预先构建指定回合的提示词，以有限并发通过异步客户端分发，按 indices 顺序返回结果"""
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def analyze(idx: int) -> Dict[str, Any]:
+            result = await self._a_analyze_single_turn(conversation_turns, idx, semaphore)
+            _notify_turn(on_turn, result)
+            return result
+        
+        return await asyncio.gather(*[analyze(idx) for idx in indices])
+    
+    async def _a_analyze_single_turn(
+        self,
+        conversation_turns: List[Dict[str, str]],
+        idx: int,
+        semaphore: asyncio.Semaphore
+    ) -> Dict[str, Any]:
+        """异步分析单个回合（受信号量限制并发）"""
+        turn = conversation_turns[idx]
+        prompt = self._build_turn_prompt(turn, conversation_turns[:idx])
+        async with semaphore:
+            try:
+                response_text = await self.model.a_generate(prompt, schema=None)
+                result = self._parse_turn_response(response_text, turn, idx)
+            except Exception as e:
+                print(f"  第 {idx+1} 轮分析失败: {e}")
+                return self._failed_turn_result(turn, idx, e)
+        print(f"  第 {idx+1}/{len(conversation_turns)} 轮分析完成")
+        return result
+    
+    async def _analyze_turns_batched(
+        self,
+        conversation_turns: List[Dict[str, str]],
+        batch_size: int,
+        concurrency: int,
+        indices: List[int],
+        on_turn: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """按窗口批量分析指定回合，窗口内校验失败的回合回退为逐轮分析，按 indices 顺序返回结果"""
+        windows = self._plan_windows(conversation_turns, batch_size, indices)
+        print(f"批量分析: {len(indices)} 个回合分为 {len(windows)} 个窗口")
+        semaphore = asyncio.Semaphore(concurrency)
+        turn_results: List[Optional[Dict[str, Any]]] = [None] * len(conversation_turns)
+        
+        async def analyze_window(start: int, end: int):
+            prompt = self._build_batch_prompt(conversation_turns, start, end)
+            async with semaphore:
+                try:
+                    response_text = await self.model.a_generate(prompt, schema=None)
+                    items = self._parse_batch_response(response_text, conversation_turns, start, end)
+                except Exception as e:
+                    print(f"  回合 {start+1}-{end} 批量分析失败: {e}")
+                    items = {}
+            for idx, result in items.items():
+                turn_results[idx] = result
+            
+            missing = [idx for idx in range(start, end) if idx not in items]
+            if missing:
+                print(f"  回合 {[idx + 1 for idx in missing]} 批量结果无效，回退为逐轮分析")
+                fallback = await asyncio.gather(*[
+                    self._a_analyze_single_turn(conversation_turns, idx, semaphore)
+                    for idx in missing
+                ])
+                for idx, result in zip(missing, fallback):
+                    turn_results[idx] = result
+            for idx in range(start, end):
+                _notify_turn(on_turn, turn_results[idx])
+            print(f"  回合 {start+1}-{end} 分析完成")
+        
+        await asyncio.gather(*[analyze_window(start, end) for start, end in windows])
+        return [turn_results[idx] for idx in indices]
+    
+    def _batch_text_cap(self) -> int:
+        """批量提示词中单段问题/回答的 token 上限（单轮提示词预算的一半）"""
+        return max(1, self.context_budget.max_tokens // 2)
+    
+    def _context_budget(self) -> int:
+        """批量请求可用的 token 预算（模型上下文窗口留出 10% 余量）"""
+        return int(LLMConfig.get_context_window(self._model_name()) * 0.9)
+    
+    def _plan_windows(
+        self,
+        conversation_turns: List[Dict[str, str]],
+        batch_size: int,
+        indices: Optional[List[int]] = None
+    ) -> List[Tuple[int, int]]:
+        """
+        划分批量窗口：每个窗口最多 batch_size 个回合，且估算的提示词 + 输出 token 不超过上下文预算
+        
+        Args:
+            indices: 需要分析的回合下标（升序），None 表示全部回合；窗口不跨越不连续的下标
+        
+        Returns:
+            [(start, end), ...]，左闭右开
+        """
+        budget = self._context_budget()
+        base_tokens = estimate_tokens(self._build_batch_prompt([], 0, 0))
+        # 批量提示词中每段文本会被压缩到 _batch_text_cap 以内
+        cap = self._batch_text_cap()
+        turn_tokens = [
+            min(estimate_tokens(t['question']), cap) + min(estimate_tokens(t['answer']), cap) + 10
+            for t in conversation_turns
+        ]
+        
+        if indices is None:
+            indices = list(range(len(conversation_turns)))
+        # 每段连续下标的结束位置（左闭右开）
+        run_end = {}
+        for pos in range(len(indices) - 1, -1, -1):
+            idx = indices[pos]
+            run_end[idx] = run_end[idx + 1] if idx + 1 in run_end else idx + 1
+        
+        windows = []
+        pos = 0
+        while pos < len(indices):
+            start = indices[pos]
+            limit = run_end[start]
+            used = base_tokens + sum(turn_tokens[max(0, start - 2):start])
+            end = start
+            while end < limit and end - start < batch_size:
+                cost = turn_tokens[end] + BATCH_OUTPUT_TOKENS_PER_TURN
+                if end > start and used + cost > budget:
+                    break
+                used += cost
+                end += 1
+            windows.append((start, end))
+            pos += end - start
+        return windows
+    
+    def _assemble_results(
+        self,
+        conversation_turns: List[Dict[str, str]],
+        turn_results: List[Dict[str, Any]],
+        conversation_title: str
+    ) -> Dict[str, Any]:
+        """按回合顺序汇总逐轮分析结果"""
         results = {
             'conversation_title': conversation_title,
             'total_turns': len(conversation_turns),
@@ -62,16 +522,7 @@ class ConversationFlowAnalyzer:
             'flow_summary': {}
         }
         
-        # 逐轮分析
-        for idx, turn in enumerate(conversation_turns):
-            print(f"\n分析第 {idx+1}/{len(conversation_turns)} 轮...")
-            
-            turn_result = self._analyze_single_turn(
-                turn,
-                idx,
-                conversation_turns[:idx] if idx > 0 else []
-            )
-            
+        for idx, (turn, turn_result) in enumerate(zip(conversation_turns, turn_results)):
             results['turn_analysis'].append(turn_result)
             
             # 分类存储
@@ -101,82 +552,187 @@ class ConversationFlowAnalyzer:
         
         return results
     
-    def _analyze_single_turn(
+    @traced('flow.build_prompt')
+    def _build_turn_prompt(
         self,
         turn: Dict[str, str],
-        turn_index: int,
         previous_turns: List[Dict[str, str]]
-    ) -> Dict[str, Any]:
-        """分析单个对话回合"""
-        
-        # 构建分析提示词
+    ) -> str:
+        """构建单轮分析提示词（只依赖前两轮原文，按 token 预算裁剪）"""
+        previous = previous_turns[-2:]  # 只看最近2轮
+        # 优先级从低到高：较早回合的回答、问题，最近回合的回答、问题，当前问题
+        sections = [text for t in previous for text in (t['answer'], t['question'])] + [turn['question']]
+        fitted = self.context_budget.fit(
+            sections,
+            fixed_tokens=estimate_tokens(self._render_turn_prompt([{'question': '', 'answer': ''}] * len(previous), ''))
+        )
+        previous = [{'question': fitted[2 * i + 1], 'answer': fitted[2 * i]} for i in range(len(previous))]
+        return self._render_turn_prompt(previous, fitted[-1])
+    
+    def _render_turn_prompt(self, previous_turns: List[Dict[str, str]], question: str) -> str:
         context = "\n\n".join([
-            f"问题 {i+1}: {t['question']}\n回答 {i+1}: {t['answer']}"
-            for i, t in enumerate(previous_turns[-2:])  # 只看最近2轮
+            f"问题 {i+1}: {t['question'] or '（已省略）'}\n回答 {i+1}: {t['answer'] or '（已省略）'}"
+            for i, t in enumerate(previous_turns)
         ])
+        context_block = '前两轮对话:\n' + context if context else '这是对话的第一轮'
         
-        prompt = f"""你是一个对话质量分析专家。分析以下用户问题的价值和类型。
+        return f"""你是一个对话质量分析专家。分析以下用户问题的价值和类型。
 
-{'前两轮对话:\n' + context if context else '这是对话的第一轮'}
+{context_block}
 
-当前问题: {turn['question']}
+当前问题: {question}
 
 请分析:
-1. 问题类型(question_type):
-   - clarifying: 澄清性问题(要求解释、举例)
-   - deepening: 深入性问题(深挖细节、探讨方案)
-   - emotional: 情感性问题(求助、倾诉)
-   - technical: 技术性问题(how-to、troubleshooting)
-   - off-topic: 偏题/闲聊
+{ANALYSIS_CRITERIA}
 
-2. 价值等级(value_level):
-   - high: 高价值(能引发有用回答)
-   - medium: 中等价值
-   - low: 低价值(无意义/重复)
+以 JSON 格式返回。
+"""
+    
+    @traced('flow.build_prompt')
+    def _build_batch_prompt(
+        self,
+        conversation_turns: List[Dict[str, str]],
+        start: int,
+        end: int
+    ) -> str:
+        """构建窗口批量分析提示词：说明只发送一次，窗口前两轮作为共享上下文"""
+        context_start = max(0, start - 2)
+        turns = conversation_turns[context_start:end]
+        # 所有片段一起压缩，预算统计中整个批量提示词计为一个提示词
+        texts = iter(self.context_budget.cap_all(
+            [text for t in turns for text in (t['question'], t['answer'])],
+            self._batch_text_cap()
+        ))
+        capped = [{'question': next(texts), 'answer': next(texts)} for _ in turns]
+        
+        context = "\n\n".join([
+            f"问题 {i+1}: {t['question']}\n回答 {i+1}: {t['answer']}"
+            for i, t in enumerate(capped[:start - context_start], start=context_start)
+        ])
+        context_block = '此前的对话:\n' + context if context else '以下从对话的第一轮开始'
+        window = "\n\n".join([
+            f"回合 {i+1}:\n问题: {t['question']}\n回答: {t['answer']}"
+            for i, t in enumerate(capped[start - context_start:], start=start)
+        ])
+        
+        return f"""你是一个对话质量分析专家。下面是一段对话中连续的多个回合，请逐一分析每个回合中用户问题的价值和类型。
+判断"是否基于前文"和"是否话题转移"时，参考该回合之前的两轮对话。
 
-3. 是否基于前文(builds_on_previous): true/false
-4. 是否话题转移(topic_shift): true/false
-5. 原因(reason): 简短说明判断依据
+{context_block}
 
-以 JSON 格式返回。
+待分析回合:
+{window}
+
+对每个回合分析:
+{ANALYSIS_CRITERIA}
+
+以 JSON 数组返回，每个回合一个对象，按回合顺序排列，格式如下:
+[{{"turn_index": 回合编号, "question_type": "...", "value_level": "...", "builds_on_previous": true, "topic_shift": false, "reason": "..."}}]
 """
+    
+    @traced('flow.parse_response')
+    def _parse_batch_response(
+        self,
+        response_text: str,
+        conversation_turns: List[Dict[str, str]],
+        start: int,
+        end: int
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        解析批量分析响应，只返回通过校验的回合
+        
+        Returns:
+            {回合下标(从0开始): 单轮分析结果}
+        """
+        try:
+            data = json.loads(_strip_code_fence(response_text))
+        except json.JSONDecodeError:
+            LLM_JSON_PARSE_FAILURES.inc('flow_batch')
+            raise
+        if isinstance(data, dict):
+            # 兼容 {"turns": [...]} / {"results": [...]} 之类的包裹
+            data = next((v for v in data.values() if isinstance(v, list)), [])
+        
+        items = {}
+        for raw in data if isinstance(data, list) else []:
+            try:
+                item = BatchTurnItem(**raw)
+            except (ValidationError, TypeError):
+                continue
+            idx = item.turn_index - 1
+            if not start <= idx < end or idx in items:
+                continue
+            turn = conversation_turns[idx]
+            items[idx] = {
+                'turn_index': idx + 1,
+                'question': _question_preview(turn['question']),
+                'question_type': item.question_type,
+                'value_level': item.value_level,
+                'builds_on_previous': item.builds_on_previous,
+                'topic_shift': item.topic_shift,
+                'reason': item.reason
+            }
+        return items
+    
+    @traced('flow.parse_response')
+    def _parse_turn_response(
+        self,
+        response_text: str,
+        turn: Dict[str, str],
+        turn_index: int
+    ) -> Dict[str, Any]:
+        """解析单轮分析的 LLM 响应（JSON 无效时抛出异常）"""
+        try:
+            analysis = json.loads(_strip_code_fence(response_text))
+        except json.JSONDecodeError:
+            LLM_JSON_PARSE_FAILURES.inc('flow_turn')
+            raise
+        
+        return {
+            'turn_index': turn_index + 1,
+            'question': _question_preview(turn['question']),
+            'question_type': analysis.get('question_type', 'unknown'),
+            'value_level': analysis.get('value_level', 'medium'),
+            'builds_on_previous': analysis.get('builds_on_previous', False),
+            'topic_shift': analysis.get('topic_shift', False),
+            'reason': analysis.get('reason', '')
+        }
+    
+    def _failed_turn_result(
+        self,
+        turn: Dict[str, str],
+        turn_index: int,
+        error: Exception
+    ) -> Dict[str, Any]:
+        """分析失败时的默认结果"""
+        return {
+            'turn_index': turn_index + 1,
+            'question': turn['question'][:100],
+            'question_type': 'unknown',
+            'value_level': 'medium',
+            'builds_on_previous': False,
+            'topic_shift': False,
+            'reason': f'分析出错: {str(error)}'
+        }
+    
+    def _analyze_single_turn(
+        self,
+        turn: Dict[str, str],
+        turn_index: int,
+        previous_turns: List[Dict[str, str]]
+    ) -> Dict[str, Any]:
+        """分析单个对话回合"""
+        
+        # 构建分析提示词
+        prompt = self._build_turn_prompt(turn, previous_turns)
 
         try:
             # 调用 LLM 分析
             response_text = self.model.generate(prompt, schema=None)
-            
-            # 解析 JSON
-            response_text = response_text.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.startswith('```'):
-                response_text = response_text[3:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            response_text = response_text.strip()
-            
-            analysis = json.loads(response_text)
-            
-            return {
-                'turn_index': turn_index + 1,
-                'question': turn['question'][:100] + '...' if len(turn['question']) > 100 else turn['question'],
-                'question_type': analysis.get('question_type', 'unknown'),
-                'value_level': analysis.get('value_level', 'medium'),
-                'builds_on_previous': analysis.get('builds_on_previous', False),
-                'topic_shift': analysis.get('topic_shift', False),
-                'reason': analysis.get('reason', '')
-            }
+            return self._parse_turn_response(response_text, turn, turn_index)
         except Exception as e:
             print(f"  分析失败: {e}")
-            return {
-                'turn_index': turn_index + 1,
-                'question': turn['question'][:100],
-                'question_type': 'unknown',
-                'value_level': 'medium',
-                'builds_on_previous': False,
-                'topic_shift': False,
-                'reason': f'分析出错: {str(e)}'
-            }
+            return self._failed_turn_result(turn, turn_index, e)
     
     def _generate_flow_summary(self, results: Dict[str, Any]) -> Dict[str, Any]:
         """生成对话流程摘要"""
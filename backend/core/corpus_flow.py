@@ -0,0 +1,336 @@
+"""
+语料级对话流程分析
+
+/api/analyze-flow 和 ConversationFlowAnalyzer 的演示只分析最长的一个对话。
+CorpusFlowAnalyzer 把所有对话的回合调度到同一个线程池：
+- 每个对话先查缓存 / 走本地分类器，剩余回合作为独立任务提交到共享线程池，
+  小对话不会让工作线程空闲，大对话也不会独占
+- 某个对话的所有回合完成后立即产出该对话的结果（流式）
+- 同时增量更新全局、按用户、按时间段的分布统计
+"""
+import argparse
+import contextvars
+import json
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from core.conversation_flow_analyzer import ConversationFlowAnalyzer
+from core.data_loader import ChatDataLoader, Conversation
+from core.summary_stats import RunningStats
+
+# 导入配置中心
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config.llm_config import LLMConfig
+from utils.tracing import span
+
+
+TIME_BUCKETS = ('day', 'week', 'month')
+
+
+def time_bucket(timestamp: Optional[float], granularity: str = 'month') -> str:
+    """把 Unix 时间戳映射为时间段标签（day: 2025-11-18, week: 2025-W47, month: 2025-11）"""
+    if not timestamp:
+        return 'unknown'
+    moment = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    if granularity == 'day':
+        return moment.strftime('%Y-%m-%d')
+    if granularity == 'week':
+        year, week, _ = moment.isocalendar()
+        return f"{year}-W{week:02d}"
+    return moment.strftime('%Y-%m')
+
+
+class FlowAggregate:
+    """流程分析结果的增量聚合（可合并）"""
+
+    def __init__(self):
+        self.conversations = 0
+        self.turns = 0
+        self.question_types: Dict[str, int] = {}
+        self.value_levels: Dict[str, int] = {}
+        self.topic_shifts = 0
+        self.builds_on_previous = 0
+        self.efficiency = RunningStats()
+
+    def add_turn(self, turn_result: Dict[str, Any]):
+        """加入一个回合的分析结果"""
+        self.turns += 1
+        qtype = turn_result.get('question_type', 'unknown')
+        self.question_types[qtype] = self.question_types.get(qtype, 0) + 1
+        level = turn_result.get('value_level', 'medium')
+        self.value_levels[level] = self.value_levels.get(level, 0) + 1
+        self.topic_shifts += bool(turn_result.get('topic_shift'))
+        self.builds_on_previous += bool(turn_result.get('builds_on_previous'))
+
+    def add_conversation(self, flow_summary: Dict[str, Any]):
+        """加入一个对话的流程摘要（只计对话数与效率分数，回合需另行 add_turn）"""
+        self.conversations += 1
+        self.efficiency.update(flow_summary.get('efficiency_score', 0.0))
+
+    def merge(self, other: 'FlowAggregate') -> 'FlowAggregate':
+        """合并另一个聚合，原地更新并返回自身"""
+        self.conversations += other.conversations
+        self.turns += other.turns
+        for qtype, n in other.question_types.items():
+            self.question_types[qtype] = self.question_types.get(qtype, 0) + n
+        for level, n in other.value_levels.items():
+            self.value_levels[level] = self.value_levels.get(level, 0) + n
+        self.topic_shifts += other.topic_shifts
+        self.builds_on_previous += other.builds_on_previous
+        self.efficiency.merge(other.efficiency)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        turns = self.turns
+        return {
+            'conversations': self.conversations,
+            'total_turns': turns,
+            'question_type_counts': dict(self.question_types),
+            'question_type_distribution': {k: v / turns for k, v in self.question_types.items()} if turns else {},
+            'high_value_ratio': self.value_levels.get('high', 0) / turns if turns else 0,
+            'low_value_ratio': self.value_levels.get('low', 0) / turns if turns else 0,
+            'topic_shift_rate': self.topic_shifts / turns if turns else 0,
+            'builds_on_previous_rate': self.builds_on_previous / turns if turns else 0,
+            'mean_efficiency_score': self.efficiency.mean if self.efficiency.count else 0,
+            'efficiency_std_dev': self.efficiency.std_dev,
+        }
+
+
+class _ConversationJob:
+    """一个对话在共享线程池中的分析状态"""
+
+    def __init__(self, user_id: str, conversation: Conversation, turns: List[Dict[str, Any]]):
+        self.user_id = user_id
+        self.conversation = conversation
+        self.turns = turns
+        self.turn_results: List[Optional[Dict[str, Any]]] = []
+        self.pending: List[int] = []
+        self.state: Dict[str, Any] = {}
+        self.new_results: Dict[int, Dict[str, Any]] = {}
+
+
+class CorpusFlowAnalyzer:
+    """
+    语料级流程分析器
+
+    用法:
+        corpus = CorpusFlowAnalyzer(analyzer, max_workers=8)
+        for result in corpus.analyze({'student_a': 'data/a', 'student_b': 'data/b'}):
+            ...  # 每个对话完成后立即得到结果
+        summary = corpus.summary()
+    """
+
+    def __init__(
+        self,
+        analyzer: ConversationFlowAnalyzer,
+        max_workers: Optional[int] = None,
+        granularity: str = 'month',
+        min_turns: int = 1,
+        max_active_conversations: Optional[int] = None
+    ):
+        """
+        Args:
+            analyzer: 流程分析器（其缓存、本地分类器、话题转移检测设置同样生效）
+            max_workers: 共享线程池大小（同时进行的 LLM 调用数），默认读取 CHATAI_MAX_CONCURRENCY
+            granularity: 时间段粒度 day / week / month
+            min_turns: 回合数少于该值的对话跳过
+            max_active_conversations: 同时在途的对话数上限（限制内存占用），默认为线程数的 4 倍
+        """
+        if granularity not in TIME_BUCKETS:
+            raise ValueError(f"未知的时间段粒度: {granularity}")
+        self.analyzer = analyzer
+        self.max_workers = max_workers or LLMConfig.get_max_concurrency()
+        self.granularity = granularity
+        self.min_turns = max(1, min_turns)
+        self.max_active_conversations = max_active_conversations or self.max_workers * 4
+
+        self.overall = FlowAggregate()
+        self.by_user: Dict[str, FlowAggregate] = {}
+        self.by_time: Dict[str, FlowAggregate] = {}
+
+    def iter_conversations(
+        self,
+        sources: Dict[str, Union[str, ChatDataLoader]],
+        max_conversations: Optional[int] = None
+    ) -> Iterator[Tuple[str, Conversation, List[Dict[str, Any]]]]:
+        """
+        逐个产出 (用户 ID, 对话, 回合列表)
+
+        Args:
+            sources: {用户 ID: 包含 conversations.json 的数据文件夹或 ChatDataLoader}，每个导出文件对应一个用户
+            max_conversations: 最多分析的对话数
+        """
+        count = 0
+        for user_id, source in sources.items():
+            loader = source if isinstance(source, ChatDataLoader) else ChatDataLoader(source)
+            for conversation in loader.load_conversations():
+                turns = loader.get_conversation_turns(conversation)
+                if len(turns) < self.min_turns:
+                    continue
+                yield user_id, conversation, turns
+                count += 1
+                if max_conversations and count >= max_conversations:
+                    return
+
+    def analyze(
+        self,
+        sources: Dict[str, Union[str, ChatDataLoader]],
+        max_conversations: Optional[int] = None,
+        executor: Optional[Executor] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        分析语料中的所有对话，按完成顺序流式产出每个对话的结果
+
+        每个结果是 analyze_conversation_flow 的结果字典，另附
+        conversation_id / user_id / create_time / time_bucket 字段。
+
+        Args:
+            sources: 同 iter_conversations
+            max_conversations: 最多分析的对话数
+            executor: 外部共享的线程池（如 API 批量分析的共享线程池），
+                不提供时创建 max_workers 个线程的私有线程池
+        """
+        conversations = self.iter_conversations(sources, max_conversations)
+        futures: Dict[Future, Tuple[_ConversationJob, int]] = {}
+        remaining: Dict[int, int] = {}
+        active = 0
+        exhausted = False
+
+        pool = executor if executor is not None else ThreadPoolExecutor(self.max_workers)
+        try:
+            while True:
+                # 补充在途对话；无需 LLM 的对话（全部命中缓存/本地判定）立即完成
+                while not exhausted and active < self.max_active_conversations:
+                    item = next(conversations, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    job = _ConversationJob(*item)
+                    with span('flow.prepare', turns=len(job.turns)):
+                        job.turn_results, job.pending, job.state = self.analyzer._prepare_turns(job.turns)
+                    if not job.pending:
+                        yield self._finish(job)
+                        continue
+                    active += 1
+                    remaining[id(job)] = len(job.pending)
+                    for idx in job.pending:
+                        # 每个回合在当前上下文的副本中运行，保留激活的阶段追踪
+                        future = pool.submit(
+                            contextvars.copy_context().run,
+                            self.analyzer._analyze_single_turn,
+                            job.turns[idx],
+                            idx,
+                            job.turns[:idx]
+                        )
+                        futures[future] = (job, idx)
+
+                if not futures:
+                    break
+
+                done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, idx = futures.pop(future)
+                    job.new_results[idx] = future.result()
+                    remaining[id(job)] -= 1
+                    if remaining[id(job)] == 0:
+                        del remaining[id(job)]
+                        active -= 1
+                        yield self._finish(job)
+        finally:
+            # 消费方提前停止（如任务被取消）时，取消尚未开始的回合，避免继续调用 LLM
+            for future in futures:
+                future.cancel()
+            if executor is None:
+                pool.shutdown(cancel_futures=True)
+
+    def _finish(self, job: _ConversationJob) -> Dict[str, Any]:
+        """汇总一个对话的结果并更新聚合统计"""
+        with span('flow.finalize'):
+            result = self.analyzer._finalize_turns(
+                job.turns,
+                job.conversation.title,
+                job.turn_results,
+                job.pending,
+                [job.new_results[idx] for idx in job.pending],
+                job.state
+            )
+        conversation_bucket = time_bucket(job.conversation.create_time, self.granularity)
+        result.update({
+            'conversation_id': job.conversation.conversation_id,
+            'user_id': job.user_id,
+            'create_time': job.conversation.create_time,
+            'time_bucket': conversation_bucket,
+        })
+        self._record(job, result, conversation_bucket)
+        return result
+
+    def _record(self, job: _ConversationJob, result: Dict[str, Any], conversation_bucket: str):
+        """增量更新全局 / 按用户 / 按时间段的统计（回合按自身时间戳归入时间段）"""
+        user = self.by_user.setdefault(job.user_id, FlowAggregate())
+        for aggregate in (self.overall, user):
+            aggregate.add_conversation(result['flow_summary'])
+        self.by_time.setdefault(conversation_bucket, FlowAggregate()).add_conversation(result['flow_summary'])
+
+        for turn, turn_result in zip(job.turns, result['turn_analysis']):
+            self.overall.add_turn(turn_result)
+            user.add_turn(turn_result)
+            bucket = time_bucket(turn.get('timestamp') or job.conversation.create_time, self.granularity)
+            self.by_time.setdefault(bucket, FlowAggregate()).add_turn(turn_result)
+
+    def summary(self) -> Dict[str, Any]:
+        """当前的聚合统计（分析过程中随时可调用）"""
+        return {
+            'granularity': self.granularity,
+            'overall': self.overall.to_dict(),
+            'by_user': {user: agg.to_dict() for user, agg in self.by_user.items()},
+            'by_time_bucket': {bucket: self.by_time[bucket].to_dict() for bucket in sorted(self.by_time)},
+            'context_budget': self.analyzer.context_budget.stats(),
+        }
+
+
+def main():
+    """命令行入口：python -m core.corpus_flow data/student_a data/student_b --workers 8"""
+    from core.custom_llm import ChatAIAPIModel
+    from config.llm_config import get_api_key, get_model_for_task
+
+    parser = argparse.ArgumentParser(description="语料级对话流程分析")
+    parser.add_argument('data_folders', nargs='+', help="包含 conversations.json 的文件夹（每个文件夹视为一个用户）")
+    parser.add_argument('--workers', type=int, default=None, help="共享线程池大小")
+    parser.add_argument('--model', default=None, help="流程分析模型")
+    parser.add_argument('--granularity', choices=TIME_BUCKETS, default='month', help="时间段粒度")
+    parser.add_argument('--max-conversations', type=int, default=None, help="最多分析的对话数")
+    parser.add_argument('--output', default='evaluation_results/corpus_flow.jsonl', help="逐对话结果（JSON Lines）")
+    parser.add_argument('--summary', default='evaluation_results/corpus_flow_summary.json', help="聚合统计")
+    args = parser.parse_args()
+
+    model = ChatAIAPIModel(api_key=get_api_key(), model=args.model or get_model_for_task("flow_analysis"))
+    corpus = CorpusFlowAnalyzer(
+        ConversationFlowAnalyzer(model),
+        max_workers=args.workers,
+        granularity=args.granularity
+    )
+    sources = {Path(folder).name: folder for folder in args.data_folders}
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for i, result in enumerate(corpus.analyze(sources, args.max_conversations), 1):
+            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+            f.flush()
+            overall = corpus.overall
+            print(f"[{i}] {result['conversation_title']}: {result['total_turns']} 回合 "
+                  f"(累计 {overall.conversations} 个对话, {overall.turns} 回合)")
+
+    summary = corpus.summary()
+    with open(args.summary, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"\n逐对话结果: {output_path}")
+    print(f"聚合统计: {args.summary}")
+    print(json.dumps(summary['overall'], ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
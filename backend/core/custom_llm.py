@@ -5,9 +5,11 @@
 from typing import Optional, Dict, Any, Type
 from deepeval.models.base_model import DeepEvalBaseLLM
 from pydantic import BaseModel
+import asyncio
 import requests
 import json
 import os
+import time
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
@@ -16,6 +18,8 @@ import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from config.llm_config import LLMConfig
+from utils.metrics import LLM_CALL_SECONDS, LLM_JSON_PARSE_FAILURES, LLM_RETRIES, LLM_TOKENS
+from utils.tracing import current_trace, span
 
 
 class ChatAIAPIModel(DeepEvalBaseLLM):
@@ -28,7 +32,8 @@ class ChatAIAPIModel(DeepEvalBaseLLM):
         self,
         api_key: str = None,
         model: str = None,
-        base_url: str = None
+        base_url: str = None,
+        rate_limiter=None
     ):
         """
         初始化自定义 LLM 模型
@@ -37,6 +42,7 @@ class ChatAIAPIModel(DeepEvalBaseLLM):
             api_key: API Key（默认从配置中心获取）
             model: 模型名称（默认使用配置中心的通用模型）
             base_url: API 基础 URL（默认从配置中心获取）
+            rate_limiter: 可选的限速器（core.rate_limiter.RateLimiter），每次请求前获取调用名额
         """
         # 使用配置中心的默认值
         self.api_key = api_key or LLMConfig.get_api_key()
@@ -45,6 +51,7 @@ class ChatAIAPIModel(DeepEvalBaseLLM):
         
         # 使用配置中心的超时配置
         self._timeout = LLMConfig.get_timeout()
+        self.rate_limiter = rate_limiter
         
         # 使用配置中心的重试配置
         retry_config = LLMConfig.get_retry_config()
@@ -62,7 +69,9 @@ class ChatAIAPIModel(DeepEvalBaseLLM):
             raise_on_status=False,
         )
         self.session = requests.Session()
-        adapter = HTTPAdapter(max_retries=retry)
+        # 连接池大小与最大并发数匹配，避免并发请求时丢弃连接
+        pool_size = max(10, LLMConfig.get_max_concurrency())
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
         self.session.mount('https://', adapter)
         self.session.mount('http://', adapter)
         
@@ -118,6 +127,7 @@ class ChatAIAPIModel(DeepEvalBaseLLM):
                 response_dict = json.loads(response_text)
                 return schema(**response_dict)
             except (json.JSONDecodeError, Exception) as e:
+                LLM_JSON_PARSE_FAILURES.inc('custom_llm')
                 print(f"JSON 解析失败: {e}")
                 print(f"原始响应: {response_text[:500]}")
                 raise
@@ -138,9 +148,8 @@ class ChatAIAPIModel(DeepEvalBaseLLM):
             如果有 schema: 返回 Pydantic 模型实例
             如果无 schema: 返回字符串
         """
-        # 对于同步 API,直接调用同步方法
-        # 如果需要真正的异步,可以使用 aiohttp
-        return self.generate(prompt, schema)
+        # 在线程池中执行同步请求，避免阻塞事件循环，使多个调用可以并发进行
+        return await asyncio.to_thread(self.generate, prompt, schema)
     
     def _call_api(self, messages: list, schema: Optional[Dict] = None) -> str:
         """
@@ -180,6 +189,8 @@ class ChatAIAPIModel(DeepEvalBaseLLM):
             'Content-Type': 'application/json'
         }
         
+        started = None
+        outcome = 'error'
         try:
             # 打印调试信息
             print(f"请求 URL: {url}")
@@ -187,12 +198,20 @@ class ChatAIAPIModel(DeepEvalBaseLLM):
             print(f"超时设置: connect={self._timeout[0]}s, read={self._timeout[1]}s")
             print(f"重试: total={int(os.getenv('CHATAI_RETRY_TOTAL', '3'))}, backoff={float(os.getenv('CHATAI_RETRY_BACKOFF', '1.5'))}")
             
+            if self.rate_limiter is not None:
+                with span('llm.rate_limit_wait', model=self.model):
+                    waited = self.rate_limiter.acquire()
+                if waited:
+                    print(f"限速等待: {waited:.2f}s")
+            
+            started = time.perf_counter()
             response = self.session.post(
                 url,
                 headers=headers,
                 data=json.dumps(payload),
                 timeout=self._timeout
             )
+            self._record_retries(response)
             
             # 打印响应状态
             print(f"响应状态码: {response.status_code}")
@@ -204,6 +223,7 @@ class ChatAIAPIModel(DeepEvalBaseLLM):
             response.raise_for_status()
             
             data = response.json()
+            self._record_usage(data)
             
             # 提取返回内容
             if 'choices' in data and len(data['choices']) > 0:
@@ -245,6 +265,7 @@ class ChatAIAPIModel(DeepEvalBaseLLM):
                     print(f"响应内容:\n{content[:800]}")
                     print(f"{'='*60}\n")
                 
+                outcome = 'ok'
                 return content
             else:
                 raise ValueError(f"API 返回格式异常: {data}")
@@ -262,6 +283,29 @@ class ChatAIAPIModel(DeepEvalBaseLLM):
             if hasattr(e, 'response') and e.response is not None:
                 print(f"响应内容: {e.response.text}")
             raise RuntimeError(f"API 调用失败: {e}")
+        finally:
+            if started is not None:
+                finished = time.perf_counter()
+                LLM_CALL_SECONDS.observe(finished - started, self.model, outcome)
+                trace = current_trace()
+                if trace is not None:
+                    trace.add('llm.call', started, finished, {'model': self.model, 'outcome': outcome})
+    
+    def _record_retries(self, response: requests.Response):
+        """记录 urllib3 在本次请求中的重试次数"""
+        retries = getattr(getattr(response, 'raw', None), 'retries', None)
+        history = getattr(retries, 'history', None)
+        if history:
+            LLM_RETRIES.inc(self.model, amount=len(history))
+    
+    def _record_usage(self, data: Dict[str, Any]):
+        """记录响应中的 token 用量（OpenAI 兼容的 usage 字段）"""
+        usage = data.get('usage') if isinstance(data, dict) else None
+        if not isinstance(usage, dict):
+            return
+        for kind in ('prompt_tokens', 'completion_tokens'):
+            if isinstance(usage.get(kind), (int, float)):
+                LLM_TOKENS.observe(usage[kind], self.model, kind[:-len('_tokens')])
     
     def get_model_name(self) -> str:
         """返回模型名称"""
@@ -3,10 +3,16 @@ GPT 聊天数据加载和预处理模块
 用于将导出的 ChatGPT 对话数据转换为 deepeval 可评估的格式
 """
 import json
+import time
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.metrics import DATA_LOAD_BYTES, DATA_LOAD_SECONDS_PER_MB
+from utils.tracing import span
+
 
 @dataclass
 class Message:
@@ -29,15 +35,17 @@ class Conversation:
 class ChatDataLoader:
     """加载和处理 ChatGPT 导出数据"""
     
-    def __init__(self, data_folder: str):
+    def __init__(self, data_folder: str, conversations: Optional[List[Conversation]] = None):
         """
         初始化数据加载器
         
         Args:
             data_folder: 包含 conversations.json 的文件夹路径
+            conversations: 已解析的对话（如数据集缓存），提供时 load_conversations 不再读取文件
         """
         self.data_folder = Path(data_folder)
         self.conversations_file = self.data_folder / "conversations.json"
+        self._conversations = conversations
         
     def load_conversations(self) -> List[Conversation]:
         """
@@ -46,17 +54,28 @@ class ChatDataLoader:
         Returns:
             对话列表
         """
+        if self._conversations is not None:
+            return list(self._conversations)
+        
         if not self.conversations_file.exists():
             raise FileNotFoundError(f"找不到文件: {self.conversations_file}")
             
-        with open(self.conversations_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        start = time.perf_counter()
+        size = self.conversations_file.stat().st_size
+        with span('data_loader.json_load', bytes=size):
+            with open(self.conversations_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
         
         conversations = []
-        for conv_data in data:
-            conv = self._parse_conversation(conv_data)
-            if conv and len(conv.messages) > 0:
-                conversations.append(conv)
+        with span('data_loader.parse_conversations', conversations=len(data)):
+            for conv_data in data:
+                conv = self._parse_conversation(conv_data)
+                if conv and len(conv.messages) > 0:
+                    conversations.append(conv)
+        
+        DATA_LOAD_BYTES.inc(amount=size)
+        if size:
+            DATA_LOAD_SECONDS_PER_MB.observe((time.perf_counter() - start) / (size / (1024 * 1024)))
                 
         return conversations
     
@@ -0,0 +1,160 @@
+"""
+近重复问答对检测 - MinHash + LSH
+
+学生导出的数据里有大量几乎相同的问题和模板化回答，逐条评估会重复支付 LLM 成本。
+本模块对规范化后的 (问题 + 回答) 文本计算 MinHash 签名，用 LSH 分桶找候选对，
+再用签名估计的 Jaccard 相似度确认，最后用并查集把近重复项聚成簇。
+"""
+import re
+import zlib
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# 2^31 - 1 (梅森素数)，保证 a * x 在 uint64 范围内不溢出
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+_PUNCT_RE = re.compile(r'\W+')
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：小写、去标点、合并空白"""
+    return _PUNCT_RE.sub(' ', (text or '').lower()).strip()
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # 以较小的下标为根，保证代表元是最早出现的一条
+            if ra < rb:
+                self.parent[rb] = ra
+            else:
+                self.parent[ra] = rb
+
+
+class MinHashDeduplicator:
+    """
+    MinHash/LSH 近重复检测器
+
+    用法:
+        dedup = MinHashDeduplicator(threshold=0.9)
+        representatives = dedup.find_representatives(texts)
+        # representatives[i] == i 表示第 i 条是代表元，否则指向其代表元的下标
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        num_perm: int = 128,
+        shingle_size: int = 4,
+        seed: int = 1
+    ):
+        """
+        Args:
+            threshold: Jaccard 相似度阈值，达到该值视为近重复
+            num_perm: MinHash 置换数量（签名长度）
+            shingle_size: 字符 shingle 长度（对中英文都适用）
+            seed: 哈希置换的随机种子
+        """
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold 需要在 (0, 1] 范围内")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, (1 << 31) - 1, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self._b = rng.randint(0, (1 << 31) - 1, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self.bands, self.rows = self._optimal_bands(threshold, num_perm)
+
+    @staticmethod
+    def _optimal_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+        """选择使 LSH 的 S 曲线拐点 (1/b)^(1/r) 最接近阈值的 (bands, rows)"""
+        best = (num_perm, 1)
+        best_gap = float('inf')
+        for rows in range(1, num_perm + 1):
+            if num_perm % rows:
+                continue
+            bands = num_perm // rows
+            gap = abs((1 / bands) ** (1 / rows) - threshold)
+            if gap < best_gap:
+                best, best_gap = (bands, rows), gap
+        return best
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        text = normalize_text(text)
+        k = self.shingle_size
+        if len(text) <= k:
+            shingles = {text}
+        else:
+            shingles = {text[i:i + k] for i in range(len(text) - k + 1)}
+        return np.fromiter(
+            (zlib.crc32(s.encode('utf-8')) for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        """计算所有文本的 MinHash 签名，返回形状为 (n, num_perm) 的数组"""
+        result = np.empty((len(texts), self.num_perm), dtype=np.uint64)
+        for i, text in enumerate(texts):
+            hashes = self._shingle_hashes(text)
+            permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME
+            result[i] = permuted.min(axis=1) if hashes.size else _MAX_HASH
+        return result
+
+    def find_representatives(self, texts: Sequence[str]) -> List[int]:
+        """
+        对文本聚类并返回每条文本的代表元下标
+
+        Returns:
+            列表，第 i 个元素为第 i 条文本所在簇中最早出现的文本下标；
+            与该代表元的估计相似度低于阈值的文本（经传递合并进簇）指向自身
+        """
+        n = len(texts)
+        if n == 0:
+            return []
+        signatures = self.signatures(texts)
+        uf = _UnionFind(n)
+
+        for band in range(self.bands):
+            start = band * self.rows
+            buckets: Dict[bytes, int] = {}
+            band_slice = np.ascontiguousarray(signatures[:, start:start + self.rows])
+            for i in range(n):
+                key = band_slice[i].tobytes()
+                first = buckets.setdefault(key, i)
+                if first == i or uf.find(first) == uf.find(i):
+                    continue
+                if self._similarity(signatures, first, i) >= self.threshold:
+                    uf.union(first, i)
+
+        representatives = []
+        for i in range(n):
+            root = uf.find(i)
+            # 并查集按传递关系合并，簇内成员未必与代表元本身相似，这时单独评估而不复用代表元的分数
+            if root != i and self._similarity(signatures, root, i) < self.threshold:
+                root = i
+            representatives.append(root)
+        return representatives
+
+    @staticmethod
+    def _similarity(signatures: np.ndarray, a: int, b: int) -> float:
+        """用签名中相同位置的比例估计 Jaccard 相似度"""
+        return float(np.mean(signatures[a] == signatures[b]))
+
+
+def qa_pair_text(qa: Dict[str, str]) -> str:
+    """拼接问答对用于去重的文本"""
+    return f"{qa.get('input', '')}\n{qa.get('actual_output', '')}"
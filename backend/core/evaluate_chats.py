@@ -8,9 +8,11 @@
 4. 毒性检测 (Toxicity) - 是否包含有害内容
 5. 偏见检测 (Bias) - 是否存在偏见
 """
+import copy
 import os
+import random
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 from dotenv import load_dotenv
 
 from deepeval import assert_test
@@ -25,6 +27,10 @@ from deepeval.test_case import LLMTestCaseParams
 
 from core.data_loader import ChatDataLoader
 from core.custom_llm import ChatAIAPIModel, create_default_model
+from core.safety_prescreen import LocalSafetyScorer
+from utils.tracing import span
+from core.dedup import MinHashDeduplicator, qa_pair_text
+from core.summary_stats import MetricAggregator, mean_confidence_interval
 
 # 导入配置中心
 import sys
@@ -36,6 +42,20 @@ from config.llm_config import LLMConfig, get_api_key, get_model_for_task
 # 加载环境变量（强制覆盖已有环境变量，确保使用 .env 最新配置）
 load_dotenv(override=True)
 
+# 分数越低越好的指标（毒性/偏见）：score <= threshold 为通过
+LOWER_IS_BETTER = ('toxicity', 'bias')
+
+# 自适应抽样开始检查停止条件前至少评估的问答对数
+ADAPTIVE_MIN_SAMPLES = 5
+
+
+def metric_passed(key: str, score: float, threshold: float) -> bool:
+    """按指标方向判断是否通过"""
+    if key in LOWER_IS_BETTER:
+        return score <= threshold
+    return score >= threshold
+
+
 
 class ChatQualityEvaluator:
     """GPT 聊天质量评估器"""
@@ -44,7 +64,11 @@ class ChatQualityEvaluator:
         self,
         data_folder: str,
         model: str = None,
-        use_custom_api: bool = True
+        use_custom_api: bool = True,
+        prescreen: bool = False,
+        prescreen_scorer: Optional[LocalSafetyScorer] = None,
+        rate_limiter=None,
+        loader: Optional[ChatDataLoader] = None
     ):
         """
         初始化评估器
@@ -53,12 +77,22 @@ class ChatQualityEvaluator:
             data_folder: 聊天数据文件夹路径
             model: 用于评估的模型（默认使用配置中心的评估模型）
             use_custom_api: 是否使用自定义 API （推荐）
+            prescreen: 是否对毒性/偏见指标启用本地预筛（确定的结果不再调用 LLM）
+            prescreen_scorer: 自定义本地预筛打分器（传入时自动启用预筛）
+            rate_limiter: 传给自定义 LLM 的限速器（多进程评估时共享调用预算）
+            loader: 数据加载器（如带已解析对话的数据集加载器），默认按 data_folder 创建
         """
         self.data_folder = data_folder
         # 使用配置中心的默认模型
         self.model_name = model or get_model_for_task("evaluation")
         self.use_custom_api = use_custom_api
-        self.loader = ChatDataLoader(data_folder)
+        self.loader = loader or ChatDataLoader(data_folder)
+        
+        # 本地预筛层（毒性/偏见级联评估的第一层）
+        self.prescreen = prescreen_scorer or (LocalSafetyScorer() if prescreen else None)
+        
+        # 当前评估的在线聚合器（每完成一个问答对更新一次，可随时读取实时摘要）
+        self.aggregator = MetricAggregator()
         
         # 初始化自定义 LLM (如果使用)
         self.custom_llm = None
@@ -69,7 +103,11 @@ class ChatQualityEvaluator:
                 raise ValueError(
                     "未配置 API Key，请在 .env 文件中设置 CHATAIAPI_KEY 或 CHATAI_API_KEY"
                 )
-            self.custom_llm = ChatAIAPIModel(api_key=api_key, model=self.model_name)
+            self.custom_llm = ChatAIAPIModel(
+                api_key=api_key,
+                model=self.model_name,
+                rate_limiter=rate_limiter
+            )
             print(f"[OK] 使用硅基流动免费 API，模型: {self.model_name}")
         else:
             if not os.getenv('OPENAI_API_KEY'):
@@ -80,6 +118,27 @@ class ChatQualityEvaluator:
         
         # 初始化评估指标
         self.metrics = self._init_metrics()
+        # 构造完成时各指标的属性（配置），measure() 写入或修改的属性都是单次评估的状态
+        self._metric_config = {key: dict(vars(metric)) for key, metric in self.metrics.items()}
+    
+    def reset(self, loader: Optional[ChatDataLoader] = None, prescreen: bool = False):
+        """
+        复用评估器评估新的数据（如 API 层的评估器池），保留 LLM 客户端和指标配置
+        
+        清空上一次评估留下的状态（在线聚合器、各指标的 score/reason 等），
+        保证不同请求之间互不影响。
+        
+        Args:
+            loader: 新的数据加载器，None 表示只清空状态（归还到池中时）
+            prescreen: 是否对毒性/偏见指标启用本地预筛
+        """
+        self.loader = loader
+        self.data_folder = str(loader.data_folder) if loader is not None else None
+        self.prescreen = LocalSafetyScorer() if prescreen else None
+        self.aggregator = MetricAggregator()
+        for key, metric in self.metrics.items():
+            vars(metric).clear()
+            vars(metric).update(self._metric_config[key])
     
     def _init_metrics(self) -> Dict:
         """初始化评估指标"""
@@ -144,7 +203,11 @@ class ChatQualityEvaluator:
         self,
         conversation_id: str = None,
         max_qa_pairs: int = None,
-        selected_metrics: List[str] = None
+        selected_metrics: List[str] = None,
+        keep_results: bool = True,
+        dedup_threshold: Optional[float] = None,
+        conversation_ids: Optional[List[str]] = None,
+        on_result: Optional[Callable[[int, int, Dict], None]] = None
     ) -> Dict:
         """
         评估指定对话或所有对话
@@ -153,23 +216,17 @@ class ChatQualityEvaluator:
             conversation_id: 要评估的对话ID，None 则评估所有对话
             max_qa_pairs: 最多评估的问答对数量，None 则评估所有
             selected_metrics: 要使用的指标列表，None 则使用所有指标
+            keep_results: 是否保留逐条结果；大规模语料评估可设为 False，
+                只通过在线聚合器生成摘要（results 为空列表）
+            dedup_threshold: 设置后启用近重复去重（MinHash/LSH，Jaccard 相似度阈值），
+                每个近重复簇只评估代表元，其余问答对复制其分数并记录 deduplicated_from
+            conversation_ids: 只评估这些对话（用于分片评估），与 conversation_id 互斥
+            on_result: 每个问答对评估完成后的回调 on_result(序号, 总数, 结果)；回调抛出的异常会中止评估
             
         Returns:
             评估结果字典
         """
-        # 加载对话
-        conversations = self.loader.load_conversations()
-        
-        if conversation_id:
-            conversations = [c for c in conversations if c.conversation_id == conversation_id]
-            if not conversations:
-                raise ValueError(f"找不到对话ID: {conversation_id}")
-        
-        # 收集所有问答对
-        all_qa_pairs = []
-        for conv in conversations:
-            qa_pairs = self.loader.get_qa_pairs(conv)
-            all_qa_pairs.extend(qa_pairs)
+        all_qa_pairs = self._collect_qa_pairs(conversation_id, conversation_ids)
         
         # 限制评估数量
         if max_qa_pairs:
@@ -177,90 +234,288 @@ class ChatQualityEvaluator:
         
         print(f"准备评估 {len(all_qa_pairs)} 个问答对...")
         
-        # 选择要使用的指标
-        if selected_metrics:
-            metrics_items = [(m, self.metrics[m]) for m in selected_metrics if m in self.metrics]
-        else:
-            metrics_items = list(self.metrics.items())
+        metrics_items = self._select_metrics(selected_metrics)
+        
+        # 近重复去重：代表元总是簇中最早出现的问答对，因此评估到重复项时代表元已有分数
+        representatives = list(range(len(all_qa_pairs)))
+        duplicated = set()
+        if dedup_threshold:
+            dedup = MinHashDeduplicator(threshold=dedup_threshold)
+            with span('evaluator.dedup', qa_pairs=len(all_qa_pairs)):
+                representatives = dedup.find_representatives([qa_pair_text(qa) for qa in all_qa_pairs])
+            duplicated = {rep for idx, rep in enumerate(representatives) if rep != idx}
+            unique = len(set(representatives))
+            print(f"近重复去重: {len(all_qa_pairs)} 个问答对 → {unique} 个需要评估")
         
         # 评估每个问答对
+        self.aggregator = MetricAggregator()
         results = []
+        representative_scores = {}
         for i, qa in enumerate(all_qa_pairs, 1):
-            print(f"\n评估问答对 {i}/{len(all_qa_pairs)}")
-            print(f"对话: {qa['conversation_title']}")
-            print(f"问题: {qa['input'][:100]}...")
-            
-            test_case = LLMTestCase(
-                input=qa['input'],
-                actual_output=qa['actual_output']
-            )
-            
-            # 运行评估
-            qa_result = {
-                'conversation_id': qa['conversation_id'],
-                'conversation_title': qa['conversation_title'],
-                'input': qa['input'],
-                'actual_output': qa['actual_output'],
-                'scores': {}
+            rep = representatives[i - 1]
+            if rep != i - 1:
+                qa_result = self._duplicate_result(qa, rep, representative_scores[rep])
+                print(f"\n问答对 {i}/{len(all_qa_pairs)} 与第 {rep + 1} 个近重复，复用其分数")
+            else:
+                print(f"\n评估问答对 {i}/{len(all_qa_pairs)}")
+                qa_result = self._evaluate_qa_pair(qa, metrics_items)
+                if i - 1 in duplicated:
+                    representative_scores[i - 1] = qa_result['scores']
+            self.aggregator.update(qa_result)
+            if keep_results:
+                results.append(qa_result)
+            if on_result is not None:
+                on_result(i, len(all_qa_pairs), qa_result)
+        
+        summary = self._summarize(self.aggregator)
+        if dedup_threshold:
+            summary['dedup'] = {
+                'threshold': dedup_threshold,
+                'clusters': len(set(representatives)),
+                'duplicates_skipped': len(all_qa_pairs) - len(set(representatives))
             }
+        
+        return {
+            'total_qa_pairs': self.aggregator.total,
+            'results': results,
+            'summary': summary
+        }
+    
+    def evaluate_adaptive(
+        self,
+        conversation_id: str = None,
+        target_ci_width: float = 0.1,
+        max_qa_pairs: int = None,
+        min_samples: int = ADAPTIVE_MIN_SAMPLES,
+        confidence: float = 0.95,
+        selected_metrics: List[str] = None,
+        seed: Optional[int] = None,
+        on_result: Optional[Callable[[int, int, Dict], None]] = None
+    ) -> Dict:
+        """
+        自适应抽样评估：随机抽取问答对逐个评估，直到每个指标均值的置信区间
+        宽度都不超过 target_ci_width，或达到预算上限后停止
+        
+        Args:
+            conversation_id: 要评估的对话ID，None 则评估所有对话
+            target_ci_width: 目标置信区间宽度（上界 - 下界）
+            max_qa_pairs: 预算上限（最多评估的问答对数量），None 则以全部问答对为上限
+            min_samples: 开始检查停止条件前至少评估的数量
+            confidence: 置信水平
+            selected_metrics: 要使用的指标列表，None 则使用所有指标
+            seed: 随机种子（用于复现抽样顺序）
+            on_result: 每个问答对评估完成后的回调 on_result(序号, 预算, 结果)
             
-            for key, metric in metrics_items:
-                try:
-                    metric.measure(test_case)
-                    # 使用字典键名作为指标名称，确保与 summary 生成逻辑一致
-                    metric_name = key
-                    # 获取显示名称用于日志
-                    display_name = getattr(metric, '__name__', type(metric).__name__)
-                    
-                    qa_result['scores'][metric_name] = {
-                        'score': metric.score,
-                        'reason': metric.reason if hasattr(metric, 'reason') else None,
-                        'passed': metric.score >= metric.threshold
-                    }
-                    passed_str = 'PASS' if qa_result['scores'][metric_name]['passed'] else 'FAIL'
-                    passed_mark = f"[{passed_str}]"
-                    print(f"  {display_name} ({metric_name}): {metric.score:.3f} {passed_mark}")
-                except Exception as e:
-                    metric_name = key
-                    display_name = getattr(metric, '__name__', type(metric).__name__)
-                    print(f"  {display_name}: 评估失败 - {str(e)[:100]}")
-                    qa_result['scores'][metric_name] = {
-                        'score': None,
-                        'error': str(e)
-                    }
-            
+        Returns:
+            评估结果字典，结构与 evaluate_conversation 相同，另附 'adaptive' 字段
+        
+        Raises:
+            ValueError: max_qa_pairs 小于 min_samples（预算用完前永远不会检查置信区间）
+        """
+        if max_qa_pairs and max_qa_pairs < min_samples:
+            raise ValueError(
+                f"自适应抽样至少评估 {min_samples} 个问答对后才检查置信区间，"
+                f"max_qa_pairs（{max_qa_pairs}）不能小于 min_samples"
+            )
+        all_qa_pairs = self._collect_qa_pairs(conversation_id)
+        random.Random(seed).shuffle(all_qa_pairs)
+        
+        budget = min(max_qa_pairs, len(all_qa_pairs)) if max_qa_pairs else len(all_qa_pairs)
+        print(f"自适应评估: 目标置信区间宽度 {target_ci_width}, 预算 {budget}/{len(all_qa_pairs)} 个问答对")
+        
+        metrics_items = self._select_metrics(selected_metrics)
+        metric_names = [name for name, _ in metrics_items]
+        
+        self.aggregator = MetricAggregator()
+        results = []
+        stop_reason = 'exhausted'
+        for i, qa in enumerate(all_qa_pairs[:budget], 1):
+            print(f"\n评估问答对 {i}/{budget} (自适应)")
+            qa_result = self._evaluate_qa_pair(qa, metrics_items)
+            self.aggregator.update(qa_result)
             results.append(qa_result)
+            if on_result is not None:
+                on_result(i, budget, qa_result)
+            
+            if i < min_samples:
+                continue
+            widths = self._ci_widths(metric_names, confidence, min_samples)
+            print(f"  当前置信区间宽度: " + ", ".join(
+                f"{name}={w:.3f}" if w is not None else f"{name}=N/A" for name, w in widths.items()
+            ))
+            if all(w is not None and w <= target_ci_width for w in widths.values()):
+                stop_reason = 'converged'
+                break
+        else:
+            if budget < len(all_qa_pairs):
+                stop_reason = 'budget'
+        
+        print(f"\n自适应评估结束: {stop_reason}，共评估 {len(results)} 个问答对")
         
         return {
             'total_qa_pairs': len(results),
             'results': results,
-            'summary': self._generate_summary(results)
+            'summary': self._summarize(self.aggregator, confidence=confidence),
+            'adaptive': {
+                'stop_reason': stop_reason,
+                'target_ci_width': target_ci_width,
+                'confidence': confidence,
+                'budget': budget,
+                'population': len(all_qa_pairs)
+            }
         }
     
-    def _generate_summary(self, results: List[Dict]) -> Dict:
-        """生成评估摘要统计"""
-        summary = {
-            'total': len(results),
-            'metrics': {}
+    def _collect_qa_pairs(
+        self,
+        conversation_id: str = None,
+        conversation_ids: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """加载对话并收集所有问答对"""
+        conversations = self.loader.load_conversations()
+        
+        if conversation_ids is not None:
+            wanted = set(conversation_ids)
+            conversations = [c for c in conversations if c.conversation_id in wanted]
+        elif conversation_id:
+            conversations = [c for c in conversations if c.conversation_id == conversation_id]
+            if not conversations:
+                raise ValueError(f"找不到对话ID: {conversation_id}")
+        
+        all_qa_pairs = []
+        with span('evaluator.collect_qa_pairs', conversations=len(conversations)):
+            for conv in conversations:
+                all_qa_pairs.extend(self.loader.get_qa_pairs(conv))
+        return all_qa_pairs
+    
+    def _select_metrics(self, selected_metrics: List[str] = None) -> List:
+        """选择要使用的指标"""
+        if selected_metrics:
+            return [(m, self.metrics[m]) for m in selected_metrics if m in self.metrics]
+        return list(self.metrics.items())
+    
+    def _duplicate_result(self, qa: Dict, representative: int, scores: Dict) -> Dict:
+        """
+        为近重复问答对构造结果：复制代表元的分数，并用 deduplicated_from 指向代表元下标
+        
+        复制的分数 tier 记为 dedup（没有进行本地或 LLM 评分，不计入预筛统计）
+        """
+        copied = copy.deepcopy(scores)
+        for entry in copied.values():
+            entry['tier'] = 'dedup'
+        return {
+            'conversation_id': qa['conversation_id'],
+            'conversation_title': qa['conversation_title'],
+            'input': qa['input'],
+            'actual_output': qa['actual_output'],
+            'scores': copied,
+            'deduplicated_from': representative
+        }
+    
+    def _evaluate_qa_pair(self, qa: Dict, metrics_items: List) -> Dict:
+        """对单个问答对运行所有选中的指标"""
+        with span('evaluator.qa_pair', conversation_id=qa['conversation_id']):
+            return self._run_metrics(qa, metrics_items)
+    
+    def _run_metrics(self, qa: Dict, metrics_items: List) -> Dict:
+        print(f"对话: {qa['conversation_title']}")
+        print(f"问题: {qa['input'][:100]}...")
+        
+        test_case = LLMTestCase(
+            input=qa['input'],
+            actual_output=qa['actual_output']
+        )
+        
+        # 运行评估
+        qa_result = {
+            'conversation_id': qa['conversation_id'],
+            'conversation_title': qa['conversation_title'],
+            'input': qa['input'],
+            'actual_output': qa['actual_output'],
+            'scores': {}
         }
         
-        # 统计每个指标
-        for metric_name in self.metrics.keys():
-            scores = [
-                r['scores'][metric_name]['score'] 
-                for r in results 
-                if metric_name in r['scores'] and r['scores'][metric_name].get('score') is not None
-            ]
+        for key, metric in metrics_items:
+            # 级联评估：本地预筛能确定的结果直接采用，只有不确定区间才调用 LLM 指标
+            if self.prescreen and key in LocalSafetyScorer.CATEGORIES:
+                with span('evaluator.prescreen', metric=key):
+                    decision = self.prescreen.screen(key, qa['actual_output'])
+                if decision.decided:
+                    qa_result['scores'][key] = {
+                        'score': decision.score,
+                        'reason': decision.reason,
+                        'passed': metric_passed(key, decision.score, metric.threshold),
+                        'tier': 'local'
+                    }
+                    print(f"  {key}: {decision.score:.3f} [LOCAL]")
+                    continue
             
-            if scores:
-                summary['metrics'][metric_name] = {
-                    'average_score': sum(scores) / len(scores),
-                    'min_score': min(scores),
-                    'max_score': max(scores),
-                    'passed_count': sum(1 for r in results if r['scores'].get(metric_name, {}).get('passed', False)),
-                    'total_evaluated': len(scores)
+            try:
+                with span(f'evaluator.metric.{key}'):
+                    metric.measure(test_case)
+                # 使用字典键名作为指标名称，确保与 summary 生成逻辑一致
+                metric_name = key
+                # 获取显示名称用于日志
+                display_name = getattr(metric, '__name__', type(metric).__name__)
+                
+                qa_result['scores'][metric_name] = {
+                    'score': metric.score,
+                    'reason': metric.reason if hasattr(metric, 'reason') else None,
+                    'passed': metric_passed(key, metric.score, metric.threshold),
+                    'tier': 'llm'
+                }
+                passed_str = 'PASS' if qa_result['scores'][metric_name]['passed'] else 'FAIL'
+                passed_mark = f"[{passed_str}]"
+                print(f"  {display_name} ({metric_name}): {metric.score:.3f} {passed_mark}")
+            except Exception as e:
+                metric_name = key
+                display_name = getattr(metric, '__name__', type(metric).__name__)
+                print(f"  {display_name}: 评估失败 - {str(e)[:100]}")
+                qa_result['scores'][metric_name] = {
+                    'score': None,
+                    'error': str(e),
+                    'tier': 'llm'
                 }
         
+        return qa_result
+    
+    def _ci_widths(
+        self,
+        metric_names: List[str],
+        confidence: float,
+        min_samples: int
+    ) -> Dict[str, Optional[float]]:
+        """计算每个指标当前均值置信区间的宽度（有效分数不足 min_samples 时为 None）"""
+        widths = {}
+        for metric_name in metric_names:
+            stats = self.aggregator.metric_stats(metric_name)
+            if stats is None or stats.count < max(min_samples, 2):
+                widths[metric_name] = None
+            else:
+                low, high = mean_confidence_interval(stats.mean, stats.std_dev, stats.count, confidence)
+                widths[metric_name] = high - low
+        return widths
+    
+    def _generate_summary(self, results: List[Dict], confidence: float = 0.95) -> Dict:
+        """生成评估摘要统计（单遍聚合，含置信区间和 p50/p90/p99）"""
+        aggregator = MetricAggregator()
+        for r in results:
+            aggregator.update(r)
+        return self._summarize(aggregator, confidence)
+    
+    def _summarize(self, aggregator: MetricAggregator, confidence: float = 0.95) -> Dict:
+        """由聚合器生成摘要"""
+        with span('evaluator.summarize'):
+            summary = aggregator.summary(confidence, metric_names=list(self.metrics.keys()))
+        
+        if self.prescreen:
+            local = aggregator.tier_total('local')
+            escalated = aggregator.tier_total('llm', metric_names=list(LocalSafetyScorer.CATEGORIES))
+            summary['prescreen'] = {
+                'local_decisions': local,
+                'llm_escalations': escalated,
+                'llm_measures_saved_ratio': local / (local + escalated) if local + escalated else 0
+            }
+        
         return summary
     
     def save_results(self, results: Dict, output_file: str):
@@ -288,10 +543,21 @@ class ChatQualityEvaluator:
         
         for metric_name, stats in summary['metrics'].items():
             print(f"\n{metric_name}:")
-            print(f"  平均分: {stats['average_score']:.3f}")
+            print(f"  平均分: {stats['average_score']:.3f} "
+                  f"({stats['confidence']:.0%} CI: {stats['ci_lower']:.3f} ~ {stats['ci_upper']:.3f})")
             print(f"  最低分: {stats['min_score']:.3f}")
             print(f"  最高分: {stats['max_score']:.3f}")
+            if stats.get('p50') is not None:
+                print(f"  分位数: p50={stats['p50']:.3f} p90={stats['p90']:.3f} p99={stats['p99']:.3f}")
             print(f"  通过率: {stats['passed_count']}/{stats['total_evaluated']} ({stats['passed_count']/stats['total_evaluated']*100:.1f}%)")
+            if stats.get('tier_counts', {}).get('local'):
+                print(f"  评分来源: {stats['tier_counts']}")
+        
+        prescreen = summary.get('prescreen')
+        if prescreen:
+            print(f"\n本地预筛: {prescreen['local_decisions']} 次本地判定, "
+                  f"{prescreen['llm_escalations']} 次升级到 LLM "
+                  f"(节省 {prescreen['llm_measures_saved_ratio']*100:.1f}% 的毒性/偏见 LLM 评估)")
 
 
 def main():
@@ -0,0 +1,362 @@
+"""
+信息增益（Information Gain）批量计算引擎
+
+前端 InfoGainCard 只针对单个对话、基于问题类型分布计算 IG(P,Q) = DKL(P∥Q) × R × C
+（见 docs/THEORY_IMPLEMENTATION.md）。本模块在后端对整个语料一次性计算：
+
+- 逐轮 DKL：回答的字符 2-gram 分布 P 相对于"此前上下文"分布 Q 的 KL 散度（bits），
+  Q = 对话中此前所有问题/回答（含当前问题）的词频，用语料背景分布做 Dirichlet 平滑；
+  衡量这一轮回答带来了多少上下文中没有的新信息
+- R（相关性）：当前问题与回答的加权余弦相似度
+- C（连贯性）：当前问题与上一轮回答的加权余弦相似度，首轮为 1
+- 对话级 DKL：整个对话的回答分布相对语料背景分布的 KL 散度；
+  若回合带有 question_type，另外按前端公式计算问题类型分布的 DKL
+
+提供质量评估的 relevancy / toxicity 时按文档定义取 R = relevancy、C = 1 - toxicity。
+
+所有统计量都由稀疏矩阵坐标数组上的 NumPy 运算完成：
+n-gram 哈希到特征桶后，用 np.unique 得到 (单元, 特征) 词频，
+"此前上下文词频"通过按 (对话, 特征) 稳定排序后的分组累加和得到，不需要逐轮循环。
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from core.topic_shift import FEATURE_BITS, char_ngram_keys, hash_ngram_keys
+
+_VOCAB_SIZE = 1 << FEATURE_BITS
+
+# 前端基线分布 Q 的轻度偏置（与 InfoGainCard 保持一致）
+QUESTION_TYPE_BASELINE_BOOST = {
+    'planning': 0.35,
+    'architecture': 0.25,
+    'insight': 0.2,
+    'report': 0.15,
+    'cost': 0.1,
+}
+
+# 每个对话的质量因子：单个分数（整个对话共用）或逐轮分数列表
+FactorInput = Optional[Sequence[Union[float, Sequence[float], None]]]
+
+
+def question_type_divergence(type_lists: Sequence[Sequence[Optional[str]]]) -> np.ndarray:
+    """
+    批量计算每个对话问题类型分布相对基线的 DKL（bits）
+
+    基线与前端一致：对话中出现过的类型各计 1，再加上 QUESTION_TYPE_BASELINE_BOOST 的偏置。
+
+    Returns:
+        每个对话一个值，没有问题类型的对话为 NaN
+    """
+    n_conv = len(type_lists)
+    labels = sorted({t for types in type_lists for t in types if t})
+    if not labels:
+        return np.full(n_conv, np.nan)
+    label_index = {label: k for k, label in enumerate(labels)}
+    n_labels = len(labels)
+
+    conv_ids, label_ids = [], []
+    for conv_idx, types in enumerate(type_lists):
+        for t in types:
+            if t:
+                conv_ids.append(conv_idx)
+                label_ids.append(label_index[t])
+    flat = np.asarray(conv_ids, dtype=np.int64) * n_labels + np.asarray(label_ids, dtype=np.int64)
+    counts = np.bincount(flat, minlength=n_conv * n_labels).reshape(n_conv, n_labels).astype(np.float64)
+
+    present = counts > 0
+    boost = np.array([1.0 + QUESTION_TYPE_BASELINE_BOOST.get(label, 0.0) for label in labels])
+    base = present * boost
+    totals = counts.sum(axis=1, keepdims=True)
+    base_totals = base.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = counts / totals
+        q = base / base_totals
+        terms = np.where(present, p * np.log2(np.where(present, p / q, 1.0)), 0.0)
+    return np.where(totals[:, 0] > 0, terms.sum(axis=1), np.nan)
+
+
+@dataclass
+class InfoGainResult:
+    """整个语料的信息增益结果（逐轮数组按对话顺序拼接）"""
+    turn_counts: np.ndarray
+    turn_dkl: np.ndarray
+    turn_relevance: np.ndarray
+    turn_coherence: np.ndarray
+    turn_info_gain: np.ndarray
+    conv_dkl: np.ndarray
+    conv_relevance: np.ndarray
+    conv_coherence: np.ndarray
+    conv_info_gain: np.ndarray
+    conv_info_gain_total: np.ndarray
+    question_type_dkl: np.ndarray
+
+    def conversation(self, idx: int) -> Dict[str, Any]:
+        """单个对话的结果（含逐轮明细）"""
+        start = int(self.turn_counts[:idx].sum())
+        end = start + int(self.turn_counts[idx])
+        turns = [
+            {
+                'turn_index': k + 1,
+                'dkl': round(float(self.turn_dkl[start + k]), 4),
+                'relevance': round(float(self.turn_relevance[start + k]), 4),
+                'coherence': round(float(self.turn_coherence[start + k]), 4),
+                'info_gain': round(float(self.turn_info_gain[start + k]), 4),
+            }
+            for k in range(end - start)
+        ]
+        type_dkl = self.question_type_dkl[idx]
+        result = {
+            'turn_count': end - start,
+            'dkl': round(float(self.conv_dkl[idx]), 4),
+            'relevance': round(float(self.conv_relevance[idx]), 4),
+            'coherence': round(float(self.conv_coherence[idx]), 4),
+            'info_gain': round(float(self.conv_info_gain[idx]), 4),
+            'info_gain_total': round(float(self.conv_info_gain_total[idx]), 4),
+            'turns': turns,
+        }
+        if not np.isnan(type_dkl):
+            result['question_type_dkl'] = round(float(type_dkl), 4)
+            result['question_type_info_gain'] = round(
+                float(type_dkl * self.conv_relevance[idx] * self.conv_coherence[idx]), 4
+            )
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可 JSON 序列化的字典"""
+        n_conv = len(self.turn_counts)
+        return {
+            'summary': {
+                'conversations': n_conv,
+                'turns': int(self.turn_counts.sum()),
+                'mean_turn_info_gain': float(self.turn_info_gain.mean()) if len(self.turn_info_gain) else 0.0,
+                'mean_conversation_info_gain': float(self.conv_info_gain.mean()) if n_conv else 0.0,
+            },
+            'conversations': [self.conversation(idx) for idx in range(n_conv)],
+        }
+
+
+class InfoGainEngine:
+    """
+    信息增益批量计算引擎
+
+    用法:
+        engine = InfoGainEngine()
+        result = engine.analyze(conversations)   # conversations: [[{'question', 'answer'}, ...], ...]
+        result.turn_info_gain, result.conv_info_gain
+    """
+
+    def __init__(self, smoothing: float = 50.0, max_chars: int = 400, chunk_turns: int = 20000):
+        """
+        Args:
+            smoothing: 上下文分布 Q 的 Dirichlet 平滑强度（相当于多少个背景分布的"虚拟词"）
+            max_chars: 每个问题/回答参与计算的最大字符数（避免大段代码主导分布）
+            chunk_turns: 每批处理的回合数上限（控制内存，按对话边界切分）
+        """
+        self.smoothing = smoothing
+        self.max_chars = max_chars
+        self.chunk_turns = max(1, chunk_turns)
+
+    def _unit_terms(self, conversations: Sequence[List[Dict[str, str]]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        把每个回合拆成问题、回答两个单元并提取特征
+
+        Returns:
+            (单元下标, 特征桶下标)：第 t 个回合的问题为单元 2t，回答为单元 2t+1
+        """
+        texts = []
+        for turns in conversations:
+            for turn in turns:
+                texts.append(turn.get('question', ''))
+                texts.append(turn.get('answer', ''))
+        units, keys = char_ngram_keys(texts, self.max_chars, sizes=(2,))
+        return units, hash_ngram_keys(keys)
+
+    def _chunks(self, conversations: Sequence[List[Dict[str, str]]]) -> Iterator[Tuple[int, int]]:
+        """按对话边界切分，每批不超过 chunk_turns 个回合（单个超长对话独占一批）"""
+        start, turns = 0, 0
+        for idx, conv in enumerate(conversations):
+            if turns and turns + len(conv) > self.chunk_turns:
+                yield start, idx
+                start, turns = idx, 0
+            turns += len(conv)
+        if start < len(conversations):
+            yield start, len(conversations)
+
+    def background(self, conversations: Sequence[List[Dict[str, str]]]) -> np.ndarray:
+        """统计语料背景词频（每个特征桶的出现次数）"""
+        counts = np.zeros(_VOCAB_SIZE, dtype=np.float64)
+        for lo, hi in self._chunks(conversations):
+            _, terms = self._unit_terms(conversations[lo:hi])
+            counts += np.bincount(terms, minlength=_VOCAB_SIZE)
+        return counts
+
+    @staticmethod
+    def _expand_factor(values: FactorInput, turn_counts: np.ndarray) -> np.ndarray:
+        """把每个对话的质量因子展开为逐轮数组，未提供的位置为 NaN"""
+        out = np.full(int(turn_counts.sum()), np.nan)
+        if values is None:
+            return out
+        offset = 0
+        for value, count in zip(values, turn_counts):
+            count = int(count)
+            if value is None:
+                pass
+            elif isinstance(value, (int, float)):
+                out[offset:offset + count] = value
+            else:
+                per_turn = np.asarray(
+                    [np.nan if v is None else v for v in list(value)[:count]], dtype=np.float64
+                )
+                out[offset:offset + len(per_turn)] = per_turn
+            offset += count
+        return np.clip(out, 0.0, 1.0)
+
+    def _analyze_chunk(
+        self,
+        conversations: Sequence[List[Dict[str, str]]],
+        background: np.ndarray,
+        total: float
+    ) -> Dict[str, np.ndarray]:
+        """计算一批对话的逐轮 DKL / R / C 与对话级 DKL"""
+        log_total = np.log(total)
+        n_conv = len(conversations)
+        turn_counts = np.array([len(c) for c in conversations], dtype=np.int64)
+        n_turns = int(turn_counts.sum())
+        n_units = 2 * n_turns
+        conv_of_turn = np.repeat(np.arange(n_conv), turn_counts)
+        turn_start = np.cumsum(turn_counts) - turn_counts
+        turn_pos = np.arange(n_turns) - turn_start[conv_of_turn]
+
+        units, terms = self._unit_terms(conversations)
+        pair_keys, tf = np.unique(units * _VOCAB_SIZE + terms, return_counts=True)
+        units = pair_keys >> FEATURE_BITS
+        terms = pair_keys & (_VOCAB_SIZE - 1)
+        tf = tf.astype(np.float64)
+        turn_of = units >> 1
+        conv_of = conv_of_turn[turn_of]
+        is_answer = (units & 1) == 1
+        bg_prob = background[terms] / total
+
+        # 每个单元之前（同一对话内）的上下文总词数
+        unit_len = np.bincount(units, weights=tf, minlength=n_units)
+        before = np.cumsum(unit_len) - unit_len
+        unit_conv = np.repeat(conv_of_turn, 2)
+        n_prev = before - before[2 * turn_start[unit_conv]]
+
+        # 按 (对话, 特征) 稳定排序：组内按单元顺序排列，组内不含自身的累加和即此前上下文词频
+        group_keys = conv_of * _VOCAB_SIZE + terms
+        order = np.argsort(group_keys, kind='stable')
+        sorted_tf = tf[order]
+        exclusive = np.cumsum(sorted_tf) - sorted_tf
+        sorted_groups = group_keys[order]
+        group_start = np.ones(len(order), dtype=bool)
+        group_start[1:] = sorted_groups[1:] != sorted_groups[:-1]
+        group_id = np.cumsum(group_start) - 1
+        prior = np.empty_like(tf)
+        prior[order] = exclusive - exclusive[group_start][group_id]
+
+        # 逐轮 DKL(P∥Q)：P 为回答分布，Q 为平滑后的此前上下文分布
+        a_units = units[is_answer]
+        p = tf[is_answer] / unit_len[a_units]
+        q = (prior[is_answer] + self.smoothing * bg_prob[is_answer]) / (n_prev[a_units] + self.smoothing)
+        turn_dkl = np.bincount(turn_of[is_answer], weights=p * np.log2(p / q), minlength=n_turns)
+
+        # 加权向量（词频取对数，按背景分布的自信息加权），按单元 L2 归一化
+        weights = (1.0 + np.log(tf)) * (log_total - np.log(background[terms]))
+        norms = np.sqrt(np.bincount(units, weights=weights * weights, minlength=n_units))
+        weights = weights / np.where(norms > 0, norms, 1.0)[units]
+
+        def cosine(mask: np.ndarray, offset: int) -> np.ndarray:
+            """mask 选中的单元与其前第 offset 个单元的余弦相似度（按回合汇总）"""
+            lookup = (units[mask] - offset) * _VOCAB_SIZE + terms[mask]
+            pos = np.minimum(np.searchsorted(pair_keys, lookup), max(len(pair_keys) - 1, 0))
+            found = pair_keys[pos] == lookup if len(pair_keys) else np.zeros(0, dtype=bool)
+            products = weights[mask][found] * weights[pos[found]]
+            return np.bincount(turn_of[mask][found], weights=products, minlength=n_turns)
+
+        relevance = cosine(is_answer, 1)
+        coherence = cosine(~is_answer & (turn_pos[turn_of] > 0), 1)
+        coherence[turn_pos == 0] = 1.0
+
+        # 对话级 DKL：对话的回答分布相对语料背景分布
+        group_answer = np.bincount(group_id, weights=sorted_tf * is_answer[order])
+        group_conv = sorted_groups[group_start] >> FEATURE_BITS
+        group_terms = sorted_groups[group_start] & (_VOCAB_SIZE - 1)
+        conv_answer_total = np.bincount(group_conv, weights=group_answer, minlength=n_conv)
+        has_answer = group_answer > 0
+        gp = group_answer[has_answer] / conv_answer_total[group_conv[has_answer]]
+        gq = background[group_terms[has_answer]] / total
+        conv_dkl = np.bincount(group_conv[has_answer], weights=gp * np.log2(gp / gq), minlength=n_conv)
+
+        return {
+            'turn_counts': turn_counts,
+            'turn_dkl': turn_dkl,
+            'turn_relevance': np.clip(relevance, 0.0, 1.0),
+            'turn_coherence': np.clip(coherence, 0.0, 1.0),
+            'conv_dkl': conv_dkl,
+        }
+
+    def analyze(
+        self,
+        conversations: Sequence[List[Dict[str, str]]],
+        relevancy: FactorInput = None,
+        toxicity: FactorInput = None,
+        background: Optional[np.ndarray] = None
+    ) -> InfoGainResult:
+        """
+        计算整个语料的逐轮与对话级信息增益
+
+        Args:
+            conversations: 对话列表，每个对话为 get_conversation_turns 返回的回合列表
+                （回合可带 question_type，用于问题类型分布的 DKL）
+            relevancy: 每个对话的相关性分数（单个值或逐轮列表），提供时替代词汇相关性
+            toxicity: 每个对话的毒性分数，提供时 C = 1 - toxicity，替代词汇连贯性
+            background: 预先统计的语料背景词频（默认由 conversations 统计）
+
+        Returns:
+            InfoGainResult
+        """
+        conversations = list(conversations)
+        if background is None:
+            background = self.background(conversations)
+        total = max(float(background.sum()), 1.0)
+
+        parts = [self._analyze_chunk(conversations[lo:hi], background, total)
+                 for lo, hi in self._chunks(conversations)]
+        if parts:
+            merged = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+        else:
+            merged = {key: np.zeros(0) for key in ('turn_dkl', 'turn_relevance', 'turn_coherence', 'conv_dkl')}
+            merged['turn_counts'] = np.zeros(0, dtype=np.int64)
+        turn_counts = merged['turn_counts']
+
+        override_r = self._expand_factor(relevancy, turn_counts)
+        override_c = 1.0 - self._expand_factor(toxicity, turn_counts)
+        turn_relevance = np.where(np.isnan(override_r), merged['turn_relevance'], override_r)
+        turn_coherence = np.where(np.isnan(override_c), merged['turn_coherence'], override_c)
+        turn_info_gain = merged['turn_dkl'] * turn_relevance * turn_coherence
+
+        # 对话级 R / C 取逐轮均值
+        conv_of_turn = np.repeat(np.arange(len(turn_counts)), turn_counts)
+        safe_counts = np.maximum(turn_counts, 1)
+        conv_relevance = np.bincount(conv_of_turn, weights=turn_relevance, minlength=len(turn_counts)) / safe_counts
+        conv_coherence = np.bincount(conv_of_turn, weights=turn_coherence, minlength=len(turn_counts)) / safe_counts
+        conv_info_gain_total = np.bincount(conv_of_turn, weights=turn_info_gain, minlength=len(turn_counts))
+
+        return InfoGainResult(
+            turn_counts=turn_counts,
+            turn_dkl=merged['turn_dkl'],
+            turn_relevance=turn_relevance,
+            turn_coherence=turn_coherence,
+            turn_info_gain=turn_info_gain,
+            conv_dkl=merged['conv_dkl'],
+            conv_relevance=conv_relevance,
+            conv_coherence=conv_coherence,
+            conv_info_gain=merged['conv_dkl'] * conv_relevance * conv_coherence,
+            conv_info_gain_total=conv_info_gain_total,
+            question_type_dkl=question_type_divergence(
+                [[turn.get('question_type') for turn in conv] for conv in conversations]
+            ),
+        )
@@ -0,0 +1,278 @@
+"""
+本地问题分类器 - 流程分析的快速路径
+
+大多数 question_type 判定（技术性 how-to / 澄清 / 闲聊）很容易，却每次都要一次完整的 LLM 往返。
+本模块用哈希 n-gram 特征 + 线性 softmax 模型（NumPy 实现）在本地给出 question_type / value_level
+及置信度，置信度低于阈值的回合再交给 LLM 分析。
+
+模型由历史的 LLM 标注结果训练（见 utils/train_question_classifier.py），保存为 .npz 文件。
+"""
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+QUESTION_TYPES = ('clarifying', 'deepening', 'emotional', 'technical', 'off-topic')
+VALUE_LEVELS = ('high', 'medium', 'low')
+
+_WORD_RE = re.compile(r'[a-z0-9_]+')
+_SPACE_RE = re.compile(r'\s+')
+
+# 问题长度分桶（字符数上界），长度对 value_level 很有区分度
+_LENGTH_BUCKETS = (4, 8, 16, 32, 64, 128, 256)
+
+
+class HashedNgramFeaturizer:
+    """
+    哈希 n-gram 特征
+
+    - 字符 n-gram（对中文等无空格语言有效）
+    - 英文/数字单词的 unigram / bigram
+    - 问题长度分桶
+    特征经 crc32 哈希到固定维度，按 L2 归一化。
+    """
+
+    def __init__(
+        self,
+        n_features: int = 1 << 18,
+        char_ngrams: Tuple[int, ...] = (1, 2, 3),
+        max_chars: int = 300
+    ):
+        """
+        Args:
+            n_features: 哈希空间维度
+            char_ngrams: 使用的字符 n-gram 长度
+            max_chars: 只取问题的前 max_chars 个字符（长问题的开头已足够判断类型）
+        """
+        self.n_features = n_features
+        self.char_ngrams = tuple(char_ngrams)
+        self.max_chars = max_chars
+
+    def _tokens(self, text: str) -> List[str]:
+        text = _SPACE_RE.sub(' ', (text or '').lower()).strip()
+        tokens = [f"len:{sum(len(text) > b for b in _LENGTH_BUCKETS)}"]
+        text = text[:self.max_chars]
+        for n in self.char_ngrams:
+            tokens.extend('c:' + text[i:i + n] for i in range(len(text) - n + 1))
+        words = _WORD_RE.findall(text)
+        tokens.extend('w:' + w for w in words)
+        tokens.extend(f"w:{a} {b}" for a, b in zip(words, words[1:]))
+        return tokens
+
+    def transform_one(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """返回单条文本的 (特征下标, 特征值)"""
+        counts: Dict[int, float] = {}
+        for token in self._tokens(text):
+            h = zlib.crc32(token.encode('utf-8')) % self.n_features
+            counts[h] = counts.get(h, 0.0) + 1.0
+        indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        values /= np.linalg.norm(values)
+        return indices, values
+
+    def transform(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        批量提取特征（CSR 格式）
+
+        Returns:
+            (indptr, indices, values)，第 i 条文本的特征为 indices[indptr[i]:indptr[i+1]]
+        """
+        rows = [self.transform_one(t) for t in texts]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(idx) for idx, _ in rows])
+        if rows:
+            indices = np.concatenate([idx for idx, _ in rows])
+            values = np.concatenate([val for _, val in rows])
+        else:
+            indices = np.zeros(0, dtype=np.int64)
+            values = np.zeros(0, dtype=np.float32)
+        return indptr, indices, values
+
+
+def _softmax(scores: np.ndarray) -> np.ndarray:
+    scores = scores - scores.max(axis=1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class SoftmaxHead:
+    """稀疏特征上的多分类线性模型（softmax 回归，小批量 SGD 训练）"""
+
+    def __init__(self, labels: Sequence[str], n_features: int):
+        self.labels = tuple(labels)
+        self.weights = np.zeros((n_features, len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+
+    def _scores(self, indptr: np.ndarray, indices: np.ndarray, values: np.ndarray) -> np.ndarray:
+        contributions = self.weights[indices] * values[:, None]
+        # 每行至少有长度分桶特征，reduceat 不会遇到空区间
+        return np.add.reduceat(contributions, indptr[:-1], axis=0) + self.bias
+
+    def predict_proba(self, indptr: np.ndarray, indices: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """返回形状为 (n, 类别数) 的概率矩阵"""
+        return _softmax(self._scores(indptr, indices, values))
+
+    def fit(
+        self,
+        rows: List[Tuple[np.ndarray, np.ndarray]],
+        targets: np.ndarray,
+        epochs: int = 15,
+        learning_rate: float = 2.0,
+        batch_size: int = 32,
+        l2: float = 1e-6,
+        seed: int = 0
+    ):
+        """
+        训练
+
+        Args:
+            rows: 每个样本的 (特征下标, 特征值)
+            targets: 每个样本的类别下标
+        """
+        rng = np.random.RandomState(seed)
+        for epoch in range(epochs):
+            lr = learning_rate / (1 + epoch * 0.5)
+            order = rng.permutation(len(rows))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                lengths = [len(rows[i][0]) for i in batch]
+                indptr = np.zeros(len(batch) + 1, dtype=np.int64)
+                indptr[1:] = np.cumsum(lengths)
+                indices = np.concatenate([rows[i][0] for i in batch])
+                values = np.concatenate([rows[i][1] for i in batch])
+
+                grad = self.predict_proba(indptr, indices, values)
+                grad[np.arange(len(batch)), targets[batch]] -= 1.0
+                grad /= len(batch)
+
+                row_of = np.repeat(np.arange(len(batch)), lengths)
+                if l2:
+                    self.weights[indices] *= (1 - lr * l2)
+                np.add.at(self.weights, indices, -lr * values[:, None] * grad[row_of])
+                self.bias -= lr * grad.sum(axis=0)
+
+
+@dataclass
+class LocalPrediction:
+    """本地分类结果"""
+    question_type: str
+    value_level: str
+    type_confidence: float
+    value_confidence: float
+
+    @property
+    def confidence(self) -> float:
+        """整体置信度：两个分类头中较低的一个"""
+        return min(self.type_confidence, self.value_confidence)
+
+
+class LocalQuestionClassifier:
+    """
+    本地问题分类器
+
+    用法:
+        classifier = LocalQuestionClassifier.load('models/question_classifier.npz')
+        prediction = classifier.predict(question)
+        if prediction.confidence >= classifier.threshold:
+            ...  # 直接使用本地结果
+        else:
+            ...  # 交给 LLM
+    """
+
+    def __init__(
+        self,
+        featurizer: Optional[HashedNgramFeaturizer] = None,
+        threshold: float = 0.8
+    ):
+        """
+        Args:
+            featurizer: 特征提取器（默认 2^18 维哈希空间）
+            threshold: 置信度阈值，低于该值的回合交给 LLM
+        """
+        self.featurizer = featurizer or HashedNgramFeaturizer()
+        self.threshold = threshold
+        self.type_head = SoftmaxHead(QUESTION_TYPES, self.featurizer.n_features)
+        self.value_head = SoftmaxHead(VALUE_LEVELS, self.featurizer.n_features)
+
+    def fit(
+        self,
+        questions: Sequence[str],
+        question_types: Sequence[str],
+        value_levels: Sequence[str],
+        epochs: int = 15,
+        seed: int = 0
+    ) -> 'LocalQuestionClassifier':
+        """
+        用 LLM 标注的回合训练两个分类头
+
+        Args:
+            questions: 问题文本
+            question_types: 对应的 question_type 标签
+            value_levels: 对应的 value_level 标签
+        """
+        rows = [self.featurizer.transform_one(q) for q in questions]
+        type_targets = np.array([QUESTION_TYPES.index(t) for t in question_types], dtype=np.int64)
+        value_targets = np.array([VALUE_LEVELS.index(v) for v in value_levels], dtype=np.int64)
+        self.type_head.fit(rows, type_targets, epochs=epochs, seed=seed)
+        self.value_head.fit(rows, value_targets, epochs=epochs, seed=seed + 1)
+        return self
+
+    def predict_batch(self, questions: Sequence[str]) -> List[LocalPrediction]:
+        """批量预测"""
+        if not questions:
+            return []
+        features = self.featurizer.transform(questions)
+        type_proba = self.type_head.predict_proba(*features)
+        value_proba = self.value_head.predict_proba(*features)
+        type_best = type_proba.argmax(axis=1)
+        value_best = value_proba.argmax(axis=1)
+        return [
+            LocalPrediction(
+                question_type=QUESTION_TYPES[t],
+                value_level=VALUE_LEVELS[v],
+                type_confidence=float(type_proba[i, t]),
+                value_confidence=float(value_proba[i, v])
+            )
+            for i, (t, v) in enumerate(zip(type_best, value_best))
+        ]
+
+    def predict(self, question: str) -> LocalPrediction:
+        """预测单个问题"""
+        return self.predict_batch([question])[0]
+
+    def save(self, path: str):
+        """导出为 .npz 文件"""
+        np.savez_compressed(
+            path,
+            n_features=self.featurizer.n_features,
+            char_ngrams=np.array(self.featurizer.char_ngrams),
+            max_chars=self.featurizer.max_chars,
+            threshold=self.threshold,
+            type_weights=self.type_head.weights,
+            type_bias=self.type_head.bias,
+            value_weights=self.value_head.weights,
+            value_bias=self.value_head.bias,
+        )
+
+    @classmethod
+    def load(cls, path: str, threshold: Optional[float] = None) -> 'LocalQuestionClassifier':
+        """
+        从 .npz 文件加载
+
+        Args:
+            threshold: 覆盖导出时保存的置信度阈值
+        """
+        data = np.load(path)
+        featurizer = HashedNgramFeaturizer(
+            n_features=int(data['n_features']),
+            char_ngrams=tuple(int(n) for n in data['char_ngrams']),
+            max_chars=int(data['max_chars'])
+        )
+        classifier = cls(featurizer, threshold=float(data['threshold']) if threshold is None else threshold)
+        classifier.type_head.weights = data['type_weights']
+        classifier.type_head.bias = data['type_bias']
+        classifier.value_head.weights = data['value_weights']
+        classifier.value_head.bias = data['value_bias']
+        return classifier
@@ -0,0 +1,88 @@
+"""
+LLM 调用限速器
+
+按固定间隔发放调用名额（每分钟 N 次 → 每次间隔 60/N 秒），允许少量突发。
+- RateLimiter(...): 进程内线程安全
+- RateLimiter.shared(...): 基于 multiprocessing 共享内存，多个工作进程共用同一预算
+"""
+import multiprocessing
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    限速器
+
+    用法:
+        limiter = RateLimiter(requests_per_minute=60)
+        limiter.acquire()  # 阻塞直到获得调用名额
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        burst: int = 1
+    ):
+        """
+        Args:
+            requests_per_minute: 每分钟允许的调用次数
+            burst: 允许的突发调用数（空闲后可连续发出的调用数）
+        """
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute 必须大于 0")
+        self.requests_per_minute = requests_per_minute
+        self.burst = max(1, burst)
+        self.interval = 60.0 / requests_per_minute
+        self._lock = threading.Lock()
+        # 下一个可用调用时间点；跨进程共享时保存在共享内存中
+        self._next_slot = None
+        self._local_next_slot = 0.0
+
+    @classmethod
+    def shared(
+        cls,
+        requests_per_minute: float,
+        burst: int = 1,
+        context: Optional[multiprocessing.context.BaseContext] = None
+    ) -> 'RateLimiter':
+        """
+        创建可跨进程共享的限速器
+
+        需要在创建工作进程时传入（例如 ProcessPoolExecutor 的 initargs），
+        所有进程共享同一个调用预算。
+        """
+        ctx = context or multiprocessing.get_context('spawn')
+        limiter = cls(requests_per_minute, burst=burst)
+        limiter._lock = ctx.Lock()
+        limiter._next_slot = ctx.Value('d', 0.0, lock=False)
+        return limiter
+
+    def _get_next_slot(self) -> float:
+        return self._next_slot.value if self._next_slot is not None else self._local_next_slot
+
+    def _set_next_slot(self, value: float):
+        if self._next_slot is not None:
+            self._next_slot.value = value
+        else:
+            self._local_next_slot = value
+
+    def acquire(self) -> float:
+        """
+        获取一个调用名额（必要时阻塞等待）
+
+        Returns:
+            实际等待的秒数
+        """
+        with self._lock:
+            # 跨进程需要可比较的时钟，使用 time.time()
+            now = time.time()
+            earliest = now - (self.burst - 1) * self.interval
+            slot = max(self._get_next_slot(), earliest)
+            self._set_next_slot(slot + self.interval)
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+            return wait
+        return 0.0
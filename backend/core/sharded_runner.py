@@ -0,0 +1,277 @@
+"""
+分片多进程语料评估
+
+夜间全量评估时单个 ChatQualityEvaluator 进程是瓶颈（deepeval 的 Python 端开销占主导）。
+ShardedEvaluationRunner 把对话按问答对数量均衡地划分到 N 个工作进程：
+- 每个工作进程创建自己的 ChatQualityEvaluator / ChatAIAPIModel
+- 所有进程共享同一个限速预算（RateLimiter.shared）
+- 每个分片写出独立的结果文件，最后合并为与 evaluate_conversation 相同的结构
+"""
+import argparse
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from core.data_loader import ChatDataLoader
+from core.rate_limiter import RateLimiter
+from core.safety_prescreen import LocalSafetyScorer
+from core.summary_stats import MetricAggregator
+
+# 导入配置中心
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config.llm_config import LLMConfig
+
+
+# 工作进程内的共享限速器（由 ProcessPoolExecutor 的 initializer 设置）
+_worker_rate_limiter: Optional[RateLimiter] = None
+
+
+def _init_worker(rate_limiter: Optional[RateLimiter]):
+    global _worker_rate_limiter
+    _worker_rate_limiter = rate_limiter
+
+
+def _run_shard(
+    shard_index: int,
+    data_folder: str,
+    conversation_ids: List[str],
+    output_file: str,
+    options: Dict[str, Any]
+) -> str:
+    """在工作进程中评估一个分片，并把结果写入分片文件"""
+    from core.evaluate_chats import ChatQualityEvaluator
+
+    evaluator = ChatQualityEvaluator(
+        data_folder,
+        model=options.get('model'),
+        prescreen=options.get('prescreen', False),
+        rate_limiter=_worker_rate_limiter
+    )
+    results = evaluator.evaluate_conversation(
+        conversation_ids=conversation_ids,
+        max_qa_pairs=options.get('max_qa_pairs_per_shard'),
+        selected_metrics=options.get('selected_metrics'),
+        dedup_threshold=options.get('dedup_threshold')
+    )
+    results['shard'] = {
+        'index': shard_index,
+        'conversation_ids': conversation_ids,
+        'metric_names': list(evaluator.metrics.keys()),
+        'prescreen': evaluator.prescreen is not None,
+        'aggregator': evaluator.aggregator.to_dict()
+    }
+    evaluator.save_results(results, output_file)
+    return output_file
+
+
+class ShardedEvaluationRunner:
+    """分片多进程评估器"""
+
+    def __init__(
+        self,
+        data_folder: str,
+        num_workers: int = 4,
+        model: str = None,
+        requests_per_minute: Optional[float] = None,
+        output_dir: str = 'evaluation_results/shards',
+        prescreen: bool = False
+    ):
+        """
+        Args:
+            data_folder: 聊天数据文件夹路径
+            num_workers: 工作进程数（也是分片数）
+            model: 用于评估的模型（默认使用配置中心的评估模型）
+            requests_per_minute: 所有工作进程共享的每分钟 LLM 调用上限，
+                默认读取 CHATAI_RATE_LIMIT_RPM，未配置则不限速
+            output_dir: 分片结果文件目录
+            prescreen: 是否对毒性/偏见启用本地预筛
+        """
+        self.data_folder = data_folder
+        self.num_workers = max(1, num_workers)
+        self.model = model
+        self.requests_per_minute = requests_per_minute or LLMConfig.get_rate_limit()
+        self.output_dir = Path(output_dir)
+        self.prescreen = prescreen
+        self.loader = ChatDataLoader(data_folder)
+
+    def partition(self) -> List[List[str]]:
+        """
+        按问答对数量把对话均衡划分到各分片（最长处理时间优先的贪心分配）
+
+        Returns:
+            每个分片的对话 ID 列表（分片内保持原始对话顺序）
+        """
+        conversations = self.loader.load_conversations()
+        order = {c.conversation_id: i for i, c in enumerate(conversations)}
+        sizes = [(len(self.loader.get_qa_pairs(c)), c.conversation_id) for c in conversations]
+
+        shards: List[List[str]] = [[] for _ in range(self.num_workers)]
+        loads = [0] * self.num_workers
+        for size, conv_id in sorted(sizes, key=lambda x: -x[0]):
+            target = loads.index(min(loads))
+            shards[target].append(conv_id)
+            loads[target] += size
+
+        return [sorted(shard, key=order.get) for shard in shards if shard]
+
+    def run(
+        self,
+        selected_metrics: List[str] = None,
+        max_qa_pairs_per_shard: int = None,
+        dedup_threshold: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        并行评估所有分片并合并结果
+
+        Returns:
+            与 ChatQualityEvaluator.evaluate_conversation 相同结构的结果字典
+        """
+        shards = self.partition()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        print(f"分片评估: {len(shards)} 个分片, 限速 {self.requests_per_minute or '无'} 次/分钟")
+
+        ctx = multiprocessing.get_context('spawn')
+        rate_limiter = (
+            RateLimiter.shared(self.requests_per_minute, context=ctx)
+            if self.requests_per_minute else None
+        )
+        options = {
+            'model': self.model,
+            'prescreen': self.prescreen,
+            'selected_metrics': selected_metrics,
+            'max_qa_pairs_per_shard': max_qa_pairs_per_shard,
+            'dedup_threshold': dedup_threshold,
+        }
+
+        shard_files = []
+        with ProcessPoolExecutor(
+            max_workers=len(shards),
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(rate_limiter,)
+        ) as executor:
+            futures = {
+                executor.submit(
+                    _run_shard,
+                    i,
+                    self.data_folder,
+                    conversation_ids,
+                    str(self.output_dir / f"shard_{i:03d}.json"),
+                    options
+                ): i
+                for i, conversation_ids in enumerate(shards)
+            }
+            for future in as_completed(futures):
+                shard_files.append(future.result())
+                print(f"分片 {futures[future]} 完成: {shard_files[-1]}")
+
+        return self.merge_shard_files(sorted(shard_files), self._conversation_order())
+
+    def _conversation_order(self) -> List[str]:
+        return [c.conversation_id for c in self.loader.load_conversations()]
+
+    @staticmethod
+    def merge_shard_files(
+        shard_files: List[str],
+        conversation_order: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        合并分片结果文件
+
+        Args:
+            shard_files: 分片结果文件路径列表
+            conversation_order: 原始对话顺序，提供时按该顺序排列合并后的 results
+
+        Returns:
+            与 ChatQualityEvaluator.evaluate_conversation 相同结构的结果字典
+        """
+        shards = []
+        for path in shard_files:
+            with open(path, 'r', encoding='utf-8') as f:
+                shards.append(json.load(f))
+
+        aggregator = MetricAggregator()
+        metric_names: List[str] = []
+        prescreen = False
+        dedup = None
+        entries = []
+        for shard_no, shard in enumerate(shards):
+            info = shard['shard']
+            aggregator.merge(MetricAggregator.from_dict(info['aggregator']))
+            metric_names.extend(m for m in info['metric_names'] if m not in metric_names)
+            prescreen = prescreen or info.get('prescreen', False)
+            shard_dedup = shard['summary'].get('dedup')
+            if shard_dedup:
+                dedup = dedup or {'threshold': shard_dedup['threshold'], 'clusters': 0, 'duplicates_skipped': 0}
+                dedup['clusters'] += shard_dedup['clusters']
+                dedup['duplicates_skipped'] += shard_dedup['duplicates_skipped']
+            for local_index, result in enumerate(shard['results']):
+                entries.append((shard_no, local_index, result))
+
+        if conversation_order:
+            position = {conv_id: i for i, conv_id in enumerate(conversation_order)}
+            entries.sort(key=lambda e: position.get(e[2]['conversation_id'], len(position)))
+
+        # deduplicated_from 是分片内下标，合并后重映射为全局下标
+        global_index = {(shard_no, local_index): i for i, (shard_no, local_index, _) in enumerate(entries)}
+        results = []
+        for shard_no, _, result in entries:
+            if result.get('deduplicated_from') is not None:
+                result['deduplicated_from'] = global_index[(shard_no, result['deduplicated_from'])]
+            results.append(result)
+
+        summary = aggregator.summary(metric_names=metric_names)
+        if prescreen:
+            local = aggregator.tier_total('local')
+            escalated = aggregator.tier_total('llm', metric_names=list(LocalSafetyScorer.CATEGORIES))
+            summary['prescreen'] = {
+                'local_decisions': local,
+                'llm_escalations': escalated,
+                'llm_measures_saved_ratio': local / (local + escalated) if local + escalated else 0
+            }
+        if dedup:
+            summary['dedup'] = dedup
+
+        return {
+            'total_qa_pairs': aggregator.total,
+            'results': results,
+            'summary': summary
+        }
+
+
+def main():
+    """命令行入口：python -m core.sharded_runner <data_folder> --workers 4"""
+    parser = argparse.ArgumentParser(description="分片多进程语料质量评估")
+    parser.add_argument('data_folder', help="包含 conversations.json 的文件夹")
+    parser.add_argument('--workers', type=int, default=4, help="工作进程数")
+    parser.add_argument('--model', default=None, help="评估模型")
+    parser.add_argument('--rpm', type=float, default=None, help="所有进程共享的每分钟调用上限")
+    parser.add_argument('--output-dir', default='evaluation_results/shards', help="分片结果目录")
+    parser.add_argument('--output', default='evaluation_results/corpus_quality_report.json', help="合并结果文件")
+    parser.add_argument('--metrics', nargs='*', default=None, help="要使用的指标")
+    parser.add_argument('--prescreen', action='store_true', help="启用毒性/偏见本地预筛")
+    parser.add_argument('--dedup-threshold', type=float, default=None, help="近重复去重阈值")
+    args = parser.parse_args()
+
+    runner = ShardedEvaluationRunner(
+        args.data_folder,
+        num_workers=args.workers,
+        model=args.model,
+        requests_per_minute=args.rpm,
+        output_dir=args.output_dir,
+        prescreen=args.prescreen
+    )
+    results = runner.run(selected_metrics=args.metrics, dedup_threshold=args.dedup_threshold)
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n合并结果已保存到: {output_path} (共 {results['total_qa_pairs']} 个问答对)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,370 @@
+"""
+流式摘要统计 - 单遍、可合并的评估指标聚合
+
+- RunningStats: Welford 在线均值/方差（Chan 公式合并）
+- QuantileSketch: KLL 风格的可合并分位数草图（p50/p90/p99）
+- MetricAggregator: 每完成一个问答对更新一次，可跨分片合并，
+  生成与 ChatQualityEvaluator._generate_summary 相同结构的摘要
+
+百万级问答对的语料评估无需在内存中保留全部结果即可随时得到摘要。
+"""
+import functools
+import math
+import statistics
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class RunningStats:
+    """Welford 在线均值/方差统计"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, x: float):
+        """加入一个样本"""
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def merge(self, other: 'RunningStats') -> 'RunningStats':
+        """合并另一个统计（Chan 并行方差公式），原地更新并返回自身"""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def variance(self) -> float:
+        """样本方差（n-1）"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std_dev(self) -> float:
+        return math.sqrt(self.variance)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'm2': self.m2,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'RunningStats':
+        stats = cls()
+        stats.count = data['count']
+        stats.mean = data['mean']
+        stats.m2 = data['m2']
+        stats.min = data['min'] if data['count'] else math.inf
+        stats.max = data['max'] if data['count'] else -math.inf
+        return stats
+
+
+class QuantileSketch:
+    """
+    KLL 风格分位数草图
+
+    第 h 层的每个元素代表 2^h 个原始样本；某层满时排序并隔一取一提升到上一层。
+    内存占用约 3k 个浮点数，秩误差约 O(1/k)，两个草图可直接合并。
+    """
+
+    def __init__(self, k: int = 200):
+        self.k = k
+        self.count = 0
+        self.compactors: List[List[float]] = [[]]
+        self._offsets: List[int] = [0]
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, x: float):
+        """加入一个样本"""
+        self.compactors[0].append(x)
+        self.count += 1
+        if len(self.compactors[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """合并另一个草图，原地更新并返回自身"""
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+            self._offsets.append(0)
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.count += other.count
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.compactors):
+            buffer = self.compactors[level]
+            if len(buffer) >= self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append([])
+                    self._offsets.append(0)
+                buffer.sort()
+                # 奇数个元素时保留一个在本层，保证总权重不变
+                keep = [buffer.pop()] if len(buffer) % 2 else []
+                offset = self._offsets[level]
+                self._offsets[level] ^= 1
+                self.compactors[level + 1].extend(buffer[offset::2])
+                self.compactors[level] = keep
+            level += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """估计 q 分位数（0 <= q <= 1），无样本时返回 None"""
+        weighted = sorted(
+            (value, 1 << level)
+            for level, items in enumerate(self.compactors)
+            for value in items
+        )
+        if not weighted:
+            return None
+        total = sum(weight for _, weight in weighted)
+        target = q * total
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= target:
+                return value
+        return weighted[-1][0]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'k': self.k, 'count': self.count, 'compactors': self.compactors}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'QuantileSketch':
+        sketch = cls(k=data['k'])
+        sketch.count = data['count']
+        sketch.compactors = [list(items) for items in data['compactors']] or [[]]
+        sketch._offsets = [0] * len(sketch.compactors)
+        return sketch
+
+
+# 自由度不小于该值时 t 分位数用 Cornish-Fisher 展开近似（误差 < 1e-3），更小时精确求解
+EXACT_T_MAX_DF = 30
+
+
+def _t_central_probability(t: float, df: int) -> float:
+    """P(|T| < t)，T 服从自由度为 df（整数）的 t 分布（Abramowitz & Stegun 26.7.3/26.7.4 的有限级数）"""
+    theta = math.atan(t / math.sqrt(df))
+    cos2 = math.cos(theta) ** 2
+    series, term = 1.0, 1.0
+    if df % 2 == 1:
+        if df == 1:
+            return 2 * theta / math.pi
+        for k in range(1, (df - 3) // 2 + 1):
+            term *= 2 * k / (2 * k + 1) * cos2
+            series += term
+        return 2 / math.pi * (theta + math.sin(theta) * math.cos(theta) * series)
+    for k in range(1, (df - 2) // 2 + 1):
+        term *= (2 * k - 1) / (2 * k) * cos2
+        series += term
+    return math.sin(theta) * series
+
+
+@functools.lru_cache(maxsize=256)
+def t_quantile(confidence: float, df: int) -> float:
+    """双侧 t 分位数：P(|T| < t) = confidence"""
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    if df >= EXACT_T_MAX_DF:
+        return z + (z**3 + z) / (4 * df) + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+    # 小自由度时展开式严重偏小（df=1 时 95% 分位数为 7.15，实际 12.71），用精确分布函数二分求解
+    low, high = z, 2 * z
+    while _t_central_probability(high, df) < confidence:
+        low, high = high, high * 2
+    for _ in range(100):
+        mid = (low + high) / 2
+        if _t_central_probability(mid, df) < confidence:
+            low = mid
+        else:
+            high = mid
+        if high - low < 1e-10:
+            break
+    return (low + high) / 2
+
+
+def mean_confidence_interval(
+    mean: float,
+    std_dev: float,
+    count: int,
+    confidence: float = 0.95
+) -> Tuple[float, float]:
+    """
+    计算均值的置信区间（t 分布）
+
+    Returns:
+        (下界, 上界)，样本数不足 2 时区间退化为 (均值, 均值)
+    """
+    if count < 2:
+        return mean, mean
+    t = t_quantile(confidence, count - 1)
+    half_width = t * std_dev / math.sqrt(count)
+    return mean - half_width, mean + half_width
+
+
+class _MetricState:
+    """单个指标的聚合状态"""
+
+    def __init__(self):
+        self.stats = RunningStats()
+        self.sketch = QuantileSketch()
+        self.passed_count = 0
+        self.tier_counts: Dict[str, int] = {}
+
+    def merge(self, other: '_MetricState'):
+        self.stats.merge(other.stats)
+        self.sketch.merge(other.sketch)
+        self.passed_count += other.passed_count
+        for tier, n in other.tier_counts.items():
+            self.tier_counts[tier] = self.tier_counts.get(tier, 0) + n
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'stats': self.stats.to_dict(),
+            'sketch': self.sketch.to_dict(),
+            'passed_count': self.passed_count,
+            'tier_counts': self.tier_counts,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> '_MetricState':
+        state = cls()
+        state.stats = RunningStats.from_dict(data['stats'])
+        state.sketch = QuantileSketch.from_dict(data['sketch'])
+        state.passed_count = data['passed_count']
+        state.tier_counts = dict(data['tier_counts'])
+        return state
+
+
+class MetricAggregator:
+    """
+    评估结果的在线聚合器
+
+    用法:
+        aggregator = MetricAggregator()
+        for qa_result in ...:
+            aggregator.update(qa_result)
+            live_summary = aggregator.summary()
+
+        # 跨分片合并
+        total = MetricAggregator.from_dict(shard_a).merge(MetricAggregator.from_dict(shard_b))
+    """
+
+    QUANTILES = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+
+    def __init__(self):
+        self.total = 0
+        self._metrics: Dict[str, _MetricState] = {}
+
+    def update(self, qa_result: Dict[str, Any]):
+        """加入一个问答对的评估结果（evaluate_conversation 的 results 元素）"""
+        self.total += 1
+        for metric_name, entry in qa_result.get('scores', {}).items():
+            state = self._metrics.setdefault(metric_name, _MetricState())
+            if entry.get('score') is not None:
+                state.stats.update(entry['score'])
+                state.sketch.update(entry['score'])
+            if entry.get('passed', False):
+                state.passed_count += 1
+            tier = entry.get('tier')
+            if tier:
+                state.tier_counts[tier] = state.tier_counts.get(tier, 0) + 1
+
+    def merge(self, other: 'MetricAggregator') -> 'MetricAggregator':
+        """合并另一个聚合器（例如另一个分片），原地更新并返回自身"""
+        self.total += other.total
+        for metric_name, state in other._metrics.items():
+            self._metrics.setdefault(metric_name, _MetricState()).merge(state)
+        return self
+
+    def metric_stats(self, metric_name: str) -> Optional[RunningStats]:
+        """返回某指标的均值/方差统计，未出现过时返回 None"""
+        state = self._metrics.get(metric_name)
+        return state.stats if state else None
+
+    def summary(self, confidence: float = 0.95, metric_names: List[str] = None) -> Dict[str, Any]:
+        """
+        生成摘要
+
+        Args:
+            confidence: 均值置信区间的置信水平
+            metric_names: 指标输出顺序/范围，None 则按出现顺序输出全部指标
+
+        Returns:
+            {'total': ..., 'metrics': {name: {...}}}
+        """
+        summary = {
+            'total': self.total,
+            'metrics': {}
+        }
+        for metric_name in metric_names or list(self._metrics):
+            state = self._metrics.get(metric_name)
+            if not state or state.stats.count == 0:
+                continue
+            stats = state.stats
+            ci_lower, ci_upper = mean_confidence_interval(stats.mean, stats.std_dev, stats.count, confidence)
+            entry = {
+                'average_score': stats.mean,
+                'std_dev': stats.std_dev,
+                'ci_lower': ci_lower,
+                'ci_upper': ci_upper,
+                'ci_width': ci_upper - ci_lower,
+                'confidence': confidence,
+                'min_score': stats.min,
+                'max_score': stats.max,
+            }
+            for name, q in self.QUANTILES.items():
+                entry[name] = state.sketch.quantile(q)
+            entry.update({
+                'passed_count': state.passed_count,
+                'total_evaluated': stats.count,
+                'tier_counts': dict(state.tier_counts),
+            })
+            summary['metrics'][metric_name] = entry
+        return summary
+
+    def tier_total(self, tier: str, metric_names: List[str] = None) -> int:
+        """统计指定评分层（'local' / 'llm' / 'dedup'）给出的分数总数"""
+        return sum(
+            state.tier_counts.get(tier, 0)
+            for name, state in self._metrics.items()
+            if metric_names is None or name in metric_names
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为可 JSON 保存的状态（用于分片结果文件）"""
+        return {
+            'total': self.total,
+            'metrics': {name: state.to_dict() for name, state in self._metrics.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'MetricAggregator':
+        aggregator = cls()
+        aggregator.total = data['total']
+        aggregator._metrics = {
+            name: _MetricState.from_dict(state) for name, state in data['metrics'].items()
+        }
+        return aggregator
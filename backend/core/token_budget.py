@@ -0,0 +1,186 @@
+"""
+提示词 token 预算工具
+
+本地估算 token 数（无需调用分词器）：CJK 字符约 1 token/字，其他字符约 4 字符/token。
+估算偏保守，用于在发送请求前控制提示词规模。
+
+ContextBudget 按任务预算（LLMConfig.get_prompt_budget）裁剪/摘要上下文片段，
+避免粘贴的大段代码撑爆提示词、拖慢响应或超出上下文窗口。
+"""
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+_CJK_RE = re.compile(r'[　-〿぀-ヿ㐀-䶿一-鿿가-힯＀-￯]')
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的 token 数"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+_CODE_BLOCK_RE = re.compile(r'```[^\n]*\n(.*?)```', re.DOTALL)
+
+# 代码块超过该行数时折叠为摘要
+_CODE_BLOCK_KEEP_LINES = 3
+
+
+def _collapse_code_blocks(text: str) -> str:
+    """把较长的代码块折叠为前几行 + 省略说明"""
+    def collapse(match):
+        lines = match.group(1).splitlines()
+        if len(lines) <= _CODE_BLOCK_KEEP_LINES * 2:
+            return match.group(0)
+        head = "\n".join(lines[:_CODE_BLOCK_KEEP_LINES])
+        return f"```\n{head}\n…[代码共 {len(lines)} 行，已省略]\n```"
+    return _CODE_BLOCK_RE.sub(collapse, text)
+
+
+def summarize_text(text: str, max_tokens: int) -> str:
+    """
+    把文本压缩到 max_tokens 以内
+
+    先折叠长代码块；仍然超出时保留开头约 2/3 和结尾约 1/3，中间以省略标记代替。
+    """
+    if max_tokens <= 0:
+        return ''
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    text = _collapse_code_blocks(text)
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+
+    chars_per_token = len(text) / total
+    keep = int(max_tokens * chars_per_token)
+    while keep > 0:
+        head = text[:keep * 2 // 3]
+        tail = text[len(text) - keep // 3:] if keep // 3 else ''
+        omitted = total - estimate_tokens(head) - estimate_tokens(tail)
+        result = f"{head}…[省略约 {omitted} tokens]…{tail}"
+        if estimate_tokens(result) <= max_tokens:
+            return result
+        keep = int(keep * 0.9)
+    return text[:max(0, int(max_tokens * chars_per_token))]
+
+
+class ContextBudget:
+    """
+    提示词上下文预算
+
+    把若干上下文片段裁剪到总预算以内：按优先级从低到高依次压缩（summarize_text），
+    压缩到下限仍超出时整段丢弃低优先级片段。线程安全，累计记录节省的 token 数。
+
+    用法:
+        budget = ContextBudget(max_tokens=1500)
+        # sections 按优先级从低到高排列，最后一个最重要
+        fitted = budget.fit([old_answer, old_question, current_question], fixed_tokens=template_tokens)
+        print(budget.stats())
+    """
+
+    def __init__(self, max_tokens: int, min_section_tokens: int = 48):
+        """
+        Args:
+            max_tokens: 整个提示词（含固定模板）的 token 预算
+            min_section_tokens: 压缩时每个片段至少保留的 token 数（低于该值则整段丢弃）
+        """
+        self.max_tokens = max_tokens
+        self.min_section_tokens = min_section_tokens
+        self._lock = threading.Lock()
+        self._counters = {'prompts': 0, 'trimmed_prompts': 0, 'tokens_before': 0, 'tokens_after': 0}
+
+    def fit(self, sections: List[str], fixed_tokens: int = 0) -> List[str]:
+        """
+        裁剪上下文片段
+
+        Args:
+            sections: 片段列表，按优先级从低到高排列（最后一个最后才会被压缩，且不会被丢弃）
+            fixed_tokens: 模板等固定部分占用的 token 数
+
+        Returns:
+            与 sections 等长的列表，被丢弃的片段为空字符串
+        """
+        sections = list(sections)
+        if not sections:
+            return sections
+        sizes = [estimate_tokens(s) for s in sections]
+        before = fixed_tokens + sum(sizes)
+        available = self.max_tokens - fixed_tokens
+        over = before - self.max_tokens
+        last = len(sections) - 1
+
+        def shrink(i: int, target: int):
+            nonlocal over
+            sections[i] = summarize_text(sections[i], target)
+            new_size = estimate_tokens(sections[i])
+            over -= sizes[i] - new_size
+            sizes[i] = new_size
+
+        # 最重要的片段最多占一半预算，避免一段超长代码挤掉全部上下文
+        if over > 0 and last > 0 and sizes[last] > available // 2:
+            shrink(last, max(self.min_section_tokens, available // 2))
+
+        # 按优先级把其余片段压缩到下限，仍超出则依次整段丢弃
+        for i in range(last):
+            if over <= 0:
+                break
+            target = max(self.min_section_tokens, sizes[i] - over)
+            if target < sizes[i]:
+                shrink(i, target)
+        for i in range(last):
+            if over <= 0:
+                break
+            shrink(i, 0)
+
+        # 最后才压缩最重要的片段
+        if over > 0:
+            shrink(last, max(1, sizes[last] - over))
+
+        self._record(before, fixed_tokens + sum(sizes))
+        return sections
+
+    def cap(self, text: str, max_tokens: int) -> str:
+        """单独压缩一段文本（例如批量提示词中的每个回合），同样计入统计"""
+        return self.cap_all([text], max_tokens)[0]
+
+    def cap_all(self, texts: List[str], max_tokens: int) -> List[str]:
+        """把同一个提示词中的多段文本分别压缩到 max_tokens 以内，统计中计为一个提示词"""
+        if not texts:
+            return []
+        results = [summarize_text(text, max_tokens) for text in texts]
+        self._record(sum(estimate_tokens(t) for t in texts), sum(estimate_tokens(r) for r in results))
+        return results
+
+    def _record(self, before: int, after: int):
+        with self._lock:
+            self._counters['prompts'] += 1
+            self._counters['trimmed_prompts'] += after < before
+            self._counters['tokens_before'] += before
+            self._counters['tokens_after'] += after
+
+    def snapshot(self) -> Dict[str, int]:
+        """当前累计计数（配合 stats(since=...) 计算单次运行的统计）"""
+        with self._lock:
+            return dict(self._counters)
+
+    def stats(self, since: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        节省 token 统计
+
+        Args:
+            since: snapshot() 的返回值，提供时只统计其后的部分
+        """
+        counters = self.snapshot()
+        if since:
+            counters = {k: v - since.get(k, 0) for k, v in counters.items()}
+        saved = counters['tokens_before'] - counters['tokens_after']
+        return {
+            'budget': self.max_tokens,
+            **counters,
+            'tokens_saved': saved,
+            'saved_ratio': saved / counters['tokens_before'] if counters['tokens_before'] else 0.0,
+        }
@@ -0,0 +1,270 @@
+"""
+词汇层面的话题转移检测 - 不依赖 LLM
+
+对一个对话的所有回合一次性构建 TF-IDF 稀疏矩阵（字符 2/3-gram，对中文同样有效），
+计算每个问题与之前滑动窗口内回合（问题 + 回答）的余弦相似度：
+- 相似度低于 shift_threshold → topic_shift
+- 相似度达到 builds_threshold 或出现指代/追问用语 → builds_on_previous
+
+整个流程是向量化的 NumPy 运算：字符 n-gram 由码点数组直接拼接并哈希到特征桶，
+稀疏点积通过有序键 + searchsorted 完成，1 万回合的对话在 1 秒内处理完。
+"""
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ASCII 中只有字母和数字参与 n-gram
+_ASCII_WORD = np.zeros(128, dtype=bool)
+_ASCII_WORD[[ord(c) for c in '0123456789abcdefghijklmnopqrstuvwxyz']] = True
+
+# 非 ASCII 的标点/空白区间（通用标点、CJK 标点、全角标点），其余字符（汉字、假名、字母等）参与 n-gram
+_PUNCT_RANGES = np.array([
+    (0x0080, 0x00BF), (0x2000, 0x206F), (0x2190, 0x2BFF), (0x3000, 0x303F),
+    (0xFE30, 0xFE4F), (0xFF00, 0xFF0F), (0xFF1A, 0xFF20), (0xFF3B, 0xFF40), (0xFF5B, 0xFF65),
+], dtype=np.uint32)
+
+# 明显依赖上文的追问/指代用语（词汇重叠很低但并非话题转移，例如"能举个例子吗"）
+FOLLOWUP_CUES = re.compile(
+    r'(这个|那个|上面|刚才|刚刚|你说的|继续|还有呢|为什么|举个例子|再详细|具体一点|然后呢|'
+    r'\b(it|this|that|these|those|above|again|continue|why|example|elaborate|more)\b)',
+    re.IGNORECASE
+)
+
+# 码点占 21 位，2/3-gram 可直接拼接为 uint64 键
+_CODEPOINT_BITS = np.uint64(21)
+
+# n-gram 键经乘法哈希映射到 2^22 个特征桶（避免对全部 n-gram 排序建词表，冲突可忽略）
+FEATURE_BITS = 22
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def char_ngram_keys(
+    texts: Sequence[str],
+    max_chars: int,
+    sizes: Tuple[int, ...] = (2, 3)
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    提取所有文本的字符 n-gram（2-gram / 3-gram）
+
+    Args:
+        texts: 文本列表
+        max_chars: 每段文本参与计算的最大字符数
+        sizes: 提取哪些长度的 n-gram
+
+    Returns:
+        (文档下标, n-gram 键)
+    """
+    # 文本之间用 \x00 分隔；分隔符、空白和标点不参与 n-gram
+    joined = '\x00'.join((t or '')[:max_chars] for t in texts).lower()
+    codes32 = np.frombuffer(joined.encode('utf-32-le'), dtype=np.uint32)
+    doc_of = np.cumsum(codes32 == 0)
+    is_ascii = codes32 < 128
+    valid = np.where(is_ascii, _ASCII_WORD[np.where(is_ascii, codes32, 0)], True)
+    # 标点区间都在 0x80 以上，只需检查非 ASCII 字符
+    non_ascii = np.flatnonzero(~is_ascii)
+    if len(non_ascii):
+        other = codes32[non_ascii]
+        keep = np.ones(len(other), dtype=bool)
+        for low, high in _PUNCT_RANGES:
+            keep &= (other < low) | (other > high)
+        valid[non_ascii] = keep
+    codes = codes32.astype(np.uint64)
+
+    docs, keys = [], []
+    if 2 in sizes and len(codes) >= 2:
+        ok = valid[:-1] & valid[1:]
+        docs.append(doc_of[:-1][ok])
+        keys.append((codes[:-1][ok] << _CODEPOINT_BITS) | codes[1:][ok])
+    if 3 in sizes and len(codes) >= 3:
+        ok = valid[:-2] & valid[1:-1] & valid[2:]
+        # 首字符非 0，三元键一定大于任何二元键，两者不会冲突
+        docs.append(doc_of[:-2][ok])
+        keys.append(
+            (codes[:-2][ok] << (_CODEPOINT_BITS * np.uint64(2)))
+            | (codes[1:-1][ok] << _CODEPOINT_BITS)
+            | codes[2:][ok]
+        )
+    if not keys:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint64)
+    return np.concatenate(docs).astype(np.int64), np.concatenate(keys)
+
+
+def hash_ngram_keys(keys: np.ndarray) -> np.ndarray:
+    """把 n-gram 键乘法哈希到 2^FEATURE_BITS 个特征桶"""
+    return ((keys * _HASH_MULTIPLIER) >> np.uint64(64 - FEATURE_BITS)).astype(np.int64)
+
+
+class TopicShiftDetector:
+    """
+    话题转移检测器
+
+    用法:
+        detector = TopicShiftDetector()
+        for item in detector.detect(conversation_turns):
+            item['topic_shift'], item['builds_on_previous'], item['similarity']
+    """
+
+    MODES = ('fill', 'cross_check')
+
+    def __init__(
+        self,
+        window: int = 2,
+        shift_threshold: float = 0.05,
+        builds_threshold: float = 0.15,
+        max_chars: int = 400
+    ):
+        """
+        Args:
+            window: 与之前多少个回合比较（与 LLM 提示词的"前两轮"一致）
+            shift_threshold: 与窗口内所有回合的最大相似度低于该值视为话题转移
+            builds_threshold: 最大相似度达到该值视为基于前文
+            max_chars: 每段文本参与计算的最大字符数（避免大段代码主导向量）
+        """
+        self.window = max(1, window)
+        self.shift_threshold = shift_threshold
+        self.builds_threshold = builds_threshold
+        self.max_chars = max_chars
+
+    def vectorize(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        一次性构建所有文本的 L2 归一化 TF-IDF 向量
+
+        Returns:
+            (rows, cols, values)：按 (行, 列) 排序的稀疏矩阵坐标，cols 为特征桶下标
+        """
+        docs, keys = char_ngram_keys(texts, self.max_chars)
+        if len(keys) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.float32)
+
+        vocab_size = 1 << FEATURE_BITS
+        term_ids = hash_ngram_keys(keys)
+        pair_keys, tf = np.unique(docs * vocab_size + term_ids, return_counts=True)
+        rows = pair_keys >> FEATURE_BITS
+        cols = pair_keys & (vocab_size - 1)
+
+        df = np.bincount(cols, minlength=vocab_size)
+        idf = np.log((1 + len(texts)) / (1 + df)) + 1.0
+        values = (1.0 + np.log(tf)) * idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=len(texts)))
+        values = (values / norms[rows]).astype(np.float32)
+        return rows, cols, values
+
+    def similarities(self, conversation_turns: List[Dict[str, str]]) -> np.ndarray:
+        """
+        计算每个问题与之前 window 个回合的余弦相似度
+
+        Returns:
+            形状为 (回合数, window) 的数组，第 k 列为与前第 k+1 个回合的相似度；
+            不存在的前序回合为 NaN
+        """
+        n = len(conversation_turns)
+        sims = np.full((n, self.window), np.nan, dtype=np.float32)
+        if n == 0:
+            return sims
+
+        # 前 n 行是问题，后 n 行是回合上下文（问题 + 回答）
+        texts = [t.get('question', '') for t in conversation_turns]
+        texts += [f"{t.get('question', '')} {t.get('answer', '')}" for t in conversation_turns]
+        rows, cols, values = self.vectorize(texts)
+        vocab_size = 1 << FEATURE_BITS
+
+        is_question = rows < n
+        q_rows, q_cols, q_values = rows[is_question], cols[is_question], values[is_question]
+        c_mask = ~is_question
+        # 上下文矩阵的有序键：(回合下标, 词表下标)
+        c_keys = (rows[c_mask] - n) * vocab_size + cols[c_mask]
+        c_values = values[c_mask]
+
+        for k in range(1, self.window + 1):
+            sims[k:, k - 1] = 0.0
+            has_prev = q_rows >= k
+            if not has_prev.any() or len(c_keys) == 0:
+                continue
+            lookup = (q_rows[has_prev] - k) * vocab_size + q_cols[has_prev]
+            pos = np.searchsorted(c_keys, lookup)
+            pos_clipped = np.minimum(pos, len(c_keys) - 1)
+            found = c_keys[pos_clipped] == lookup
+            products = q_values[has_prev][found] * c_values[pos_clipped[found]]
+            dots = np.bincount(q_rows[has_prev][found], weights=products, minlength=n)
+            sims[k:, k - 1] = dots[k:]
+        return sims
+
+    def detect(self, conversation_turns: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """
+        检测每个回合的话题转移与承接关系
+
+        Returns:
+            每个回合一个字典: {'turn_index', 'similarity', 'topic_shift', 'builds_on_previous'}
+        """
+        sims = self.similarities(conversation_turns)
+        best_sims = np.where(np.isnan(sims), 0.0, sims).max(axis=1) if len(sims) else sims
+        results = []
+        for idx, turn in enumerate(conversation_turns):
+            if idx == 0:
+                results.append({
+                    'turn_index': 1,
+                    'similarity': None,
+                    'topic_shift': False,
+                    'builds_on_previous': False
+                })
+                continue
+            best = float(best_sims[idx])
+            question = turn.get('question', '')
+            followup = bool(FOLLOWUP_CUES.search(question))
+            results.append({
+                'turn_index': idx + 1,
+                'similarity': round(best, 4),
+                # 空问题没有可比较的内容，不判为话题转移
+                'topic_shift': best < self.shift_threshold and not followup and bool(question.strip()),
+                'builds_on_previous': best >= self.builds_threshold or followup
+            })
+        return results
+
+    def apply(
+        self,
+        conversation_turns: List[Dict[str, str]],
+        turn_results: List[Dict[str, Any]],
+        mode: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        把检测结果应用到流程分析的逐轮结果上（原地修改）
+
+        本地分类器判定的回合（source == 'local'）没有 LLM 判断，任何模式下都直接填入检测结果。
+
+        Args:
+            mode: None 只填充本地判定的回合；
+                'fill' 用词汇检测结果覆盖所有回合的 topic_shift / builds_on_previous；
+                'cross_check' 保留 LLM 判断，附加 lexical_* 字段并统计一致率
+
+        Returns:
+            cross_check 模式下返回一致性统计，否则返回 None
+        """
+        if mode is not None and mode not in self.MODES:
+            raise ValueError(f"未知的话题转移检测模式: {mode}")
+
+        detections = self.detect(conversation_turns)
+        checked, agreed, disagreements = 0, 0, []
+        for result, detection in zip(turn_results, detections):
+            if mode == 'fill' or result.get('source') == 'local':
+                result['topic_shift'] = detection['topic_shift']
+                result['builds_on_previous'] = detection['builds_on_previous']
+                result['lexical_similarity'] = detection['similarity']
+            elif mode == 'cross_check':
+                result['lexical_similarity'] = detection['similarity']
+                result['lexical_topic_shift'] = detection['topic_shift']
+                result['lexical_builds_on_previous'] = detection['builds_on_previous']
+                checked += 1
+                if bool(result.get('topic_shift')) == detection['topic_shift']:
+                    agreed += 1
+                else:
+                    disagreements.append(result['turn_index'])
+
+        if mode != 'cross_check':
+            return None
+        return {
+            'checked_turns': checked,
+            'topic_shift_agreement': agreed / checked if checked else 0.0,
+            'disagreements': disagreements
+        }
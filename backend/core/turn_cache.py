@@ -0,0 +1,152 @@
+"""
+回合分类结果缓存 - 增量流程分析
+
+用户继续对话并重新上传后，之前的回合没有变化，不必重新调用 LLM。
+缓存键为 (当前问题, 前两轮原文, 提示词版本, 模型, 提示词预算, 分析模式) 的哈希，
+因此只有新增回合（或上下文变化的回合）才需要重新分析；预算或模式不同时 LLM 看到的提示词不同，不共用结果。
+
+缓存保存在内存（LRU），可选地追加写入 JSON Lines 文件以便跨进程/重启复用。
+文件只追加，被淘汰后重新写入的键会重复出现；行数超过 max_entries（加载时）或
+2 倍 max_entries（运行中）时用内存中的条目重写文件，文件大小与启动加载时间保持有界。
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+class TurnResultCache:
+    """
+    回合分析结果缓存
+
+    用法:
+        cache = TurnResultCache(cache_dir='cache')
+        key = cache.make_key(question, previous_turns, prompt_version, model_name)
+        result = cache.get(key)
+        if result is None:
+            result = ...  # 调用 LLM
+            cache.set(key, result)
+    """
+
+    CACHE_FILE = "turn_results.jsonl"
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_entries: int = 100000,
+        file_name: Optional[str] = None
+    ):
+        """
+        Args:
+            cache_dir: 持久化目录，None 则只缓存在内存中
+            max_entries: 内存中最多保留的条目数（超出后淘汰最久未使用的条目）
+            file_name: 持久化文件名（默认 CACHE_FILE），不同用途的缓存可共用同一目录
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._file: Optional[Path] = None
+        # 持久化文件当前的行数（含重复键），用于判断何时重写
+        self._file_lines = 0
+
+        if cache_dir:
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+            self._file = Path(cache_dir) / (file_name or self.CACHE_FILE)
+            self._load()
+
+    @staticmethod
+    def make_key(
+        question: str,
+        previous_turns: List[Dict[str, str]],
+        prompt_version: str,
+        model_name: str,
+        prompt_budget: Optional[int] = None,
+        mode: Optional[str] = None
+    ) -> str:
+        """
+        由当前问题、前两轮原文、提示词版本、模型、提示词预算和分析模式（如 single / batch）计算缓存键
+        """
+        payload = json.dumps(
+            {
+                'question': question,
+                'context': [[t.get('question', ''), t.get('answer', '')] for t in previous_turns[-2:]],
+                'prompt_version': prompt_version,
+                'model': model_name,
+                'prompt_budget': prompt_budget,
+                'mode': mode,
+            },
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存，未命中返回 None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(value)
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """写入缓存（持久化时同时追加到文件）"""
+        with self._lock:
+            is_new = key not in self._entries
+            self._entries[key] = dict(value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self._file is not None and is_new:
+                with open(self._file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'key': key, 'value': value}, ensure_ascii=False) + '\n')
+                self._file_lines += 1
+                if self._file_lines > 2 * self.max_entries:
+                    self._compact()
+
+    def _load(self):
+        if not self._file.exists():
+            return
+        with open(self._file, 'r', encoding='utf-8') as f:
+            for line in f:
+                self._file_lines += 1
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程中断时可能写入了不完整的最后一行
+                    continue
+                self._entries[record['key']] = record['value']
+                self._entries.move_to_end(record['key'])
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if self._file_lines > self.max_entries:
+            self._compact()
+
+    def _compact(self):
+        """用内存中的条目（按最近使用顺序）重写持久化文件，去掉重复与已淘汰的键"""
+        tmp = self._file.with_name(self._file.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for key, value in self._entries.items():
+                f.write(json.dumps({'key': key, 'value': value}, ensure_ascii=False) + '\n')
+        os.replace(tmp, self._file)
+        self._file_lines = len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
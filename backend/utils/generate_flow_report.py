@@ -2,10 +2,15 @@
 对话流程可视化工具 - 生成对话分析的可视化报告
 """
 import json
+import sys
 from pathlib import Path
 from typing import Dict, Any
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.tracing import span, traced
 
+
+@traced('report.generate_html')
 def generate_html_report(analysis_file: str, output_file: str = 'evaluation_results/flow_report.html'):
     """
     生成对话流程分析的 HTML 可视化报告
@@ -14,7 +19,7 @@ def generate_html_report(analysis_file: str, output_file: str = 'evaluation_resu
         analysis_file: 分析结果 JSON 文件路径
         output_file: 输出的 HTML 文件路径
     """
-    with open(analysis_file, 'r', encoding='utf-8') as f:
+    with span('report.load'), open(analysis_file, 'r', encoding='utf-8') as f:
         data = json.load(f)
     
     summary = data['flow_summary']
@@ -461,7 +466,7 @@ def generate_html_report(analysis_file: str, output_file: str = 'evaluation_resu
 """
     
     # 保存 HTML
-    with open(output_file, 'w', encoding='utf-8') as f:
+    with span('report.write', bytes=len(html)), open(output_file, 'w', encoding='utf-8') as f:
         f.write(html)
     
     print(f"✅ HTML 报告已生成: {output_file}")
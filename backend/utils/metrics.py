@@ -0,0 +1,264 @@
+"""
+Prometheus 指标 - 为 /metrics 端点提供 API 与分析流水线的运行指标
+
+不依赖 prometheus_client：热路径上只有一次加锁和一次二分查找（直方图定位桶），
+抓取时再生成 Prometheus 文本格式（0.0.4）。
+
+两类指标：
+- Counter / Histogram：在代码中直接记录（请求延迟、LLM 调用延迟、token 数、重试、JSON 解析失败、数据加载耗时）
+- CallbackMetric：抓取时调用回调读取已有的统计（缓存命中、队列深度、对象池大小）
+
+用法:
+    from utils.metrics import LLM_CALL_SECONDS
+    LLM_CALL_SECONDS.observe(elapsed, model, 'ok')
+
+    REGISTRY.callback('job_queue_depth', '排队任务数', 'gauge', lambda: {(): depth()})
+    text = REGISTRY.render()
+"""
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 延迟类直方图的默认桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不减的计数器"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        with self._lock:
+            return self._values.get(labelvalues, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        lines += [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}' for labels, v in items]
+        return lines
+
+
+class Histogram:
+    """直方图：按桶计数，另记总和与次数"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各桶计数（非累计，最后一个为 +Inf）, 总和]
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def count(self, *labelvalues: str) -> int:
+        with self._lock:
+            series = self._series.get(labelvalues)
+            return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, (list(counts), total[0])) for labels, (counts, total) in self._series.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, ('le', _format_value(float(bound))))
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(total)}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+class CallbackMetric:
+    """抓取时通过回调取值的指标（gauge 或 counter），回调返回 {标签值元组: 数值}"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        metric_type: str,
+        callback: Callable[[], Dict[LabelValues, float]],
+        labelnames: Sequence[str] = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        try:
+            items = sorted(self.callback().items())
+        except Exception as e:
+            print(f"指标 {self.name} 读取失败: {e}")
+            items = []
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        lines += [
+            f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}'
+            for labels, v in items if v is not None
+        ]
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """注册指标（同名指标以最后一次注册为准，便于回调指标在应用重新加载时替换）"""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        metric_type: str,
+        callback: Callable[[], Dict[LabelValues, float]],
+        labelnames: Sequence[str] = ()
+    ) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, metric_type, callback, labelnames))
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI 中间件：按路由模板（如 /api/jobs/{job_id}）记录请求耗时与状态码
+
+    纯 ASGI 实现，不缓冲响应体，SSE 等流式响应按整个流的持续时间记录。
+    未匹配任何路由的请求记为 unmatched，避免任意路径撑大标签集合。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # 路由匹配后 Starlette 会把 route 写入同一个 scope
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, scope['method'], route, str(status))
+
+
+REGISTRY = Registry()
+
+# ============ API ============
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP 请求处理耗时（按路由模板）', ('method', 'route', 'status')
+)
+
+# ============ LLM 调用 ============
+
+LLM_CALL_SECONDS = REGISTRY.histogram(
+    'llm_call_duration_seconds', 'LLM API 调用耗时（含重试）', ('model', 'outcome')
+)
+LLM_TOKENS = REGISTRY.histogram(
+    'llm_tokens_per_call', '每次 LLM 调用的 token 数', ('model', 'kind'),
+    buckets=(16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+)
+LLM_RETRIES = REGISTRY.counter('llm_retries_total', 'LLM API 调用的 HTTP 重试次数', ('model',))
+LLM_JSON_PARSE_FAILURES = REGISTRY.counter(
+    'llm_json_parse_failures_total', 'LLM 响应 JSON 解析失败次数', ('component',)
+)
+
+# ============ 对象池 ============
+
+POOL_CHECKOUT_SECONDS = REGISTRY.histogram(
+    'pool_checkout_duration_seconds', '从对象池取出对象的耗时（含新建对象）', ('pool',)
+)
+
+# ============ 数据加载 ============
+
+DATA_LOAD_SECONDS_PER_MB = REGISTRY.histogram(
+    'data_load_seconds_per_mb', 'ChatDataLoader 每 MB conversations.json 的解析耗时',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+DATA_LOAD_BYTES = REGISTRY.counter('data_load_bytes_total', 'ChatDataLoader 解析的字节数')
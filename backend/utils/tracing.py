@@ -0,0 +1,170 @@
+"""
+轻量级阶段追踪 - 定位分析慢在解析、提示词构建、LLM 等待还是汇总/报告生成
+
+默认关闭：没有激活的 Trace 时 span() 只读取一次 ContextVar，不记录任何数据。
+API 收到调试请求头时为该请求创建 Trace 并激活，之后同一上下文中（包括 asyncio 任务、
+asyncio.to_thread 以及通过 contextvars.copy_context() 提交到线程池的函数）的 span 都记录到该 Trace。
+
+Trace 可以汇总为按阶段名聚合的耗时（随响应返回），也可以导出为 Chrome Trace Event
+格式的 JSON 文件，用 chrome://tracing、Perfetto 或 speedscope 以火焰图方式查看。
+
+用法:
+    trace = Trace('analyze-flow')
+    with activate(trace):
+        with span('flow.prepare', turns=len(turns)):
+            ...
+    trace.summary()                 # {'total_ms': ..., 'stages': {...}}
+    trace.export('traces')          # traces/<trace_id>.json
+"""
+import functools
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+_current: ContextVar[Optional["Trace"]] = ContextVar('current_trace', default=None)
+
+
+class Trace:
+    """一次请求的追踪记录（线程安全）"""
+
+    # 单个 Trace 最多记录的 span 数，超出后只计数不保存（防止大语料撑爆内存）
+    MAX_SPANS = 50000
+
+    def __init__(self, name: str, export_dir: Optional[str] = None):
+        """
+        Args:
+            name: 追踪名称（如端点名）
+            export_dir: 设置后由调用方在结束时导出到该目录
+        """
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.export_dir = export_dir
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.dropped = 0
+        self._spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, end: float, attrs: Optional[Dict[str, Any]] = None):
+        """记录一个 span（start/end 为 time.perf_counter() 时间）"""
+        record = {
+            'name': name,
+            'start': start,
+            'end': end,
+            'thread': threading.get_ident(),
+            'attrs': attrs or {},
+        }
+        with self._lock:
+            if len(self._spans) >= self.MAX_SPANS:
+                self.dropped += 1
+                return
+            self._spans.append(record)
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.perf_counter()
+
+    def summary(self) -> Dict[str, Any]:
+        """按阶段名聚合：次数、累计耗时与最长耗时（毫秒，并发阶段的累计耗时可能超过总耗时）"""
+        end = self.finished or time.perf_counter()
+        with self._lock:
+            spans = list(self._spans)
+        stages: Dict[str, Dict[str, float]] = {}
+        for record in spans:
+            duration = (record['end'] - record['start']) * 1000
+            stage = stages.setdefault(record['name'], {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stage['count'] += 1
+            stage['total_ms'] += duration
+            stage['max_ms'] = max(stage['max_ms'], duration)
+        for stage in stages.values():
+            stage['total_ms'] = round(stage['total_ms'], 3)
+            stage['max_ms'] = round(stage['max_ms'], 3)
+        return {
+            'trace_id': self.id,
+            'name': self.name,
+            'total_ms': round((end - self.started) * 1000, 3),
+            'stages': dict(sorted(stages.items(), key=lambda item: -item[1]['total_ms'])),
+            'spans': len(spans),
+            'dropped_spans': self.dropped,
+        }
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Chrome Trace Event 格式（完整事件 ph=X，时间单位为微秒）"""
+        with self._lock:
+            spans = list(self._spans)
+        threads = {ident: index for index, ident in enumerate(dict.fromkeys(r['thread'] for r in spans))}
+        events = [
+            {
+                'name': record['name'],
+                'ph': 'X',
+                'ts': round((record['start'] - self.started) * 1e6, 3),
+                'dur': round((record['end'] - record['start']) * 1e6, 3),
+                'pid': 1,
+                'tid': threads[record['thread']],
+                'args': {key: _jsonable(value) for key, value in record['attrs'].items()},
+            }
+            for record in spans
+        ]
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': self.name}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'trace_id': self.id}}
+
+    def export(self, directory: str) -> str:
+        """导出为 <directory>/<trace_id>.json，返回文件路径"""
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        target = path / f"{self.id}.json"
+        with open(target, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+        return str(target)
+
+
+def _jsonable(value: Any) -> Any:
+    return value if isinstance(value, (str, int, float, bool)) or value is None else str(value)
+
+
+def current_trace() -> Optional[Trace]:
+    """当前上下文中激活的 Trace，未启用追踪时为 None"""
+    return _current.get()
+
+
+@contextmanager
+def activate(trace: Optional[Trace]) -> Iterator[Optional[Trace]]:
+    """在当前上下文中激活 Trace（trace 为 None 时不做任何事）"""
+    if trace is None:
+        yield None
+        return
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[None]:
+    """记录一个阶段的耗时；未启用追踪时为空操作"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter(), attrs)
+
+
+def traced(name: str) -> Callable:
+    """装饰器：把整个函数调用记录为一个 span"""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
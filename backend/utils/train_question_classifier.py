@@ -0,0 +1,187 @@
+"""
+训练并导出本地问题分类器
+
+训练数据来自 LLM 标注过的回合：
+- 流程分析结果文件（ConversationFlowAnalyzer.save_analysis 的输出，含 turn_analysis）
+- JSON Lines 文件，每行 {"question": ..., "question_type": ..., "value_level": ...}
+
+流程分析结果中的问题超过 100 字符时被截断，而推理时使用完整问题（特征包含问题长度和前 300 个字符），
+因此需要用 --conversations 指定原始导出，按截断后的文本找回完整问题；找不到的截断样本不参与训练。
+
+用法:
+    python -m utils.train_question_classifier evaluation_results/*.json \
+        --conversations data/export1 data/export2 --output models/question_classifier.npz
+"""
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from core.conversation_flow_analyzer import QUESTION_PREVIEW_CHARS, _question_preview
+from core.data_loader import ChatDataLoader
+from core.local_classifier import QUESTION_TYPES, VALUE_LEVELS, HashedNgramFeaturizer, LocalQuestionClassifier
+
+
+def _is_llm_label(item: Dict) -> bool:
+    """只使用有效的 LLM 标注（排除本地分类器结果和分析失败的默认值）"""
+    return (
+        bool(item.get('question'))
+        and item.get('question_type') in QUESTION_TYPES
+        and item.get('value_level') in VALUE_LEVELS
+        and item.get('source', 'llm') in ('llm', 'cache')
+    )
+
+
+def _is_truncated(question: str) -> bool:
+    return len(question) == QUESTION_PREVIEW_CHARS + 3 and question.endswith('...')
+
+
+def load_full_questions(data_folders: List[str]) -> Dict[str, str]:
+    """
+    从原始导出中读取完整问题，返回 {截断后的问题: 完整问题}
+
+    多个不同问题截断后相同时无法确定对应关系，不收录
+    """
+    full: Dict[str, Optional[str]] = {}
+    for folder in data_folders:
+        loader = ChatDataLoader(folder)
+        for conversation in loader.load_conversations():
+            for turn in loader.get_conversation_turns(conversation):
+                question = turn.get('question', '')
+                if len(question) <= QUESTION_PREVIEW_CHARS:
+                    continue
+                preview = _question_preview(question)
+                full[preview] = question if full.get(preview, question) == question else None
+    return {preview: question for preview, question in full.items() if question is not None}
+
+
+def load_labelled_turns(
+    paths: List[str],
+    full_questions: Optional[Dict[str, str]] = None
+) -> List[Dict[str, str]]:
+    """
+    读取标注样本，按问题文本去重
+
+    Args:
+        paths: 流程分析结果 .json 或标注 .jsonl 文件
+        full_questions: load_full_questions 的结果，用于还原被截断的问题
+    """
+    full_questions = full_questions or {}
+    samples: Dict[str, Dict[str, str]] = {}
+    unresolved = 0
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.endswith('.jsonl'):
+                items = [json.loads(line) for line in f if line.strip()]
+            else:
+                data = json.load(f)
+                # 兼容 /api/analyze-flow 响应中的 _raw 结构
+                if 'data' in data:
+                    data = data['data'].get('_raw', {})
+                items = data.get('turn_analysis', [])
+        for item in items:
+            if not _is_llm_label(item):
+                continue
+            question = item['question']
+            if _is_truncated(question):
+                # 截断的问题与推理时的输入不一致，只使用能还原为完整问题的样本
+                question = full_questions.get(question)
+                if question is None:
+                    unresolved += 1
+                    continue
+            samples[question] = {
+                'question': question,
+                'question_type': item['question_type'],
+                'value_level': item['value_level'],
+            }
+    if unresolved:
+        print(f"跳过 {unresolved} 个无法还原完整问题的截断样本（使用 --conversations 指定原始导出）")
+    return list(samples.values())
+
+
+def evaluate(
+    classifier: LocalQuestionClassifier,
+    samples: List[Dict[str, str]]
+) -> Dict[str, float]:
+    """在留出集上统计准确率与置信度阈值下的覆盖率"""
+    start = time.perf_counter()
+    predictions = classifier.predict_batch([s['question'] for s in samples])
+    elapsed = time.perf_counter() - start
+
+    type_correct = sum(p.question_type == s['question_type'] for p, s in zip(predictions, samples))
+    value_correct = sum(p.value_level == s['value_level'] for p, s in zip(predictions, samples))
+    confident = [(p, s) for p, s in zip(predictions, samples) if p.confidence >= classifier.threshold]
+    confident_correct = sum(
+        p.question_type == s['question_type'] and p.value_level == s['value_level']
+        for p, s in confident
+    )
+    n = len(samples)
+    return {
+        'samples': n,
+        'type_accuracy': type_correct / n if n else 0.0,
+        'value_accuracy': value_correct / n if n else 0.0,
+        'coverage': len(confident) / n if n else 0.0,
+        'confident_accuracy': confident_correct / len(confident) if confident else 0.0,
+        'questions_per_second': n / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def split(samples: List[Dict[str, str]], holdout: float, seed: int) -> Tuple[List, List]:
+    samples = list(samples)
+    random.Random(seed).shuffle(samples)
+    n_test = int(len(samples) * holdout)
+    return samples[n_test:], samples[:n_test]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="训练本地问题分类器")
+    parser.add_argument('inputs', nargs='+', help="流程分析结果 .json 或标注 .jsonl 文件")
+    parser.add_argument('--conversations', nargs='*', default=[],
+                        help="分析所用的原始导出文件夹（含 conversations.json），用于还原被截断的问题")
+    parser.add_argument('--output', default='models/question_classifier.npz', help="导出的模型文件")
+    parser.add_argument('--threshold', type=float, default=0.8, help="置信度阈值")
+    parser.add_argument('--holdout', type=float, default=0.2, help="留出评估的样本比例")
+    parser.add_argument('--epochs', type=int, default=15)
+    parser.add_argument('--features', type=int, default=18, help="哈希空间维度 (2 的幂次)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    samples = load_labelled_turns(args.inputs, load_full_questions(args.conversations))
+    if not samples:
+        parser.error("没有找到有效的 LLM 标注样本")
+    train, test = split(samples, args.holdout, args.seed)
+    print(f"样本数: {len(samples)} (训练 {len(train)}, 留出 {len(test)})")
+
+    classifier = LocalQuestionClassifier(
+        HashedNgramFeaturizer(n_features=1 << args.features),
+        threshold=args.threshold
+    )
+    start = time.perf_counter()
+    classifier.fit(
+        [s['question'] for s in train],
+        [s['question_type'] for s in train],
+        [s['value_level'] for s in train],
+        epochs=args.epochs,
+        seed=args.seed
+    )
+    print(f"训练耗时: {time.perf_counter() - start:.2f}s")
+
+    if test:
+        report = evaluate(classifier, test)
+        print(f"question_type 准确率: {report['type_accuracy']:.1%}")
+        print(f"value_level 准确率: {report['value_accuracy']:.1%}")
+        print(f"阈值 {args.threshold} 下本地覆盖率: {report['coverage']:.1%}, "
+              f"覆盖部分准确率: {report['confident_accuracy']:.1%}")
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    classifier.save(str(output))
+    print(f"模型已导出: {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+本地问题分类器基准测试 - 准确率、本地覆盖率与吞吐量
+
+用法:
+    python tests/bench_local_classifier.py                                   # 使用内置合成语料
+    python tests/bench_local_classifier.py evaluation_results/*.json         # 使用 LLM 标注过的流程分析结果
+    python tests/bench_local_classifier.py labels.jsonl --threshold 0.7
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+from core.local_classifier import LocalQuestionClassifier
+from utils.train_question_classifier import evaluate, load_labelled_turns, split
+
+# 每种问题类型的模板，{x} 替换为随机主题
+TEMPLATES = {
+    'technical': [
+        ("如何在 {x} 里实现分页查询？报错 TypeError 怎么解决", 'high'),
+        ("How do I install {x} on Ubuntu? pip install fails with an error", 'high'),
+        ("{x} 的这段代码运行报错，怎么修复", 'medium'),
+        ("How to configure {x} for production deployment?", 'high'),
+    ],
+    'clarifying': [
+        ("你说的 {x} 是什么意思？能举个例子吗", 'medium'),
+        ("What do you mean by {x}? Can you explain it again?", 'medium'),
+        ("能再解释一下 {x} 吗，我没看懂", 'medium'),
+    ],
+    'deepening': [
+        ("那 {x} 在大规模场景下的性能瓶颈在哪里？有没有更优的方案", 'high'),
+        ("Why does {x} behave this way internally, and what are the trade-offs?", 'high'),
+        ("如果把 {x} 和缓存结合起来，架构上要注意什么", 'high'),
+    ],
+    'emotional': [
+        ("学 {x} 好难，我感觉自己好焦虑，怎么办", 'medium'),
+        ("I feel so stressed about learning {x}, I want to give up", 'medium'),
+        ("最近压力很大，{x} 总是学不会，很沮丧", 'medium'),
+    ],
+    'off-topic': [
+        ("哈哈", 'low'),
+        ("ok thanks", 'low'),
+        ("你好", 'low'),
+        ("今天天气怎么样", 'low'),
+        ("lol {x}", 'low'),
+    ],
+}
+TOPICS = ["pandas", "React", "Docker", "线性代数", "Kubernetes", "SQL", "递归", "FastAPI", "机器学习", "Redis"]
+
+
+def synthetic_corpus(n: int, seed: int = 0, label_noise: float = 0.1):
+    """生成带标签的合成问题（label_noise 比例的样本使用随机标签，模拟 LLM 标注的不一致）"""
+    rng = random.Random(seed)
+    samples = []
+    for i in range(n):
+        question_type = rng.choice(list(TEMPLATES))
+        template, value_level = rng.choice(TEMPLATES[question_type])
+        if rng.random() < label_noise:
+            question_type = rng.choice(list(TEMPLATES))
+            value_level = rng.choice(['high', 'medium', 'low'])
+        samples.append({
+            'question': template.format(x=rng.choice(TOPICS)) + ("" if i % 3 else f" #{i}"),
+            'question_type': question_type,
+            'value_level': value_level,
+        })
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地问题分类器基准测试")
+    parser.add_argument('inputs', nargs='*', help="流程分析结果 .json 或标注 .jsonl 文件")
+    parser.add_argument('--threshold', type=float, default=0.8)
+    parser.add_argument('--samples', type=int, default=2000, help="合成语料大小")
+    parser.add_argument('--label-noise', type=float, default=0.1, help="合成语料的标签噪声比例")
+    args = parser.parse_args()
+
+    samples = load_labelled_turns(args.inputs) if args.inputs else synthetic_corpus(args.samples, label_noise=args.label_noise)
+    train, test = split(samples, 0.2, seed=0)
+    print(f"样本数: {len(samples)} (训练 {len(train)}, 留出 {len(test)})")
+
+    classifier = LocalQuestionClassifier(threshold=args.threshold)
+    start = time.perf_counter()
+    classifier.fit(
+        [s['question'] for s in train],
+        [s['question_type'] for s in train],
+        [s['value_level'] for s in train]
+    )
+    print(f"训练耗时: {time.perf_counter() - start:.2f}s")
+
+    report = evaluate(classifier, test)
+    print(f"question_type 准确率: {report['type_accuracy']:.1%}")
+    print(f"value_level 准确率: {report['value_accuracy']:.1%}")
+    print(f"阈值 {args.threshold}: 本地覆盖率 {report['coverage']:.1%}, "
+          f"覆盖部分准确率 {report['confident_accuracy']:.1%}")
+    print(f"预测吞吐量: {report['questions_per_second']:,.0f} 个问题/秒")
+    print(f"节省 LLM 调用: {report['coverage']:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+话题转移检测基准测试 - 处理速度与合成语料上的准确率
+
+用法:
+    python tests/bench_topic_shift.py                   # 1 万回合的合成对话
+    python tests/bench_topic_shift.py --turns 50000
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+from core.topic_shift import TopicShiftDetector
+
+# 每个话题的词汇，话题内的回合共享这些词
+TOPICS = [
+    ["pandas", "数据框", "groupby", "聚合", "read_csv", "列名", "缺失值"],
+    ["React", "组件", "useState", "渲染", "props", "状态管理", "hooks"],
+    ["Docker", "镜像", "容器", "Dockerfile", "端口映射", "docker-compose", "挂载卷"],
+    ["线性代数", "矩阵", "特征值", "向量空间", "行列式", "正交", "秩"],
+    ["考研", "复习计划", "英语阅读", "政治", "真题", "时间安排", "模拟考试"],
+    ["Kubernetes", "Pod", "Deployment", "Service", "kubectl", "节点", "副本数"],
+    ["健身", "深蹲", "蛋白质", "训练计划", "卧推", "热身", "休息日"],
+    ["SQL", "索引", "JOIN", "慢查询", "执行计划", "事务", "分页"],
+]
+FILLER = ["请问", "怎么", "如何", "可以", "一下", "的", "是", "在", "里面", "有没有"]
+
+
+def synthetic_conversation(n_turns: int, mean_block: int = 8, seed: int = 0):
+    """生成由若干话题块组成的对话，返回 (回合列表, 真实的话题转移标记)"""
+    rng = random.Random(seed)
+    turns, shifts = [], []
+    topic = rng.randrange(len(TOPICS))
+    remaining = rng.randint(2, mean_block * 2)
+    for idx in range(n_turns):
+        shifted = False
+        if remaining == 0 and idx > 0:
+            topic = rng.choice([t for t in range(len(TOPICS)) if t != topic])
+            remaining = rng.randint(2, mean_block * 2)
+            shifted = True
+        remaining -= 1
+        words = TOPICS[topic]
+        question = "".join(rng.sample(FILLER, 2)) + " ".join(rng.sample(words, 2)) + "？"
+        answer = "，".join(rng.choice(words) + rng.choice(FILLER) for _ in range(30))
+        turns.append({'question': question, 'answer': answer})
+        shifts.append(shifted)
+    return turns, shifts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="话题转移检测基准测试")
+    parser.add_argument('--turns', type=int, default=10000)
+    args = parser.parse_args()
+
+    turns, truth = synthetic_conversation(args.turns)
+    detector = TopicShiftDetector()
+    detector.detect(turns[:100])  # 预热
+
+    start = time.perf_counter()
+    detections = detector.detect(turns)
+    elapsed = time.perf_counter() - start
+
+    predicted = [d['topic_shift'] for d in detections]
+    tp = sum(p and t for p, t in zip(predicted, truth))
+    precision = tp / sum(predicted) if any(predicted) else 0.0
+    recall = tp / sum(truth) if any(truth) else 0.0
+
+    print(f"回合数: {len(turns)}, 真实话题转移: {sum(truth)}")
+    print(f"耗时: {elapsed * 1000:.0f} ms ({len(turns) / elapsed:,.0f} 回合/秒)")
+    print(f"话题转移 precision: {precision:.1%}, recall: {recall:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+批量分析接口测试（只使用不需要 API Key 的启发式布鲁姆分析）
+
+用法:
+    python -m pytest tests/test_api_batch.py
+"""
+import importlib
+import json
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+
+def make_conversation(conv_id: str, questions):
+    """构造 ChatGPT 导出格式的单个对话，每个问题后跟一条回答"""
+    mapping = {}
+    parent = None
+    for i, question in enumerate(questions):
+        for role, text in (("user", question), ("assistant", f"回答 {i}")):
+            node_id = f"{conv_id}-{len(mapping)}"
+            mapping[node_id] = {
+                "id": node_id,
+                "parent": parent,
+                "children": [],
+                "message": {
+                    "id": node_id,
+                    "author": {"role": role},
+                    "content": {"parts": [text]},
+                    "create_time": 1735689600 + len(mapping) * 60,
+                },
+            }
+            if parent is not None:
+                mapping[parent]["children"].append(node_id)
+            parent = node_id
+    return {"id": conv_id, "title": f"对话 {conv_id}", "create_time": 1735689600, "mapping": mapping}
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("api")
+    patch = pytest.MonkeyPatch()
+    patch.setenv("DATASET_DIR", str(tmp / "datasets"))
+    patch.setenv("FLOW_TURN_CACHE_DIR", str(tmp / "cache"))
+    for name in ("CHATAIAPI_KEY", "CHATAI_API_KEY", "API_KEY_OVERRIDE"):
+        patch.delenv(name, raising=False)
+    main = importlib.import_module("api.main")
+    with TestClient(main.app) as test_client:
+        yield test_client
+    patch.undo()
+
+
+def test_batch_bloom_heuristic_without_api_key(client):
+    exports = [
+        [make_conversation("a0", ["什么是快速排序", "请分析它的时间复杂度", "设计一个更快的方案"])],
+        [make_conversation("b0", ["如何使用 git rebase", "比较 rebase 和 merge 的优缺点"])],
+    ]
+    files = [
+        ("files", (f"export{i}.json", json.dumps(data, ensure_ascii=False).encode("utf-8"), "application/json"))
+        for i, data in enumerate(exports)
+    ]
+    response = client.post("/api/analyze-batch", params={"analyses": "bloom", "bloom_method": "heuristic"}, files=files)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["message"] == "成功分析 2/2 个导出"
+    data = body["data"]
+    assert all(not export["errors"] for export in data["exports"])
+    assert [export["results"]["bloom"]["total_turns"] for export in data["exports"]] == [3, 2]
+    assert data["aggregate"]["bloom"]["total_turns"] == 5
+    assert data["aggregate"]["failed_exports"] == 0
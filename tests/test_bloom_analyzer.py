@@ -0,0 +1,96 @@
+"""
+布鲁姆层级分析器的 LLM 复核测试（使用假模型，不调用真实 API）
+
+用法:
+    python -m pytest tests/test_bloom_analyzer.py
+"""
+import asyncio
+import json
+import re
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+from core.bloom_analyzer import BloomAnalyzer, _inflight
+from core.token_budget import ContextBudget
+from core.turn_cache import TurnResultCache
+
+
+class FakeModel:
+    """把每个问题都分类为 analyze；started 在第一次调用时置位，调用在 release 置位后才返回"""
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def get_model_name(self):
+        return "fake"
+
+    async def a_generate(self, prompt, schema=None):
+        self.calls += 1
+        self.started.set()
+        await asyncio.to_thread(self.release.wait, 5)
+        count = len(re.findall(r"^\[\d+\]$", prompt, flags=re.MULTILINE))
+        return json.dumps([
+            {"index": i, "level": "analyze", "confidence": 0.9, "reason": "fake"} for i in range(1, count + 1)
+        ])
+
+
+CONVERSATIONS = [[
+    {"question": "这个怎么样", "answer": "还行"},
+    {"question": "那另一个呢", "answer": "也行"},
+]]
+
+
+def test_concurrent_request_waits_for_inflight_refinement():
+    model = FakeModel()
+    model.release.clear()
+    cache = TurnResultCache(max_entries=100)
+    results = {}
+
+    def run(name):
+        results[name] = BloomAnalyzer(model, cache=cache).analyze(CONVERSATIONS, method="llm", wait=True)
+
+    first = threading.Thread(target=run, args=("first",))
+    first.start()
+    assert model.started.wait(5)
+    # 第二个请求的问题都在第一个请求的复核中，应等待其结果而不是返回启发式结论
+    second = threading.Thread(target=run, args=("second",))
+    second.start()
+    model.release.set()
+    first.join(5)
+    second.join(5)
+
+    assert model.calls == 1
+    for result in results.values():
+        assert result["refinement"]["status"] == "complete"
+        assert [turn["level"] for turn in result["turns"]] == ["analyze", "analyze"]
+        assert [turn["source"] for turn in result["turns"]] == ["llm", "llm"]
+    assert not _inflight
+
+
+def test_refine_result_refines_only_pending_turns():
+    model = FakeModel()
+    analyzer = BloomAnalyzer(model, cache=TurnResultCache(max_entries=100))
+    partial = analyzer.analyze(CONVERSATIONS, method="llm", wait=False)
+    assert partial["refinement"]["pending"] == 2
+    assert model.calls == 0
+
+    result = analyzer.refine_result(CONVERSATIONS, partial)
+
+    assert model.calls == 1
+    assert result["refinement"]["status"] == "complete"
+    assert result["refinement"]["refined"] == 2
+    assert result["level_counts"]["analyze"] == 2
+
+
+def test_each_item_is_capped_once_per_batch():
+    budget = ContextBudget(2000)
+    analyzer = BloomAnalyzer(FakeModel(), cache=TurnResultCache(max_entries=100), context_budget=budget)
+    analyzer.analyze([[{"question": f"问题 {i}", "answer": ""} for i in range(4)]], method="llm", wait=True)
+
+    # 只有第一个问题没有上一轮问题：4 个问题 + 3 个上一轮问题
+    assert budget.stats()["prompts"] == 7
@@ -0,0 +1,56 @@
+"""
+流程分析器的回合缓存键与提示词预算统计测试（不调用 LLM）
+
+用法:
+    python -m pytest tests/test_conversation_flow.py
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+from core.conversation_flow_analyzer import ConversationFlowAnalyzer
+from core.token_budget import ContextBudget
+from core.turn_cache import TurnResultCache
+
+TURNS = [{'question': f'问题 {i} ' + '细节' * 200, 'answer': '回答' * 300} for i in range(5)]
+
+CACHED = {
+    'question_type': 'technical',
+    'value_level': 'high',
+    'builds_on_previous': True,
+    'topic_shift': False,
+    'reason': 'cached',
+}
+
+
+def fill_cache(cache: TurnResultCache, budget: int, batch_size=None):
+    analyzer = ConversationFlowAnalyzer(None, cache=cache, context_budget=ContextBudget(budget))
+    _, _, state = analyzer._prepare_turns(TURNS, batch_size)
+    for key in state['cache_keys']:
+        cache.set(key, CACHED)
+
+
+def pending_turns(cache: TurnResultCache, budget: int, batch_size=None):
+    analyzer = ConversationFlowAnalyzer(None, cache=cache, context_budget=ContextBudget(budget))
+    return analyzer._prepare_turns(TURNS, batch_size)[1]
+
+
+def test_cache_is_keyed_by_prompt_budget_and_mode():
+    cache = TurnResultCache()
+    fill_cache(cache, budget=400)
+
+    assert pending_turns(cache, budget=400) == []
+    assert pending_turns(cache, budget=1500) == list(range(len(TURNS)))
+    assert pending_turns(cache, budget=400, batch_size=4) == list(range(len(TURNS)))
+
+
+def test_batch_prompt_counts_once_in_budget_stats():
+    budget = ContextBudget(400)
+    analyzer = ConversationFlowAnalyzer(None, context_budget=budget)
+
+    prompt = analyzer._build_batch_prompt(TURNS, 2, 5)
+
+    stats = budget.stats()
+    assert stats['prompts'] == 1
+    assert stats['trimmed_prompts'] == 1
+    assert '问题 1:' in prompt and '回合 5:' in prompt
@@ -0,0 +1,47 @@
+"""
+MinHash 近重复检测测试
+
+用法:
+    python -m pytest tests/test_dedup.py
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+from core.dedup import MinHashDeduplicator
+
+WORDS = [f"w{i:03d}" for i in range(400)]
+
+
+def window(start: int, size: int = 100) -> str:
+    return " ".join(WORDS[start:start + size])
+
+
+def test_duplicates_point_to_earliest_index():
+    texts = [
+        "如何用 Python 读取 CSV 文件？",
+        "什么是快速排序",
+        "如何用 python 读取 csv 文件",
+        "如何用 Python 读取 CSV 文件!!",
+    ]
+    representatives = MinHashDeduplicator(threshold=0.9).find_representatives(texts)
+
+    assert representatives == [0, 1, 0, 0]
+
+
+def test_distinct_texts_are_their_own_representatives():
+    texts = [window(0), window(200), window(300)]
+
+    assert MinHashDeduplicator(threshold=0.8).find_representatives(texts) == [0, 1, 2]
+
+
+def test_member_not_similar_to_representative_is_evaluated_itself():
+    # 第三条只与第二条相似，经并查集传递进第一条的簇，但与代表元的相似度低于阈值
+    dedup = MinHashDeduplicator(threshold=0.5)
+    texts = [window(0, 20), window(3, 20), window(10, 20)]
+    signatures = dedup.signatures(texts)
+    assert (signatures[0] == signatures[1]).mean() >= 0.5
+    assert (signatures[1] == signatures[2]).mean() >= 0.5
+    assert (signatures[0] == signatures[2]).mean() < 0.5
+
+    assert dedup.find_representatives(texts) == [0, 0, 2]
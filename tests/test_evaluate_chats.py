@@ -0,0 +1,23 @@
+"""
+质量评估器的参数校验测试（不调用 LLM）
+
+用法:
+    python -m pytest tests/test_evaluate_chats.py
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+from core.evaluate_chats import ADAPTIVE_MIN_SAMPLES, ChatQualityEvaluator
+
+
+def test_adaptive_budget_below_min_samples_is_rejected():
+    # 参数校验先于读取数据和初始化指标，不需要 API Key
+    evaluator = ChatQualityEvaluator.__new__(ChatQualityEvaluator)
+
+    with pytest.raises(ValueError, match="min_samples"):
+        evaluator.evaluate_adaptive(max_qa_pairs=ADAPTIVE_MIN_SAMPLES - 2)
+    with pytest.raises(ValueError, match="min_samples"):
+        evaluator.evaluate_adaptive(max_qa_pairs=10, min_samples=20)
@@ -0,0 +1,65 @@
+"""
+后台任务管理器的准入控制测试
+
+用法:
+    python -m pytest tests/test_jobs.py
+"""
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+from api.jobs import JobManager, JobQueueFull
+
+
+@pytest.fixture
+def release():
+    """任务函数等待该事件后结束，测试结束时放行所有任务"""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def blocking_job(job, event):
+    event.wait(5)
+
+
+def test_queue_limit_applies_when_jobs_wait_on_llm_call_cap(release):
+    # 第一个任务占满调用数上限后，其余任务即使有空闲工作线程也只能排队
+    manager = JobManager(max_workers=2, max_queued=2, max_llm_calls=10)
+    accepted, rejected = [], 0
+    for i in range(50):
+        try:
+            accepted.append(manager.submit('test', blocking_job, release, client=f'client-{i}', cost=10))
+        except JobQueueFull:
+            rejected += 1
+
+    assert len(accepted) == 3
+    assert manager.stats()['queue_depth'] == 2
+    assert manager.stats()['running_llm_calls'] == 10
+    assert rejected == 47
+    assert manager.rejected == 47
+    release.set()
+    manager.shutdown()
+
+
+def test_queue_limit_applies_when_jobs_wait_on_per_client_cap(release):
+    manager = JobManager(max_workers=4, max_queued=1, max_running_per_client=1)
+    manager.submit('test', blocking_job, release, client='a')
+    manager.submit('test', blocking_job, release, client='a')
+    with pytest.raises(JobQueueFull):
+        manager.submit('test', blocking_job, release, client='a')
+    release.set()
+    manager.shutdown()
+
+
+def test_zero_max_queued_still_accepts_jobs_that_start_immediately(release):
+    manager = JobManager(max_workers=1, max_queued=0)
+    manager.submit('test', blocking_job, release)
+    assert manager.stats()['queue_depth'] == 0
+    with pytest.raises(JobQueueFull):
+        manager.submit('test', blocking_job, release)
+    release.set()
+    manager.shutdown()
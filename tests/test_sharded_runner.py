@@ -0,0 +1,85 @@
+"""
+分片结果合并测试（不启动工作进程，直接构造分片结果文件）
+
+用法:
+    python -m pytest tests/test_sharded_runner.py
+"""
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+from core.sharded_runner import ShardedEvaluationRunner
+from core.summary_stats import MetricAggregator
+
+
+def qa_result(conversation_id: str, score: float, deduplicated_from=None):
+    result = {
+        'conversation_id': conversation_id,
+        'scores': {'relevancy': {
+            'score': score,
+            'passed': score >= 0.5,
+            'tier': 'dedup' if deduplicated_from is not None else 'llm',
+        }},
+    }
+    if deduplicated_from is not None:
+        result['deduplicated_from'] = deduplicated_from
+    return result
+
+
+def write_shard(path: Path, index: int, results, clusters: int):
+    aggregator = MetricAggregator()
+    for result in results:
+        aggregator.update(result)
+    path.write_text(json.dumps({
+        'total_qa_pairs': len(results),
+        'results': results,
+        'summary': {'dedup': {'threshold': 0.9, 'clusters': clusters, 'duplicates_skipped': len(results) - clusters}},
+        'shard': {
+            'index': index,
+            'conversation_ids': sorted({r['conversation_id'] for r in results}),
+            'metric_names': ['relevancy'],
+            'prescreen': False,
+            'aggregator': aggregator.to_dict(),
+        },
+    }, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+def test_merge_remaps_deduplicated_from_to_global_indices(tmp_path):
+    shard_a = write_shard(tmp_path / 'a.json', 0, [
+        qa_result('c1', 0.8),
+        qa_result('c3', 0.8, deduplicated_from=0),
+    ], clusters=1)
+    shard_b = write_shard(tmp_path / 'b.json', 1, [
+        qa_result('c2', 0.4),
+        qa_result('c4', 0.6),
+        qa_result('c4', 0.4, deduplicated_from=0),
+    ], clusters=2)
+
+    merged = ShardedEvaluationRunner.merge_shard_files([shard_a, shard_b], ['c1', 'c2', 'c3', 'c4'])
+
+    results = merged['results']
+    assert [r['conversation_id'] for r in results] == ['c1', 'c2', 'c3', 'c4', 'c4']
+    # 分片内下标 0 分别对应全局的 c1（下标 0）和 c2（下标 1）
+    assert results[2]['deduplicated_from'] == 0
+    assert results[4]['deduplicated_from'] == 1
+    for result in (results[2], results[4]):
+        representative = results[result['deduplicated_from']]
+        assert representative['scores']['relevancy']['score'] == result['scores']['relevancy']['score']
+    assert merged['total_qa_pairs'] == 5
+    assert merged['summary']['dedup'] == {'threshold': 0.9, 'clusters': 3, 'duplicates_skipped': 2}
+    assert merged['summary']['metrics']['relevancy']['tier_counts'] == {'llm': 3, 'dedup': 2}
+
+
+def test_merge_without_order_keeps_shard_order(tmp_path):
+    shard_a = write_shard(tmp_path / 'a.json', 0, [qa_result('c2', 0.7)], clusters=1)
+    shard_b = write_shard(tmp_path / 'b.json', 1, [
+        qa_result('c1', 0.3),
+        qa_result('c1', 0.3, deduplicated_from=0),
+    ], clusters=1)
+
+    merged = ShardedEvaluationRunner.merge_shard_files([shard_a, shard_b])
+
+    assert [r['conversation_id'] for r in merged['results']] == ['c2', 'c1', 'c1']
+    assert merged['results'][2]['deduplicated_from'] == 1
@@ -0,0 +1,82 @@
+"""
+在线汇总统计（RunningStats / QuantileSketch / MetricAggregator）的合并测试
+
+用法:
+    python -m pytest tests/test_summary_stats.py
+"""
+import random
+import statistics
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+from core.summary_stats import MetricAggregator, QuantileSketch, RunningStats
+
+
+def samples(seed: int, n: int):
+    rng = random.Random(seed)
+    return [rng.random() for _ in range(n)]
+
+
+def test_running_stats_merge_matches_single_pass():
+    a, b = samples(1, 300), samples(2, 700)
+    left, right, single = RunningStats(), RunningStats(), RunningStats()
+    for x in a:
+        left.update(x)
+    for x in b:
+        right.update(x)
+    for x in a + b:
+        single.update(x)
+
+    merged = left.merge(right)
+
+    assert merged.count == single.count == 1000
+    assert merged.mean == pytest.approx(statistics.mean(a + b))
+    assert merged.variance == pytest.approx(statistics.variance(a + b))
+    assert (merged.min, merged.max) == (single.min, single.max)
+    assert RunningStats().merge(single).to_dict() == single.to_dict()
+
+
+def test_quantile_sketch_merge_stays_within_rank_error():
+    a, b = samples(3, 5000), samples(4, 5000)
+    left, right = QuantileSketch(), QuantileSketch()
+    for x in a:
+        left.update(x)
+    for x in b:
+        right.update(x)
+
+    merged = QuantileSketch.from_dict(left.to_dict()).merge(right)
+    ordered = sorted(a + b)
+
+    assert merged.count == 10000
+    for q in (0.1, 0.5, 0.9, 0.99):
+        # 比较秩而不是取值：估计值在全部样本中的秩与 q 相差不超过 2%
+        rank = sum(1 for x in ordered if x <= merged.quantile(q)) / len(ordered)
+        assert rank == pytest.approx(q, abs=0.02)
+
+
+def qa_result(score: float, tier: str):
+    return {'scores': {'relevancy': {'score': score, 'passed': score >= 0.5, 'tier': tier}}}
+
+
+def test_metric_aggregator_merge_matches_single_pass():
+    scores = samples(5, 400)
+    left, right, single = MetricAggregator(), MetricAggregator(), MetricAggregator()
+    for i, score in enumerate(scores):
+        result = qa_result(score, 'local' if i % 3 == 0 else 'llm')
+        (left if i < 150 else right).update(result)
+        single.update(result)
+
+    merged = MetricAggregator.from_dict(left.to_dict()).merge(MetricAggregator.from_dict(right.to_dict()))
+    expected = single.summary()['metrics']['relevancy']
+    actual = merged.summary()['metrics']['relevancy']
+
+    assert merged.total == single.total == 400
+    for key in ('average_score', 'std_dev', 'ci_lower', 'ci_upper', 'min_score', 'max_score'):
+        assert actual[key] == pytest.approx(expected[key])
+    for key in ('passed_count', 'total_evaluated', 'tier_counts'):
+        assert actual[key] == expected[key]
+    for key in ('p50', 'p90'):
+        assert actual[key] == pytest.approx(expected[key], abs=0.05)
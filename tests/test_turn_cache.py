@@ -0,0 +1,68 @@
+"""
+回合结果缓存测试：LRU 淘汰、JSON Lines 重放与文件压缩
+
+用法:
+    python -m pytest tests/test_turn_cache.py
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+from core.turn_cache import TurnResultCache
+
+
+def line_count(cache_dir: Path) -> int:
+    return len((cache_dir / TurnResultCache.CACHE_FILE).read_text(encoding='utf-8').splitlines())
+
+
+def test_lru_evicts_least_recently_used():
+    cache = TurnResultCache(max_entries=2)
+    cache.set('a', {'v': 1})
+    cache.set('b', {'v': 2})
+    assert cache.get('a') == {'v': 1}
+    cache.set('c', {'v': 3})
+
+    assert cache.get('b') is None
+    assert cache.get('a') == {'v': 1}
+    assert cache.get('c') == {'v': 3}
+    assert cache.stats()['entries'] == 2
+
+
+def test_reload_replays_file_and_skips_truncated_line(tmp_path):
+    cache = TurnResultCache(cache_dir=str(tmp_path))
+    cache.set('a', {'v': 1})
+    cache.set('b', {'v': 2})
+    # 模拟进程中断时写了一半的最后一行
+    with open(tmp_path / TurnResultCache.CACHE_FILE, 'a', encoding='utf-8') as f:
+        f.write('{"key": "c", "val')
+
+    reloaded = TurnResultCache(cache_dir=str(tmp_path))
+
+    assert len(reloaded) == 2
+    assert reloaded.get('a') == {'v': 1}
+    assert reloaded.get('b') == {'v': 2}
+
+
+def test_compaction_bounds_file_and_keeps_entries(tmp_path):
+    cache = TurnResultCache(cache_dir=str(tmp_path), max_entries=3)
+    for i in range(8):
+        cache.set(f'k{i}', {'v': i})
+        assert line_count(tmp_path) <= 2 * cache.max_entries
+
+    reloaded = TurnResultCache(cache_dir=str(tmp_path), max_entries=3)
+
+    assert {key: reloaded.get(key) for key in ('k5', 'k6', 'k7')} == {f'k{i}': {'v': i} for i in (5, 6, 7)}
+    assert reloaded.get('k0') is None
+    assert line_count(tmp_path) == 3
+
+
+def test_load_compacts_file_written_with_larger_limit(tmp_path):
+    cache = TurnResultCache(cache_dir=str(tmp_path), max_entries=10)
+    for i in range(6):
+        cache.set(f'k{i}', {'v': i})
+
+    reloaded = TurnResultCache(cache_dir=str(tmp_path), max_entries=4)
+
+    assert line_count(tmp_path) == 4
+    assert len(reloaded) == 4
+    assert TurnResultCache(cache_dir=str(tmp_path), max_entries=4).get('k5') == {'v': 5}